@@ -0,0 +1,190 @@
+# This file is part of sequence-aligner.
+# Copyright (C) 2014 Christopher Kyle Horton <chorton@ltu.edu>
+
+# sequence-aligner is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# sequence-aligner is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with sequence-aligner. If not, see <http://www.gnu.org/licenses/>.
+
+# The aligner as a library, for programs which align many pairs in one
+# process:
+#
+#     from aligner import Aligner, align
+#     for alignment in align("CGCA", "CACGTAT", mode="global"):
+#         print(alignment.cigar(), list(alignment))
+#     aligner = Aligner("local", max_alignments=1)
+#     score, row, column = aligner.score("CGCA", "CACGTAT")
+#
+# Importing this module has no side effects, and only loads what aligning
+# needs: the output modules are left to the programs which use them.
+
+from __future__ import print_function
+
+from scoring_matrix import ScoringMatrix
+from scoring_algorithm import get_alignments, get_banded_alignments
+from scoring_algorithm import get_linear_space_alignment, get_optimal_score
+from scoring_algorithm import get_scheme
+from seed_extend import get_seeded_alignment
+from stats import timed
+
+MODES = ("semi-global", "global", "local")
+
+class Aligner:
+    '''Aligns pairs of sequences with a fixed set of options.
+
+    mode is "semi-global" (the default, with free terminal gaps), "global"
+    or "local". Scores come from the given ScoringScheme, or the default
+    scheme. At most max_alignments of the optimal alignments are found if
+    it is given. band, x_drop, linear_space and vectorized select the
+    algorithm as the options of the same names of sequence_aligner.py do,
+    and seed_length selects seed and extend with anchors of that length. A
+    full table is kept in files in scratch_dir, if given, rather than in
+    memory, and filled by jobs processes in tiles of tile_size cells square
+    if jobs is given. Raises ValueError for options which can't be
+    combined.'''
+    def __init__(self, mode="semi-global", scheme=None, max_alignments=None,
+                 band=None, x_drop=None, linear_space=False,
+                 vectorized=False, seed_length=None, scratch_dir=None,
+                 jobs=None, tile_size=None):
+        if mode not in MODES:
+            raise ValueError("unknown alignment mode: {0}".format(mode))
+        scheme = get_scheme(scheme)
+        if linear_space and scheme.is_affine():
+            raise ValueError("linear-space alignment needs linear gap scores")
+        if mode == "local" and band is not None:
+            raise ValueError("local alignments can't be banded")
+        if x_drop is not None and (mode != "local" or linear_space):
+            raise ValueError("x_drop only applies to local alignments with "
+                             "a full table")
+        if seed_length is not None:
+            if mode == "local" or band is not None or linear_space:
+                raise ValueError("seed and extend only applies to global and "
+                                 "semi-global alignments with a full table")
+            if scheme.is_affine():
+                raise ValueError("seed and extend needs linear gap scores")
+        if jobs is not None and (mode == "local" or band is not None or
+                                 linear_space or vectorized or
+                                 scratch_dir is not None):
+            raise ValueError("parallel fills only apply to global and "
+                             "semi-global alignments with a full table in "
+                             "memory")
+        self.mode = mode
+        self.alignment_is_global = mode == "global"
+        self.alignment_is_local = mode == "local"
+        self.scheme = scheme
+        self.max_alignments = max_alignments
+        self.band = band
+        self.x_drop = x_drop
+        self.linear_space = linear_space
+        self.vectorized = vectorized
+        self.seed_length = seed_length
+        self.scratch_dir = scratch_dir
+        self.jobs = jobs
+        self.tile_size = tile_size
+
+    def parameters(self):
+        '''Returns the options which affect the alignments found, as the
+        result cache is keyed by.'''
+        from cache import alignment_parameters
+        return alignment_parameters(self.alignment_is_global,
+                                    self.alignment_is_local, self.scheme,
+                                    self.max_alignments, self.x_drop,
+                                    self.band, self.linear_space,
+                                    self.seed_length)
+
+    def score(self, sequence1, sequence2):
+        '''Returns a tuple (score, row, column) of the optimal score of
+        sequence1 (the left sequence) and sequence2 (the top sequence) and
+        the cell where the alignment ends, without any traceback.'''
+        return get_optimal_score(sequence1, sequence2,
+                                 self.alignment_is_global, self.scheme,
+                                 self.alignment_is_local)
+
+    def align_matrix(self, sequence1, sequence2, stats=None):
+        '''Returns a tuple (sm, alignments) of the filled and pruned
+        ScoringMatrix for sequence1 (the left sequence) and sequence2 (the
+        top sequence), and a list of optimal Alignment objects. sm is None
+        in linear-space and seed-and-extend modes, which find a single
+        alignment; seed and extend falls back to the full table if it finds
+        no anchors. The phases are recorded in stats, if given.
+
+        A table kept in scratch_dir holds its files open until it is closed,
+        so close sm, or use it in a with statement, once done with it.'''
+        if self.seed_length is not None:
+            seeded = get_seeded_alignment(sequence1, sequence2,
+                                          self.seed_length,
+                                          self.alignment_is_global,
+                                          self.scheme, stats)
+            if seeded is not None:
+                return (None, [seeded[0]])
+        if self.linear_space:
+            with timed(stats, "linear_space"):
+                alignment = get_linear_space_alignment(
+                    sequence1, sequence2, self.alignment_is_global,
+                    self.scheme, self.alignment_is_local)
+            return (None, [alignment])
+        if self.band is not None:
+            return get_banded_alignments(sequence1, sequence2, self.band,
+                                         self.alignment_is_global,
+                                         self.max_alignments, self.scheme,
+                                         stats)
+        with timed(stats, "allocate"):
+            sm = ScoringMatrix(sequence1, sequence2, self.scratch_dir)
+        alignments = get_alignments(sm, self.alignment_is_global,
+                                    self.vectorized, self.max_alignments,
+                                    self.scheme, self.alignment_is_local,
+                                    self.x_drop, stats, self.jobs,
+                                    self.tile_size)
+        return (sm, alignments)
+
+    def align(self, sequence1, sequence2):
+        '''Returns a list of optimal Alignment objects of sequence1 (the left
+        sequence) and sequence2 (the top sequence). The table is closed
+        before returning.'''
+        sm, alignments = self.align_matrix(sequence1, sequence2)
+        if sm is not None:
+            sm.close()
+        return alignments
+
+def align(sequence1, sequence2, mode="semi-global", **options):
+    '''Returns a list of optimal Alignment objects of sequence1 (the left
+    sequence) and sequence2 (the top sequence), passing mode and any other
+    keyword arguments to Aligner.'''
+    return Aligner(mode, **options).align(sequence1, sequence2)
+
+if __name__ == "__main__":
+    # Unit testing
+    alignments = align("CGCA", "CACGTAT")
+    assert [list(alignment) for alignment in alignments] == \
+           [["CACGTAT", "__CGCA_"]]
+    assert alignments[0].get_score() == 3
+    aligner = Aligner("global", max_alignments=1)
+    assert aligner.align("CGCA", "CACGTAT")[0].get_score() == 0
+    assert aligner.score("CGCA", "CACGTAT") == (0, 4, 7)
+    linear = Aligner("local", linear_space=True)
+    assert linear.align("CGCA", "CACGTAT")[0].cigar() == "2M1X1M"
+    seeded = Aligner(seed_length=3)
+    assert seeded.align("CGCA", "CACGTAT")[0].get_score() == 3
+    assert seeded.align("CGCA", "TTTTTTT")[0].get_score() == \
+           align("CGCA", "TTTTTTT")[0].get_score()
+    import tempfile
+    scratch = Aligner(scratch_dir=tempfile.gettempdir())
+    with scratch.align_matrix("CGCA", "CACGTAT")[0] as sm:
+        assert sm.get_score(4, 7) == 3
+    assert sm.scores.file.closed
+    assert scratch.align("CGCA", "CACGTAT") == alignments
+    try:
+        Aligner("local", band=2)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("a banded local aligner was accepted")
+    print("All aligner tests passed.")
@@ -0,0 +1,163 @@
+# This file is part of sequence-aligner.
+# Copyright (C) 2014 Christopher Kyle Horton <chorton@ltu.edu>
+
+# sequence-aligner is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# sequence-aligner is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with sequence-aligner. If not, see <http://www.gnu.org/licenses/>.
+
+# Alignments stored as runs of CIGAR-style operations.
+#
+# The top sequence plays the part of the reference: M and X consume a
+# character of both sequences (a match or a mismatch), I a character of the
+# left sequence only (an up move in the table) and D a character of the top
+# sequence only (a left move). The gapped strings shown to the user are only
+# built when an alignment is printed or iterated over.
+
+from __future__ import print_function
+
+import re
+
+from encoded_sequence import decode
+
+GAP = ord("_")
+CIGAR_RUN = re.compile(r"(\d+)([MXID])")
+
+# The operation for each traceback move other than a diagonal one, which is
+# M or X depending on the characters.
+MOVE_OPS = {"U": "I", "L": "D"}
+
+class Alignment:
+    '''An alignment of the left and top sequences of a table: the cell
+    (row, column) where it starts and ends, its score, and a tuple of
+    (length, operation) runs.
+
+    Alignments never change once made. Iterating over one yields the gapped
+    top and left strings, the form get_alignments used to return.'''
+    def __init__(self, left_codes, top_codes, start, ops, score=None):
+        '''Makes an alignment starting at the given (row, column) cell, given
+        the codes of the left and top sequences, which are shared rather than
+        copied.'''
+        row, column = start
+        for length, op in ops:
+            if op != "D":
+                row += length
+            if op != "I":
+                column += length
+        self.__dict__.update(left_codes=left_codes, top_codes=top_codes,
+                             start=tuple(start), end=(row, column),
+                             ops=tuple(ops), score=score)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("alignments cannot be modified")
+
+    def __repr__(self):
+        return "Alignment(start={0!r}, end={1!r}, score={2!r}, " \
+               "cigar={3!r})".format(self.start, self.end, self.score,
+                                     self.cigar())
+
+    def __eq__(self, other):
+        return isinstance(other, Alignment) and \
+               (self.start, self.ops, self.score) == \
+               (other.start, other.ops, other.score)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __iter__(self):
+        return iter(self.strings())
+
+    def get_start(self):
+        '''Returns the (row, column) cell where the alignment starts.'''
+        return self.start
+
+    def get_end(self):
+        '''Returns the (row, column) cell where the alignment ends.'''
+        return self.end
+
+    def get_score(self):
+        '''Returns the score of the alignment, or None if it is not known.'''
+        return self.score
+
+    def get_ops(self):
+        '''Returns the tuple of (length, operation) runs.'''
+        return self.ops
+
+    def cigar(self):
+        '''Returns the operations as a CIGAR string such as "3M1X2I".'''
+        return "".join(["{0!s}{1}".format(length, op)
+                        for length, op in self.ops])
+
+    def strings(self):
+        '''Returns the [top, left] pair of gapped strings.'''
+        top, left = bytearray(), bytearray()
+        row, column = self.start
+        for length, op in self.ops:
+            if op == "I":
+                top.extend(bytearray([GAP]) * length)
+            else:
+                top.extend(self.top_codes[column:column + length])
+                column += length
+            if op == "D":
+                left.extend(bytearray([GAP]) * length)
+            else:
+                left.extend(self.left_codes[row:row + length])
+                row += length
+        return [decode(top), decode(left)]
+
+def from_moves(left_codes, top_codes, moves, row=0, column=0, score=None):
+    '''Returns the Alignment for a path through the table which starts at
+    the given row and column and follows the given traceback moves, each "D"
+    (diagonal), "U" (up) or "L" (left), in order from the start.'''
+    start = (row, column)
+    ops = []
+    for move in moves:
+        if move == "D":
+            op = "M" if left_codes[row] == top_codes[column] else "X"
+            row += 1
+            column += 1
+        else:
+            op = MOVE_OPS[move]
+            if move == "U":
+                row += 1
+            else:
+                column += 1
+        if ops and ops[-1][1] == op:
+            ops[-1][0] += 1
+        else:
+            ops.append([1, op])
+    return Alignment(left_codes, top_codes, start,
+                     [(length, op) for length, op in ops], score)
+
+def from_cigar(left_codes, top_codes, start, cigar, score=None):
+    '''Returns the Alignment starting at the given (row, column) cell whose
+    operations are given by a CIGAR string, as returned by
+    Alignment.cigar.'''
+    ops = [(int(length), op) for length, op in CIGAR_RUN.findall(cigar)]
+    return Alignment(left_codes, top_codes, start, ops, score)
+
+if __name__ == "__main__":
+    # Unit testing
+    from encoded_sequence import encode_text
+    left, top = encode_text("CGCA"), encode_text("CACGTAT")
+    alignment = from_moves(left, top, "LLDDDDL", score=3)
+    print(alignment)
+    print(list(alignment))
+    assert alignment.cigar() == "2D2M1X1M1D"
+    assert alignment.get_end() == (4, 7)
+    assert list(alignment) == ["CACGTAT", "__CGCA_"]
+    assert from_cigar(left, top, (0, 0), alignment.cigar(), 3) == alignment
+    try:
+        alignment.score = 0
+    except AttributeError:
+        pass
+    else:
+        raise AssertionError("alignment was modified")
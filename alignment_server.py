@@ -0,0 +1,481 @@
+# This file is part of sequence-aligner.
+# Copyright (C) 2014 Christopher Kyle Horton <chorton@ltu.edu>
+
+# sequence-aligner is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# sequence-aligner is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with sequence-aligner. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from Queue import Queue, Empty
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from queue import Queue, Empty
+
+from aligner import Aligner
+from scoring_scheme import add_scheme_arguments, scheme_from_arguments
+
+desc = """Serves alignments over HTTP on localhost from a pool of worker
+processes which stay running between requests.
+
+POST a JSON object, or a list of them, to /align. Each object needs the two
+sequences, as "sequence1" and "sequence2", and may set:
+
+  "id"             any value, echoed back in the result
+  "mode"           "semi-global" (the default), "global" or "local"
+  "max_alignments" the number of optimal alignments returned (default: 1)
+  "band", "x_drop", "linear_space", "vectorized"
+                   as the options of the same names of sequence_aligner.py
+  "seed_length"    align by seed and extend, as --seed of sequence_aligner.py
+  "score_only"     only return the score and the cell the alignment ends in
+  "match", "mismatch", "gap", "terminal_gap", "gap_open", "transition",
+  "matrix"         the scores, as the scoring options of sequence_aligner.py
+  "html"           a file name to write the HTML5 output to, in the
+                   directory given by --html-dir
+  "corridor"       only include the cells around the alignments in it
+
+The response holds one result object for each request object, with either
+an "error" message or the "score" and the "alignments", each with its
+"start" and "end" cells, "cigar" string and aligned "top" and "left"
+strings. Requests arriving together are handed to the workers in batches.
+A request which fails in its worker, or takes longer than --timeout seconds,
+gets an error. GET /health reports whether the server is up."""
+
+DEFAULT_PORT = 8765
+
+# Seconds a request may wait for its result before it is answered with an
+# error, so a worker which dies doesn't leave its requests waiting forever.
+DEFAULT_TIMEOUT = 300
+
+# The request fields which make up the scoring scheme.
+SCHEME_FIELDS = ["match", "mismatch", "gap", "terminal_gap", "gap_open",
+                 "transition", "matrix"]
+
+# The scoring schemes used so far by this worker process, by their fields,
+# so their tables are only built once.
+schemes = {}
+
+# The directory this worker process writes requested HTML files to, or None
+# if it writes none.
+html_dir = None
+
+def init_worker(directory=None):
+    '''Pool initializer which sets the worker's html_dir, and leaves
+    stopping the workers to the server, so Ctrl-C doesn't leave a traceback
+    from every one of them.'''
+    global html_dir
+    html_dir = directory
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def html_path(name):
+    '''Returns the path to write the HTML file requested as name to, within
+    html_dir. Raises ValueError if no html_dir is set or name is not a plain
+    file name, so that clients can't write files anywhere else.'''
+    if html_dir is None:
+        raise ValueError("the server was started without --html-dir")
+    if (not isinstance(name, type(u"")) or name in ("", ".", "..") or
+            os.path.basename(name) != name or
+            (os.altsep is not None and os.altsep in name)):
+        raise ValueError("html must be a file name without a directory")
+    return os.path.join(html_dir, name)
+
+def request_scheme(request):
+    '''Returns the ScoringScheme for the scoring fields of request. Raises
+    IOError or ValueError if its substitution matrix can't be read.'''
+    key = json.dumps([request.get(name) for name in SCHEME_FIELDS])
+    if key not in schemes:
+        parser = argparse.ArgumentParser()
+        add_scheme_arguments(parser)
+        args = parser.parse_args([])
+        for name in SCHEME_FIELDS:
+            if request.get(name) is not None:
+                setattr(args, name, request[name])
+        schemes[key] = scheme_from_arguments(args)
+    return schemes[key]
+
+def align_request(request):
+    '''Aligns the sequences of one request object and returns its result
+    object. Raises IOError or ValueError if the request can't be carried
+    out.'''
+    result = {"id": request.get("id")}
+    # Ensure sequence1 is always the shorter one, like sequence_aligner.py.
+    sequence1 = str(request["sequence1"]).upper()
+    sequence2 = str(request["sequence2"]).upper()
+    if len(sequence1) > len(sequence2):
+        sequence1, sequence2 = sequence2, sequence1
+    aligner = Aligner(request.get("mode", "semi-global"),
+                      request_scheme(request),
+                      request.get("max_alignments", 1), request.get("band"),
+                      request.get("x_drop"),
+                      request.get("linear_space", False),
+                      request.get("vectorized", False),
+                      request.get("seed_length"))
+    if request.get("score_only"):
+        score, row, column = aligner.score(sequence1, sequence2)
+        result.update({"score": score, "end": [row, column]})
+        return result
+    sm, alignments = aligner.align_matrix(sequence1, sequence2)
+    try:
+        result["score"] = alignments[0].get_score()
+        result["alignments"] = []
+        for alignment in alignments:
+            top, left = alignment.strings()
+            result["alignments"].append({"start": list(alignment.get_start()),
+                                         "end": list(alignment.get_end()),
+                                         "cigar": alignment.cigar(),
+                                         "top": top, "left": left})
+        if sm is not None:
+            from scoring_algorithm import count_alignments
+            result["total"] = count_alignments(sm)
+        if request.get("html"):
+            from html_output import write_html
+            result["html"] = write_html(sm, alignments,
+                                        aligner.alignment_is_global,
+                                        aligner.alignment_is_local,
+                                        request.get("corridor", False),
+                                        html_path(request["html"]))
+    finally:
+        if sm is not None:
+            sm.close()
+    return result
+
+def align_batch(requests):
+    '''Returns the list of results of a batch of request objects, run in a
+    worker process.'''
+    results = []
+    for request in requests:
+        try:
+            results.append(align_request(request))
+        except Exception as e:
+            # One bad request mustn't fail the others in its batch.
+            results.append({"id": request.get("id"), "error": str(e)})
+    return results
+
+def run_batch(requests):
+    '''Runs align_batch in a worker process, and returns a tuple (error,
+    results) where error is None, or the message of an exception which
+    failed the whole batch, so that it reaches the server through the
+    batch's result even on Python 2, whose pools have no error callback.'''
+    try:
+        return (None, align_batch(requests))
+    except BaseException as e:
+        return ("{0}: {1!s}".format(type(e).__name__, e), None)
+
+def check_request(request):
+    '''Returns an error message if request is not an object with both
+    sequences, else None.'''
+    if not isinstance(request, dict):
+        return "each request must be a JSON object"
+    for name in ("sequence1", "sequence2"):
+        if not isinstance(request.get(name), type(u"")):
+            return "missing or invalid " + name
+    max_alignments = request.get("max_alignments", 1)
+    if (isinstance(max_alignments, bool) or
+            not isinstance(max_alignments, int) or max_alignments < 1):
+        return "max_alignments must be a positive integer"
+    return None
+
+class PendingResult:
+    '''The result of one request, once a worker has produced it.'''
+    def __init__(self, request):
+        self.id = request.get("id")
+        self.done = threading.Event()
+        self.result = None
+
+    def set(self, result):
+        self.result = result
+        self.done.set()
+
+    def fail(self, message):
+        '''Sets an error result, unless a result has already arrived.'''
+        if not self.done.is_set():
+            self.set({"id": self.id, "error": message})
+
+    def get(self, timeout=None):
+        '''Waits at most timeout seconds for the result, and returns it, or
+        None if it hasn't arrived.'''
+        self.done.wait(timeout)
+        return self.result
+
+class BatchingPool:
+    '''A pool of worker processes which aligns requests in batches.
+
+    Requests submitted from any thread wait in a queue. A dispatcher thread
+    takes up to batch_size of them at a time, waiting at most batch_delay
+    seconds for a batch to fill once its first request arrives, and hands
+    each batch to a single worker, so many small requests cost one round
+    trip to a worker rather than one each.
+
+    A request whose result hasn't arrived within timeout seconds, because it
+    is too slow or its worker died, is answered with an error. The workers
+    write requested HTML files to html_dir, and refuse to if it is None.'''
+    def __init__(self, processes=None, batch_size=32, batch_delay=0.002,
+                 timeout=DEFAULT_TIMEOUT, html_dir=None):
+        self.pool = multiprocessing.Pool(processes, init_worker, (html_dir,))
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.timeout = timeout
+        self.queue = Queue()
+        self.dispatcher = threading.Thread(target=self.dispatch)
+        self.dispatcher.daemon = True
+        self.dispatcher.start()
+
+    def submit(self, requests):
+        '''Queues a list of request objects and returns the list of their
+        PendingResult objects.'''
+        pending = []
+        for request in requests:
+            result = PendingResult(request)
+            self.queue.put((request, result))
+            pending.append(result)
+        return pending
+
+    def align(self, requests):
+        '''Returns the list of results of a list of request objects, waiting
+        for them all.'''
+        pending = self.submit(requests)
+        deadline = time.time() + self.timeout
+        for result in pending:
+            if result.get(max(0, deadline - time.time())) is None:
+                result.fail("timed out after {0!s} seconds".format(
+                    self.timeout))
+        return [result.result for result in pending]
+
+    def next_batch(self):
+        '''Waits for and returns the next batch of (request, PendingResult)
+        tuples.'''
+        batch = [self.queue.get()]
+        deadline = time.time() + self.batch_delay
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get(timeout=max(0, deadline -
+                                                           time.time())))
+            except Empty:
+                break
+        return batch
+
+    def dispatch(self):
+        '''Hands batches to the workers for as long as the pool is open.'''
+        while True:
+            batch = self.next_batch()
+            requests = [request for request, result in batch]
+            pending = [result for request, result in batch]
+            deliver, fail = self.make_callbacks(pending)
+            options = {"callback": deliver}
+            if sys.version_info[0] >= 3:
+                # Python 2 pools can't report a batch which failed.
+                options["error_callback"] = fail
+            try:
+                self.pool.apply_async(run_batch, (requests,), **options)
+            except Exception as e:
+                fail(e)
+
+    def make_callbacks(self, pending):
+        '''Returns a tuple of the callback which delivers the outcome of
+        run_batch for a batch, and the callback which answers every request
+        of the batch with an error.'''
+        def deliver(outcome):
+            error, results = outcome
+            if error is not None:
+                fail(error)
+                return
+            for result, value in zip(pending, results):
+                result.set(value)
+        def fail(error):
+            for result in pending:
+                result.fail("alignment failed: {0!s}".format(error))
+        return (deliver, fail)
+
+    def close(self):
+        '''Stops the worker processes.'''
+        self.pool.terminate()
+        self.pool.join()
+
+class AlignmentHandler(BaseHTTPRequestHandler):
+    '''Answers alignment requests, passing them to the server's pool.'''
+    def send_json(self, status, value):
+        body = json.dumps(value).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok"})
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/align":
+            self.send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length).decode("utf-8"))
+        except ValueError:
+            self.send_json(400, {"error": "invalid JSON"})
+            return
+        requests = body if isinstance(body, list) else [body]
+        for request in requests:
+            error = check_request(request)
+            if error is not None:
+                self.send_json(400, {"error": error})
+                return
+        results = self.server.pool.align(requests)
+        self.send_json(200, results if isinstance(body, list) else results[0])
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+class AlignmentServer(ThreadingMixIn, HTTPServer):
+    '''An HTTP server which answers each connection in its own thread, all
+    sharing one BatchingPool.'''
+    daemon_threads = True
+
+    def __init__(self, address, pool, verbose=False):
+        HTTPServer.__init__(self, address, AlignmentHandler)
+        self.pool = pool
+        self.verbose = verbose
+
+def self_test():
+    '''Unit testing, run by --self-test.'''
+    good = {"id": 1, "sequence1": u"CGCA", "sequence2": u"CACGTAT",
+            "max_alignments": 2}
+    bad = {"id": 2, "sequence1": u"CGCA", "sequence2": u"CACGTAT",
+           "mode": "sideways"}
+    assert check_request(good) is None and check_request(bad) is None
+    assert check_request(dict(good, max_alignments=0)) is not None
+    assert check_request(dict(good, max_alignments=True)) is not None
+    assert check_request({"sequence1": u"CGCA"}) is not None
+    results = align_batch([good, bad])
+    assert results[0]["score"] == 3
+    assert results[0]["alignments"][0]["top"] == "CACGTAT"
+    assert results[0]["alignments"][0]["left"] == "__CGCA_"
+    assert results[1] == {"id": 2, "error": "unknown alignment mode: sideways"}
+    # HTML files are only written as plain file names in html_dir.
+    import shutil
+    import tempfile
+    directory = tempfile.mkdtemp()
+    try:
+        for name in (u"out.html", u"../out.html", u"/tmp/out.html", u".."):
+            result = align_batch([dict(good, html=name)])[0]
+            assert "--html-dir" in result["error"]
+        init_worker(directory)
+        result = align_batch([dict(good, html=u"out.html")])[0]
+        assert result["html"] == os.path.join(directory, "out.html")
+        assert os.path.isfile(result["html"])
+        for name in (u"../out.html", u"/tmp/out.html", u".."):
+            result = align_batch([dict(good, html=name)])[0]
+            assert "without a directory" in result["error"]
+    finally:
+        init_worker(None)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        shutil.rmtree(directory)
+    # A batch which fails as a whole comes back as an error.
+    error, batch_results = run_batch(None)
+    assert batch_results is None and error.startswith("TypeError")
+    pool = BatchingPool(2, batch_delay=0.01)
+    try:
+        assert pool.align([good, bad]) == results
+        # Its requests get the error as soon as it fails, rather than when
+        # they time out.
+        pending = PendingResult(good)
+        pool.queue.put((None, pending))
+        result = pending.get(10)
+        assert result["id"] == 1 and "failed" in result["error"]
+        # A request which can't be answered in time gets an error.
+        pool.timeout = 0
+        result = pool.align([good])[0]
+        assert result["id"] == 1 and "timed out" in result["error"]
+    finally:
+        pool.close()
+    # Requests handed to a pool which has stopped get an error too.
+    pool.timeout = 10
+    result = pool.align([good])[0]
+    assert result["id"] == 1 and "failed" in result["error"]
+    print("All alignment server tests passed.")
+
+def main():
+    parser = argparse.ArgumentParser(
+                formatter_class=argparse.RawDescriptionHelpFormatter,
+                description=desc
+                )
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Address to listen on (default: %(default)s).")
+    parser.add_argument("-p", "--port", type=int, default=DEFAULT_PORT,
+                        help="Port to listen on (default: %(default)s).")
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="Number of worker processes (default: one per "
+                             "CPU).")
+    parser.add_argument("--batch-size", type=int, default=32,
+                        help="Most requests handed to a worker at a time "
+                             "(default: %(default)s).")
+    parser.add_argument("--batch-delay", type=float, default=0.002,
+                        help="Seconds to wait for a batch to fill "
+                             "(default: %(default)s).")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help="Seconds after which a request which hasn't "
+                             "been aligned gets an error (default: "
+                             "%(default)s).")
+    parser.add_argument("--html-dir", metavar="DIR",
+                        help="Directory to write the HTML files requests "
+                             "ask for to; without it, requests for HTML "
+                             "output get an error.")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="Log every request to standard error.")
+    parser.add_argument("--self-test", action="store_true",
+                        help="Run the unit tests and exit.")
+    args = parser.parse_args()
+    if args.self_test:
+        self_test()
+        return
+    if args.html_dir is not None and not os.path.isdir(args.html_dir):
+        print("Error: HTML directory does not exist:", args.html_dir)
+        exit(1)
+    pool = BatchingPool(args.jobs, args.batch_size, args.batch_delay,
+                        args.timeout, args.html_dir)
+    try:
+        server = AlignmentServer((args.host, args.port), pool, args.verbose)
+    except EnvironmentError as e:
+        pool.close()
+        print("Error: could not listen on {0}:{1!s}".format(args.host,
+                                                            args.port))
+        print(e)
+        exit(1)
+    print("Serving alignments on http://{0}:{1!s}/".format(
+        *server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.close()
+
+if __name__ == "__main__":
+    main()
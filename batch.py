@@ -0,0 +1,209 @@
+# This file is part of sequence-aligner.
+# Copyright (C) 2014 Christopher Kyle Horton <chorton@ltu.edu>
+
+# sequence-aligner is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# sequence-aligner is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with sequence-aligner. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import sys
+
+from cache import alignment_parameters, default_cache_dir, open_cache
+from fasta import read_fasta, read_fasta_records, record_name
+from scoring_matrix import ScoringMatrix
+from scoring_algorithm import get_alignments, get_linear_space_alignment
+from scoring_algorithm import get_optimal_score
+from scoring_scheme import add_scheme_arguments, scheme_from_arguments
+
+desc = """Aligns every query in a multi-FASTA file against every record of a
+database multi-FASTA file, or every pair of records in one file, across a
+pool of worker processes.
+
+Each result is written to standard output as soon as it is ready, as one
+tab-separated line: query name, target name, score, and then either the
+positions in the query and in the target where the alignment ends
+(--score-only) or the aligned query and the aligned target, in that order."""
+
+# Alignment options, set in each worker process by set_options.
+options = {}
+
+def set_options(alignment_options):
+    '''Pool initializer which stores the alignment options for align_pair,
+    and opens the result cache in each worker.'''
+    options.update(alignment_options)
+    if options.get("cache_dir") is not None:
+        options["cache"] = open_cache(options["cache_dir"])
+
+def align_pair(task):
+    '''Aligns one (query name, query, target name, target) task and returns
+    its tab-separated result line.'''
+    query_name, query, target_name, target = task
+    alignment_is_global = options.get("alignment_is_global", False)
+    alignment_is_local = options.get("alignment_is_local", False)
+    scheme = options.get("scheme")
+    # Ensure sequence1 is always the shorter one, like sequence_aligner.py.
+    # The results are swapped back so the query always comes first.
+    sequence1, sequence2 = query, target
+    swapped = len(sequence1) > len(sequence2)
+    if swapped:
+        sequence1, sequence2 = sequence2, sequence1
+    if options.get("score_only"):
+        score, row, column = get_optimal_score(sequence1, sequence2,
+                                               alignment_is_global, scheme,
+                                               alignment_is_local)
+        # Rows follow sequence1 and columns sequence2.
+        fields = [score] + ([column, row] if swapped else [row, column])
+    else:
+        cache = options.get("cache")
+        parameters = alignment_parameters(alignment_is_global,
+                                          alignment_is_local, scheme, 1,
+                                          options.get("x_drop"),
+                                          linear_space=options.get(
+                                              "linear_space", False))
+        cached = None
+        if cache is not None:
+            cached = cache.get(sequence1, sequence2, parameters)
+        if cached is not None:
+            alignment = cached[0][0]
+        elif options.get("linear_space"):
+            alignment = get_linear_space_alignment(sequence1, sequence2,
+                                                   alignment_is_global, scheme,
+                                                   alignment_is_local)
+        else:
+            sm = ScoringMatrix(sequence1, sequence2)
+            alignment = get_alignments(sm, alignment_is_global,
+                                       options.get("vectorized", False), 1,
+                                       scheme, alignment_is_local,
+                                       options.get("x_drop"))[0]
+        if cache is not None and cached is None:
+            cache.put(sequence1, sequence2, parameters, [alignment])
+        # The top string is aligned sequence2 and the left sequence1.
+        top, left = list(alignment)
+        fields = [alignment.get_score()] + ([top, left] if swapped else
+                                            [left, top])
+    return "\t".join([query_name, target_name] + [str(x) for x in fields])
+
+def iter_query_tasks(queries, targets):
+    '''Yields a task for every pair of a query record and a target record.'''
+    for query_header, query in queries:
+        for target_header, target in targets:
+            yield (record_name(query_header), query,
+                   record_name(target_header), target)
+
+def iter_all_vs_all_tasks(records):
+    '''Yields a task for every unordered pair of distinct records.'''
+    for i in range(len(records)):
+        query_header, query = records[i]
+        for target_header, target in records[i + 1:]:
+            yield (record_name(query_header), query,
+                   record_name(target_header), target)
+
+def run_batch(tasks, alignment_options, processes=None, chunk_size=16,
+              outfile=sys.stdout):
+    '''Aligns every task across a pool of processes, writing each result line
+    to outfile as soon as it arrives. Results are not in task order.
+
+    Tasks are handed to the workers chunk_size at a time to keep the
+    dispatch overhead low.'''
+    pool = multiprocessing.Pool(processes, set_options, (alignment_options,))
+    try:
+        for line in pool.imap_unordered(align_pair, tasks, chunk_size):
+            outfile.write(line + "\n")
+            outfile.flush()
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+def main():
+    parser = argparse.ArgumentParser(
+                formatter_class=argparse.RawDescriptionHelpFormatter,
+                description=desc
+                )
+    parser.add_argument("queries", help="Multi-FASTA file of query sequences.")
+    parser.add_argument("database", nargs="?",
+                        help="Multi-FASTA file of target sequences. If "
+                             "omitted, all query pairs are aligned instead.")
+    parser.add_argument("-g", "--global-align", action="store_true",
+                        help="Perform global alignments instead.")
+    parser.add_argument("-L", "--local-align", action="store_true",
+                        help="Perform local (Smith-Waterman) alignments "
+                             "instead.")
+    parser.add_argument("-x", "--x-drop", type=int, metavar="X",
+                        help="In local alignments, stop extending paths "
+                             "whose score falls more than X below the best "
+                             "so far.")
+    parser.add_argument("-s", "--score-only", action="store_true",
+                        help="Only output scores and end coordinates.")
+    parser.add_argument("-l", "--linear-space", action="store_true",
+                        help="Find each alignment in linear memory.")
+    parser.add_argument("--vectorized", action="store_true",
+                        help="Fill each table a row at a time with NumPy.")
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="Number of worker processes (default: one per "
+                             "CPU).")
+    parser.add_argument("--chunk-size", type=int, default=16,
+                        help="Number of pairs sent to a worker at a time.")
+    parser.add_argument("--cache-dir", metavar="DIR",
+                        default=default_cache_dir(),
+                        help="Directory in which alignments are cached "
+                             "(default: %(default)s).")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Neither look up nor store alignments in the "
+                             "cache.")
+    add_scheme_arguments(parser)
+    args = parser.parse_args()
+    try:
+        scheme = scheme_from_arguments(args)
+    except (IOError, ValueError) as e:
+        print("Error: could not read substitution matrix:", args.matrix)
+        print(e)
+        exit(1)
+    if args.linear_space and scheme.is_affine():
+        print("Error: --linear-space does not support --gap-open.")
+        exit(1)
+    if args.local_align and args.global_align:
+        print("Error: --local-align can't be combined with -g.")
+        exit(1)
+    if args.x_drop is not None and (not args.local_align or args.score_only or
+                                    args.linear_space):
+        print("Error: --x-drop only applies to --local-align with full tables.")
+        exit(1)
+    # Each worker receives its own copy of the scheme, whose tables are then
+    # reused for every pair that worker aligns.
+    alignment_options = {"alignment_is_global": args.global_align,
+                         "alignment_is_local": args.local_align,
+                         "x_drop": args.x_drop,
+                         "score_only": args.score_only,
+                         "linear_space": args.linear_space,
+                         "vectorized": args.vectorized,
+                         "scheme": scheme,
+                         "cache_dir": None if args.no_cache else
+                                      args.cache_dir}
+    try:
+        if args.database is None:
+            tasks = iter_all_vs_all_tasks(read_fasta_records(args.queries))
+        else:
+            targets = read_fasta_records(args.database)
+            tasks = iter_query_tasks(read_fasta(args.queries), targets)
+    except IOError as e:
+        print("Error: could not open file:", e.filename)
+        exit(1)
+    run_batch(tasks, alignment_options, args.jobs, args.chunk_size)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+# This file is part of sequence-aligner.
+# Copyright (C) 2014 Christopher Kyle Horton <chorton@ltu.edu>
+
+# sequence-aligner is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# sequence-aligner is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with sequence-aligner. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+
+import argparse
+from itertools import islice
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from html_output import write_html
+from parallel_fill import fill_matrix_parallel
+from scoring_matrix import ScoringMatrix
+from scoring_algorithm import fill_matrix, prune_backlinks, iter_alignments
+from stats import peak_memory_kb
+from terminal_output import format_matrix
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2 can't trace allocations, so stages have no peak memory.
+    tracemalloc = None
+
+desc = """Times each stage of aligning synthetic sequence pairs over a range of
+sizes and tie densities, and optionally compares the results with a baseline
+saved by an earlier run.
+
+Each case runs in a fresh process, so its peak memory is its own. The
+second sequence of each pair is a mutated copy of the first. Only the
+fastest of the repeated runs of each stage counts. The peak memory each
+stage allocates is traced in one more run, so tracing doesn't slow the
+timed ones.
+
+The time taken to import the library and the command line tool in a fresh
+interpreter is measured too, and checked against a budget.
+
+With --jobs, the parallel fill is also timed for each number of processes
+and tile size given, and its speedup over the serial fill reported."""
+
+# The alphabets sequences are drawn from: the fewer the letters, the more
+# cells have several equally good backlinks.
+TIE_ALPHABETS = {"low": "ACGT", "high": "AC"}
+
+# The stages timed for every case, in order.
+STAGES = ["allocate", "fill", "traceback", "print_matrix", "write_html"]
+
+# At most this many alignments are traced back, as the number of optimal
+# alignments can grow exponentially with the number of ties.
+MAX_ALIGNMENTS = 100
+
+# The modules whose import time is measured, and the most it may take in
+# seconds.
+IMPORT_MODULES = ["aligner", "sequence_aligner"]
+IMPORT_BUDGET = 0.1
+
+# Stages faster than this in the baseline are too noisy to compare.
+MIN_SECONDS = 0.005
+
+# The baseline saved with the default options, for --baseline.
+DEFAULT_BASELINE = "benchmark_baseline.json"
+
+def random_sequence(rng, length, alphabet="ACGT"):
+    '''Returns a random sequence of the given length.'''
+    return "".join([rng.choice(alphabet) for i in range(length)])
+
+def mutate(rng, sequence, rate=0.1, alphabet="ACGT"):
+    '''Returns a copy of sequence in which each position has been
+    substituted, deleted or followed by an insertion with the given overall
+    probability.'''
+    mutated = []
+    for c in sequence:
+        roll = rng.random()
+        if roll >= rate:
+            mutated.append(c)
+        elif roll < rate / 3:
+            mutated.append(rng.choice(alphabet))
+        elif roll < rate * 2 / 3:
+            mutated.append(c + rng.choice(alphabet))
+    return "".join(mutated)
+
+def make_pair(seed, size, ties="low", rate=0.1):
+    '''Returns a reproducible (left, top) pair of sequences for a case: a
+    random sequence and a mutated copy of it.'''
+    rng = random.Random("{0!s}-{1!s}-{2}".format(seed, size, ties))
+    alphabet = TIE_ALPHABETS[ties]
+    top = random_sequence(rng, size, alphabet)
+    return (mutate(rng, top, rate, alphabet), top)
+
+def best_time(function, repeat):
+    '''Returns the shortest of repeat timings of calling function.'''
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def traced_peak_kb(function):
+    '''Calls function and returns the peak memory allocated while it ran,
+    beyond what was allocated before, in kilobytes, or None if tracemalloc
+    is not available.'''
+    if tracemalloc is None:
+        function()
+        return None
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return max(0, peak - start) // 1024
+
+def measure(function, repeat):
+    '''Returns a tuple (seconds, peak_kb) of the shortest of repeat timings
+    of calling function and the traced_peak_kb of one more call.'''
+    seconds = best_time(function, repeat)
+    return (seconds, traced_peak_kb(function))
+
+def import_time(module, repeat=3):
+    '''Returns the shortest of repeat timings of importing module in a new
+    interpreter.'''
+    code = ("import time; start = time.time(); import {0}; "
+            "print(time.time() - start)").format(module)
+    directory = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for i in range(repeat):
+        output = subprocess.check_output([sys.executable, "-c", code],
+                                         cwd=directory)
+        elapsed = float(output.decode("ascii"))
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def run_case(case):
+    '''Times each stage for one (seed, size, ties, repeat) case, returning a
+    dictionary of the results.'''
+    seed, size, ties, repeat = case
+    left, top = make_pair(seed, size, ties)
+    timings = {}
+    timings["allocate"] = measure(lambda: ScoringMatrix(left, top), repeat)
+    # The later stages change the matrix, so each run gets its own, with
+    # one more for the traced run.
+    matrices = [ScoringMatrix(left, top) for i in range(repeat + 1)]
+    timings["fill"] = measure(lambda: fill_matrix(matrices.pop()), repeat)
+    filled = []
+    for i in range(repeat + 1):
+        sm = ScoringMatrix(left, top)
+        fill_matrix(sm)
+        filled.append(sm)
+    alignments = []
+    def traceback():
+        sm = filled.pop()
+        prune_backlinks(sm)
+        alignments[:] = islice(iter_alignments(sm), MAX_ALIGNMENTS)
+        filled.insert(0, sm)
+    timings["traceback"] = measure(traceback, repeat)
+    sm = filled[0]
+    timings["print_matrix"] = measure(lambda: format_matrix(sm), repeat)
+    directory = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        timings["write_html"] = measure(lambda: write_html(sm, alignments),
+                                        repeat)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+    cells = sm.get_rows() * sm.get_columns()
+    stages = {}
+    for stage in STAGES:
+        seconds, peak_kb = timings[stage]
+        stages[stage] = {"seconds": seconds,
+                         "cells_per_second": cells / seconds if seconds
+                                             else None,
+                         "peak_memory_kb": peak_kb}
+    return {"name": "{0!s}-{1}".format(size, ties), "size": size,
+            "ties": ties, "cells": cells, "alignments": len(alignments),
+            "peak_memory_kb": peak_memory_kb(), "stages": stages}
+
+def run_parallel_case(seed, size, ties, jobs, tile_sizes, repeat=3):
+    '''Times the serial fill and the parallel fill with each number of
+    processes in jobs and each tile size for one case, returning a list of
+    dictionaries of the results. Each parallel fill is checked against the
+    serial one.'''
+    left, top = make_pair(seed, size, ties)
+    matrices = [ScoringMatrix(left, top) for i in range(repeat)]
+    serial = best_time(lambda: fill_matrix(matrices.pop()), repeat)
+    expected = ScoringMatrix(left, top)
+    fill_matrix(expected)
+    results = []
+    for processes in jobs:
+        for tile_size in tile_sizes:
+            matrices = [ScoringMatrix(left, top) for i in range(repeat)]
+            filled = []
+            def parallel():
+                sm = matrices.pop()
+                fill_matrix_parallel(sm, False, None, processes, tile_size)
+                filled.append(sm)
+            seconds = best_time(parallel, repeat)
+            results.append({"name": "{0!s}-{1}".format(size, ties),
+                            "jobs": processes, "tile_size": tile_size,
+                            "seconds": seconds, "serial_seconds": serial,
+                            "speedup": serial / seconds if seconds else None,
+                            "matches": all(sm.scores == expected.scores and
+                                           sm.backlinks == expected.backlinks
+                                           for sm in filled)})
+    return results
+
+def run_benchmarks(sizes, tie_densities, seed=0, repeat=3, jobs=(),
+                   tile_sizes=()):
+    '''Returns the results of every case, each run in a new process, and of
+    the parallel fill of every case for each number of processes in jobs and
+    each tile size. The parallel fills run in this process, as the workers
+    of a pool can't start pools of their own.'''
+    cases = [(seed, size, ties, repeat) for size in sizes
+             for ties in tie_densities]
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    try:
+        results = pool.map(run_case, cases, 1)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    imports = dict((module, import_time(module, repeat))
+                   for module in IMPORT_MODULES)
+    parallel = []
+    if jobs:
+        for size in sizes:
+            for ties in tie_densities:
+                parallel.extend(run_parallel_case(seed, size, ties, jobs,
+                                                  tile_sizes, repeat))
+    return {"python": platform.python_version(), "seed": seed,
+            "repeat": repeat, "imports": imports, "cases": results,
+            "parallel": parallel}
+
+def compare(results, baseline, tolerance=0.25, min_seconds=MIN_SECONDS):
+    '''Returns a list of (case name, stage, seconds, baseline seconds) for
+    every stage which took more than tolerance longer than in the baseline.
+    Cases and stages missing from either, and stages which took less than
+    min_seconds in the baseline, are skipped.'''
+    old_cases = dict((case["name"], case) for case in baseline["cases"])
+    regressions = []
+    for case in results["cases"]:
+        old_case = old_cases.get(case["name"])
+        if old_case is None:
+            continue
+        for stage in STAGES:
+            if stage not in case["stages"] or stage not in old_case["stages"]:
+                continue
+            seconds = case["stages"][stage]["seconds"]
+            old_seconds = old_case["stages"][stage]["seconds"]
+            if (old_seconds >= min_seconds and
+                    seconds > old_seconds * (1 + tolerance)):
+                regressions.append((case["name"], stage, seconds,
+                                    old_seconds))
+    return regressions
+
+def over_budget(results, budget=IMPORT_BUDGET):
+    '''Returns a list of (module, seconds) for every module which took
+    longer than budget seconds to import.'''
+    return [(module, results["imports"][module])
+            for module in sorted(results.get("imports", {}))
+            if results["imports"][module] > budget]
+
+def print_results(results):
+    '''Prints a table of the results.'''
+    for module in sorted(results["imports"]):
+        print("import {0:<20}{1:>10.4f}".format(module,
+                                                results["imports"][module]))
+    print("{0:<12}{1:<14}{2:>10}{3:>16}{4:>12}{5:>12}".format(
+        "case", "stage", "seconds", "cells/s", "peak KB", "RSS KB"))
+    for case in results["cases"]:
+        for stage in STAGES:
+            timing = case["stages"][stage]
+            rate = timing["cells_per_second"]
+            peak_kb = timing.get("peak_memory_kb")
+            print("{0:<12}{1:<14}{2:>10.4f}{3:>16}{4:>12}{5:>12}".format(
+                case["name"], stage, timing["seconds"],
+                "{0:.0f}".format(rate) if rate else "-",
+                "-" if peak_kb is None else peak_kb,
+                case["peak_memory_kb"] or "-"))
+
+def print_parallel_results(results):
+    '''Prints a table of the speedup of the parallel fill of each case.'''
+    if not results.get("parallel"):
+        return
+    print("{0:<12}{1:>6}{2:>8}{3:>10}{4:>10}{5:>10}".format(
+        "case", "jobs", "tile", "seconds", "serial", "speedup"))
+    for result in results["parallel"]:
+        print("{0:<12}{1:>6}{2:>8}{3:>10.4f}{4:>10.4f}{5:>10}{6}".format(
+            result["name"], result["jobs"], result["tile_size"],
+            result["seconds"], result["serial_seconds"],
+            "{0:.2f}x".format(result["speedup"]) if result["speedup"]
+            else "-",
+            "" if result["matches"] else "  MISMATCH"))
+
+def main():
+    parser = argparse.ArgumentParser(
+                formatter_class=argparse.RawDescriptionHelpFormatter,
+                description=desc
+                )
+    parser.add_argument("--sizes", default="100,200,400",
+                        help="Comma-separated sequence lengths (default: "
+                             "%(default)s).")
+    parser.add_argument("--ties", default="low,high",
+                        help="Comma-separated tie densities, each low or high "
+                             "(default: %(default)s).")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the sequence generator.")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Number of runs of each stage.")
+    parser.add_argument("-o", "--output", metavar="JSON",
+                        help="Write the results to this file.")
+    parser.add_argument("--baseline", metavar="JSON", nargs="?",
+                        const=os.path.join(os.path.dirname(
+                            os.path.abspath(__file__)), DEFAULT_BASELINE),
+                        help="Compare the results with those of an earlier "
+                             "run, exiting with status 1 on a regression; "
+                             "without JSON, with the baseline saved in "
+                             "{0}.".format(DEFAULT_BASELINE))
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Fraction by which a stage may be slower than "
+                             "the baseline (default: %(default)s).")
+    parser.add_argument("--jobs",
+                        help="Comma-separated numbers of processes to time "
+                             "the parallel fill with.")
+    parser.add_argument("--tile-sizes", default="64,256",
+                        help="Comma-separated tile sizes to time the parallel "
+                             "fill with (default: %(default)s).")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET,
+                        help="Seconds each module may take to import, "
+                             "exiting with status 1 if one takes longer "
+                             "(default: %(default)s).")
+    args = parser.parse_args()
+    try:
+        sizes = [int(size) for size in args.sizes.split(",")]
+    except ValueError:
+        print("Error: invalid sizes:", args.sizes)
+        exit(1)
+    try:
+        jobs = [int(n) for n in args.jobs.split(",")] if args.jobs else []
+        tile_sizes = [int(n) for n in args.tile_sizes.split(",")]
+    except ValueError:
+        print("Error: invalid jobs or tile sizes:", args.jobs, args.tile_sizes)
+        exit(1)
+    tie_densities = args.ties.split(",")
+    for ties in tie_densities:
+        if ties not in TIE_ALPHABETS:
+            print("Error: unknown tie density:", ties)
+            exit(1)
+    baseline = None
+    if args.baseline:
+        try:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        except (IOError, ValueError) as e:
+            print("Error: could not read baseline:", args.baseline)
+            print(e)
+            exit(1)
+    results = run_benchmarks(sizes, tie_densities, args.seed, args.repeat,
+                             jobs, tile_sizes)
+    print_results(results)
+    print_parallel_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print("Results written to", args.output)
+    slow_imports = over_budget(results, args.import_budget)
+    for module, seconds in slow_imports:
+        print("Over budget: import {0} took {1:.4f}s, budget {2:.4f}s".format(
+            module, seconds, args.import_budget))
+    if slow_imports:
+        exit(1)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for name, stage, seconds, old_seconds in regressions:
+            print("Regression: {0} {1} took {2:.4f}s, baseline {3:.4f}s".format(
+                name, stage, seconds, old_seconds))
+        if regressions:
+            exit(1)
+        print("No regressions against", args.baseline)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# This file is part of sequence-aligner.
+# Copyright (C) 2014 Christopher Kyle Horton <chorton@ltu.edu>
+
+# sequence-aligner is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# sequence-aligner is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with sequence-aligner. If not, see <http://www.gnu.org/licenses/>.
+
+# Bit-parallel optimal scores for the default unit scoring scheme.
+#
+# With a match scoring 1, a mismatch 0 and a gap -1, the difference between a
+# cell and the cell above it (or to its left) is always -1, 0, 1 or 2. A
+# whole column of these differences is stored as three bit vectors in the
+# style of Myers and Hyyro: bit i of V[t] is set iff the difference at row
+# i + 1 is at least t. Python integers serve as bit vectors of any length, so
+# every bitwise operation below updates a whole column at once.
+#
+# Moving to the next column, the horizontal difference h leaving each row
+# obeys h(i) = max(a(i), h(i - 1) + b(i)), where a(i) and b(i) <= 0 only
+# depend on the vertical difference entering the row and whether its
+# characters match. Bit vectors X[t] of the rows where h >= t are built from
+# the highest level down: wherever b is 0 a level carries on to the next row,
+# which one addition resolves for all rows at once, and wherever b is
+# negative it carries on to a lower level.
+
+# The key of the only ScoringScheme these functions compute scores for.
+UNIT_SCHEME_KEY = (1, 0, -1, 0, 0, ())
+
+def supports_scheme(scheme):
+    '''Returns True iff bit_parallel_score gives the optimal scores of the
+    given ScoringScheme.'''
+    return scheme.key() == UNIT_SCHEME_KEY
+
+def match_vectors(left_codes):
+    '''Returns a dictionary mapping each code in the left sequence to the bit
+    vector of the rows it appears in.'''
+    vectors = {}
+    for i, c in enumerate(left_codes):
+        vectors[c] = vectors.get(c, 0) | 1 << i
+    return vectors
+
+def fill(generate, propagate, carry):
+    '''Returns the bit vector X with X(i) = generate(i) | (propagate(i) &
+    X(i - 1)), where X(-1) is carry, using one addition for all rows.'''
+    started = ((generate << 1) | carry) & propagate
+    return generate | ((((started + propagate) ^ propagate) | started) &
+                       propagate)
+
+def bit_parallel_score(left_codes, top_codes, alignment_is_global=False):
+    '''Returns a tuple (score, row, column) like
+    scoring_algorithm.get_optimal_score does for the unit scoring scheme,
+    given the codes of the left and top sequences.
+
+    Terminal gaps of a semi-global alignment are free. The columns are
+    filled as if they were not, and the free gaps are added at the end: the
+    best alignment is then the best path to any cell of the bottom row or
+    the last column.'''
+    rows, columns = len(left_codes), len(top_codes)
+    semi_global = not alignment_is_global
+    if rows == 0:
+        if semi_global:
+            return (0, 0, 0)
+        return (-columns, 0, columns)
+    mask = (1 << rows) - 1
+    bottom = rows - 1
+    vectors = match_vectors(left_codes)
+    # The vertical differences of column 0, and the horizontal difference
+    # along row 0 as carries into the first row.
+    if semi_global:
+        v0, v1, v2, carry = mask, 0, 0, 1
+        score = 0
+    else:
+        v0, v1, v2, carry = 0, 0, 0, 0
+        score = -rows
+    best_score, best_column = score, 0
+    for j in range(1, columns + 1):
+        s = vectors.get(top_codes[j - 1], 0)
+        not_v0, not_v1, not_v2 = ~v0 & mask, ~v1 & mask, ~v2 & mask
+        # Rows where b is 0, -1 and -2; b is -3 elsewhere.
+        p0, p1, p2 = not_v0, v0 & not_v1, v1 & not_v2
+        x2 = fill(not_v0 & s, p0, 0)
+        x1 = fill(not_v0 | (not_v1 & s) | (p1 & x2 << 1), p0, 0)
+        x0 = fill(not_v1 | (not_v2 & s) | (p1 & x1 << 1) | (p2 & x2 << 1), p0,
+                  carry)
+        x0, x1, x2 = x0 & mask, x1 & mask, x2 & mask
+        # The horizontal differences entering each row from the row above.
+        h0 = (x0 << 1 | carry) & mask
+        h1 = x1 << 1 & mask
+        h2 = x2 << 1 & mask
+        not_h0, not_h1, not_h2 = ~h0 & mask, ~h1 & mask, ~h2 & mask
+        h_is_0, h_is_1 = h0 & not_h1, h1 & not_h2
+        v0, v1, v2 = (not_h2 & (s | not_h1) | not_h0 & v0 | h_is_0 & v1 |
+                      h_is_1 & v2,
+                      s & not_h1 | ~s & not_h0 | not_h0 & v1 | h_is_0 & v2,
+                      s & not_h0 | not_h0 & v2)
+        v0, v1, v2 = v0 & mask, v1 & mask, v2 & mask
+        score += int((x0 >> bottom & 1) + (x1 >> bottom & 1) +
+                     (x2 >> bottom & 1)) - 1
+        if score > best_score:
+            best_score, best_column = score, j
+    if not semi_global:
+        return (score, rows, columns)
+    # Decode the last column, down which terminal gaps are free too.
+    column_scores = [0]
+    for i in range(rows):
+        column_scores.append(column_scores[-1] + int((v0 >> i & 1) +
+                             (v1 >> i & 1) + (v2 >> i & 1)) - 1)
+    score = max(best_score, max(column_scores))
+    if best_score == score and best_column < columns:
+        return (score, rows, best_column)
+    return (score, column_scores.index(score), columns)
+
+if __name__ == "__main__":
+    # Unit testing
+    import random
+    from encoded_sequence import encode_text
+    from scoring_algorithm import get_optimal_score
+    from scoring_scheme import ScoringScheme
+    # The same scores, which get_optimal_score doesn't recognize as the unit
+    # scheme and so computes row by row.
+    row_scheme = ScoringScheme(substitutions={("A", "A"): 1})
+    assert supports_scheme(ScoringScheme())
+    assert not supports_scheme(row_scheme)
+    rng = random.Random(13)
+    pairs = [("", ""), ("", "ACGT"), ("ACGT", ""), ("CGCA", "CACGTAT")]
+    for trial in range(300):
+        alphabet = rng.choice(["AC", "ACGT", "ACGTN"])
+        pairs.append(("".join(rng.choice(alphabet)
+                              for x in range(rng.randint(1, 40))),
+                      "".join(rng.choice(alphabet)
+                              for x in range(rng.randint(1, 40)))))
+    top = "".join(rng.choice("ACGT") for x in range(700))
+    pairs.append(("".join(c if rng.random() < 0.8 else rng.choice("ACGT")
+                          for c in top[100:600]), top))
+    for left, top in pairs:
+        for alignment_is_global in (False, True):
+            assert bit_parallel_score(encode_text(left), encode_text(top),
+                                      alignment_is_global) == \
+                   get_optimal_score(left, top, alignment_is_global,
+                                     row_scheme), (left, top)
+    print("All bit-parallel tests passed.")
@@ -0,0 +1,199 @@
+# This file is part of sequence-aligner.
+# Copyright (C) 2014 Christopher Kyle Horton <chorton@ltu.edu>
+
+# sequence-aligner is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# sequence-aligner is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with sequence-aligner. If not, see <http://www.gnu.org/licenses/>.
+
+# A persistent cache of alignment results.
+#
+# Results are kept in an SQLite database, keyed by a hash of both sequences
+# and every option which affects the result, and hold the optimal score, the
+# number of optimal alignments and each alignment found as a start cell and
+# a CIGAR string. The least recently used results are dropped whenever the
+# cache grows beyond its size limit. Several processes may share one cache.
+
+from __future__ import print_function
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from alignment import from_cigar
+from encoded_sequence import encode
+
+# Bumped whenever the results stored for the same key would change.
+CACHE_VERSION = 2
+
+DEFAULT_MAX_SIZE = 64 << 20
+CACHE_FILE = "alignments.sqlite"
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    score INTEGER,
+    total TEXT,
+    alignments TEXT,
+    size INTEGER,
+    used REAL
+)'''
+
+def default_cache_dir():
+    '''Returns the directory the command line tools cache results in.'''
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "sequence-aligner")
+
+def open_cache(directory, max_size=DEFAULT_MAX_SIZE):
+    '''Returns the AlignmentCache in the given directory, or None if it can't
+    be opened, in which case the command line tools carry on without it.'''
+    try:
+        return AlignmentCache(directory, max_size)
+    except (EnvironmentError, sqlite3.Error):
+        return None
+
+def alignment_parameters(alignment_is_global=False, alignment_is_local=False,
+                         scheme=None, max_alignments=None, x_drop=None,
+                         band=None, linear_space=False, seed_length=None):
+    '''Returns the dictionary of the options which affect the alignments
+    found, in the form the cache is keyed by.'''
+    return {"alignment_is_global": alignment_is_global,
+            "alignment_is_local": alignment_is_local,
+            "scheme": scheme, "max_alignments": max_alignments,
+            "x_drop": x_drop, "band": band, "linear_space": linear_space,
+            "seed_length": seed_length}
+
+def cache_key(sequence1, sequence2, parameters):
+    '''Returns the key of the result of aligning sequence1 (the left
+    sequence) and sequence2 (the top sequence) with the given dictionary of
+    options. A ScoringScheme among them is keyed by its key method.'''
+    options = {}
+    for name, value in parameters.items():
+        if value is not None and hasattr(value, "key"):
+            value = value.key()
+        options[name] = value
+    digest = hashlib.sha1()
+    for part in (str(CACHE_VERSION), str(sequence1), str(sequence2),
+                 json.dumps(options, sort_keys=True)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class AlignmentCache:
+    '''An on-disk cache of alignment results which holds at most about
+    max_size bytes of alignments.'''
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        '''Opens the cache in the given directory, creating it if needed.'''
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.max_size = max_size
+        self.connection = sqlite3.connect(os.path.join(directory, CACHE_FILE),
+                                          timeout=60)
+        with self.connection:
+            self.connection.execute(SCHEMA)
+            self.connection.execute("CREATE INDEX IF NOT EXISTS used_index "
+                                    "ON results (used)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        '''Closes the underlying database.'''
+        self.connection.close()
+
+    def get(self, sequence1, sequence2, parameters):
+        '''Returns a tuple (alignments, total) of the Alignment objects and
+        the number of optimal alignments stored for the given sequences and
+        options, or None if there are none.'''
+        key = cache_key(sequence1, sequence2, parameters)
+        with self.connection:
+            row = self.connection.execute(
+                "SELECT score, total, alignments FROM results WHERE key = ?",
+                (key,)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("UPDATE results SET used = ? "
+                                    "WHERE key = ?", (time.time(), key))
+        score, total, stored = row
+        left = encode(sequence1).codes()
+        top = encode(sequence2).codes()
+        alignments = [from_cigar(left, top, (start_row, start_column), cigar,
+                                 score)
+                      for start_row, start_column, cigar in json.loads(stored)]
+        return (alignments, int(total))
+
+    def put(self, sequence1, sequence2, parameters, alignments, total=None):
+        '''Stores the alignments found for the given sequences and options,
+        and the total number of optimal alignments if more exist, then drops
+        the least recently used results beyond the size limit.'''
+        key = cache_key(sequence1, sequence2, parameters)
+        if total is None:
+            total = len(alignments)
+        stored = json.dumps([list(alignment.get_start()) + [alignment.cigar()]
+                             for alignment in alignments])
+        score = alignments[0].get_score() if alignments else None
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (key, score, str(total), stored, len(key) + len(stored),
+                 time.time()))
+            self.evict()
+
+    def evict(self):
+        '''Drops the least recently used results until the cache fits in its
+        size limit.'''
+        size = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if size <= self.max_size:
+            return
+        dropped = []
+        for key, entry_size in self.connection.execute(
+                "SELECT key, size FROM results ORDER BY used"):
+            if size <= self.max_size:
+                break
+            dropped.append((key,))
+            size -= entry_size
+        self.connection.executemany("DELETE FROM results WHERE key = ?",
+                                    dropped)
+
+if __name__ == "__main__":
+    # Unit testing
+    import shutil
+    import tempfile
+    from scoring_matrix import ScoringMatrix
+    from scoring_algorithm import get_alignments
+    directory = tempfile.mkdtemp()
+    try:
+        parameters = alignment_parameters()
+        with AlignmentCache(directory) as cache:
+            assert cache.get("CGCA", "CACGTAT", parameters) is None
+            alignments = get_alignments(ScoringMatrix("CGCA", "CACGTAT"))
+            cache.put("CGCA", "CACGTAT", parameters, alignments)
+        with AlignmentCache(directory, max_size=150) as cache:
+            cached, total = cache.get("CGCA", "CACGTAT", parameters)
+            assert cached == alignments and total == len(alignments)
+            assert cache.get("CGCA", "CACGTAT",
+                             alignment_parameters(True)) is None
+            # Filling the cache drops the oldest result.
+            cache.put("ACGT", "ACGT", parameters,
+                      get_alignments(ScoringMatrix("ACGT", "ACGT")))
+            cache.put("CGCA", "CGCA", parameters,
+                      get_alignments(ScoringMatrix("CGCA", "CGCA")))
+            assert cache.get("CGCA", "CACGTAT", parameters) is None
+            assert cache.get("CGCA", "CGCA", parameters) is not None
+    finally:
+        shutil.rmtree(directory)
+    print("All cache tests passed.")
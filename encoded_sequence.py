@@ -0,0 +1,178 @@
+# This file is part of sequence-aligner.
+# Copyright (C) 2014 Christopher Kyle Horton <chorton@ltu.edu>
+
+# sequence-aligner is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# sequence-aligner is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with sequence-aligner. If not, see <http://www.gnu.org/licenses/>.
+
+from bisect import bisect_right
+
+# Every character has a fixed small-integer code: the four nucleotides are
+# 0 to 3 so that they fit in two bits, and every other character is its own
+# ASCII value. Equal characters therefore always have equal codes.
+NUCLEOTIDES = "ACGT"
+ENCODE = bytearray(range(256))
+DECODE = bytearray(range(256))
+for code, nucleotide in enumerate(NUCLEOTIDES):
+    ENCODE[ord(nucleotide)] = code
+    DECODE[code] = ord(nucleotide)
+
+# IUPAC ambiguity codes (and gaps) which may appear in a nucleotide
+# sequence without preventing it from being packed.
+AMBIGUITY = "NRYKMSWBDHVU-"
+
+# UNPACK[byte] is the four 2-bit codes packed into that byte, first to last.
+UNPACK = [bytes(bytearray([byte & 3, byte >> 2 & 3, byte >> 4 & 3, byte >> 6]))
+          for byte in range(256)]
+
+def encode_text(text):
+    '''Returns a bytearray holding the code of each character of text.'''
+    return bytearray(text, "ascii").translate(ENCODE)
+
+def decode(codes):
+    '''Returns the string of characters for the given sequence of codes.'''
+    text = bytes(bytearray(codes).translate(DECODE))
+    if not isinstance(text, str):
+        text = text.decode("ascii")
+    return text
+
+class EncodedSequence:
+    '''A sequence stored as small-integer codes.
+
+    Nucleotide sequences are packed four bases to a byte. Positions holding
+    N or another ambiguity code are kept to the side as runs of (start,
+    length, code), so long stretches of N cost almost nothing. Sequences in
+    any other alphabet keep one code per byte.
+
+    The packing only saves memory while a sequence is stored: aligning it
+    unpacks it with codes, to one byte per base.'''
+    def __init__(self, text):
+        '''Encodes the given sequence string.'''
+        self.length = len(text)
+        codes = encode_text(text)
+        self.packed = all(c in NUCLEOTIDES or c in AMBIGUITY
+                          for c in set(text))
+        if not self.packed:
+            self.data = codes
+            return
+        # Record the runs of ambiguous positions, then pack their codes as A.
+        self.run_starts = []
+        self.runs = []
+        position = 0
+        while position < self.length:
+            code = codes[position]
+            if code < 4:
+                position += 1
+                continue
+            start = position
+            while position < self.length and codes[position] == code:
+                codes[position] = 0
+                position += 1
+            self.run_starts.append(start)
+            self.runs.append((start, position - start, code))
+        codes.extend(bytearray(-self.length % 4))
+        self.data = bytearray(codes[i] | codes[i + 1] << 2 |
+                              codes[i + 2] << 4 | codes[i + 3] << 6
+                              for i in range(0, len(codes), 4))
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        return decode(self.codes())
+
+    def __repr__(self):
+        return "EncodedSequence({0!r})".format(str(self))
+
+    def __eq__(self, other):
+        return str(self) == str(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __iter__(self):
+        return iter(str(self))
+
+    def __getitem__(self, index):
+        '''Returns the character at the given position, or a string for a
+        slice.'''
+        if isinstance(index, slice):
+            return str(self)[index]
+        return chr(DECODE[self.code(index)])
+
+    def code(self, index):
+        '''Returns the code at the given position.'''
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("sequence index out of range")
+        if not self.packed:
+            return self.data[index]
+        run = bisect_right(self.run_starts, index) - 1
+        if run >= 0:
+            start, length, code = self.runs[run]
+            if index < start + length:
+                return code
+        return self.data[index >> 2] >> ((index & 3) << 1) & 3
+
+    def codes(self):
+        '''Returns a new bytearray holding the code of every position, which
+        is what the alignment algorithms compare.'''
+        if not self.packed:
+            return bytearray(self.data)
+        codes = bytearray(b"".join([UNPACK[byte] for byte in self.data]))
+        del codes[self.length:]
+        for start, length, code in self.runs:
+            codes[start:start + length] = bytearray([code]) * length
+        return codes
+
+    def is_packed(self):
+        '''Returns True iff this sequence is packed two bits per base.'''
+        return self.packed
+
+def encode(sequence):
+    '''Returns the given sequence as an EncodedSequence, encoding it if it is
+    a string.'''
+    if isinstance(sequence, EncodedSequence):
+        return sequence
+    return EncodedSequence(sequence)
+
+if __name__ == "__main__":
+    # Unit testing
+    for text in ["", "A", "GATTACA", "ACGTN", "NNNNACGTNNRYACGTTTN", "NNN",
+                 "ACGTACGTA" + "N" * 50 + "RRY-GT", "MKVLAAGIW", "acgt"]:
+        sequence = encode(text)
+        assert len(sequence) == len(text)
+        assert str(sequence) == text and sequence == text
+        assert sequence.is_packed() == all(c in NUCLEOTIDES + AMBIGUITY
+                                           for c in text)
+        assert decode(sequence.codes()) == text
+        assert sequence.codes() == encode_text(text)
+        for i in range(-len(text), len(text)):
+            assert sequence.code(i) == encode_text(text)[i]
+            assert sequence[i] == text[i]
+        for start in range(len(text) + 1):
+            assert sequence[start:] == text[start:]
+            assert sequence[start:start + 5] == text[start:start + 5]
+        assert sequence[::-1] == text[::-1]
+        for index in (len(text), -len(text) - 1):
+            try:
+                sequence.code(index)
+            except IndexError:
+                pass
+            else:
+                raise AssertionError("code({0!s}) of {1!r} didn't raise "
+                                     "IndexError".format(index, text))
+    sequence = encode("ACGT" * 10 + "N" * 100 + "ACGT")
+    assert len(sequence.data) == 36 and sequence.runs == [(40, 100, ord("N"))]
+    assert encode(sequence) is sequence
+    print("All encoded sequence tests passed.")
@@ -0,0 +1,261 @@
+# This file is part of sequence-aligner.
+# Copyright (C) 2014 Christopher Kyle Horton <chorton@ltu.edu>
+
+# sequence-aligner is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# sequence-aligner is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with sequence-aligner. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+
+import gzip
+import mmap
+import os.path
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+def open_fasta(path):
+    '''Opens a FASTA file for reading, transparently decompressing it if it
+    is gzipped.'''
+    with open(path, 'rb') as infile:
+        magic = infile.read(2)
+    if magic == GZIP_MAGIC:
+        return gzip.open(path, 'rt')
+    return open(path, 'r')
+
+def iter_fasta_records(infile):
+    '''Yields a (header, sequence) tuple for each record read from the given
+    open file, closing it when done.
+
+    Headers are returned without the leading '>', or as None for lines before
+    the first header. Sequences are upper case with surrounding whitespace
+    removed from each line, and are joined once per record.'''
+    header, lines = None, []
+    with infile:
+        for line in infile:
+            if line.startswith(">"):
+                if header is not None or lines:
+                    yield (header, "".join(lines).upper())
+                header, lines = line[1:].strip(), []
+            else:
+                lines.append(line.strip())
+    if header is not None or lines:
+        yield (header, "".join(lines).upper())
+
+def read_fasta(path):
+    '''Returns an iterator over the (header, sequence) records of the given
+    FASTA file, which may be gzipped. Records are read lazily, one at a time,
+    but the file is opened immediately so that IOError is raised here.'''
+    return iter_fasta_records(open_fasta(path))
+
+def read_fasta_records(path):
+    '''Returns a list of all (header, sequence) records in the given FASTA
+    file.'''
+    return list(read_fasta(path))
+
+def read_first_record(path):
+    '''Returns the first (header, sequence) record of the given FASTA file,
+    reading no further than its end, or (None, "") if the file is empty.'''
+    for record in read_fasta(path):
+        return record
+    return (None, "")
+
+def record_name(header):
+    '''Returns the name of a FASTA record, which is the first word of its
+    header.'''
+    if not header:
+        return ""
+    return header.split(None, 1)[0]
+
+def build_fasta_index(path):
+    '''Builds a samtools-compatible index of the given (uncompressed) FASTA
+    file and returns it as a list of (name, length, offset, line bases,
+    line width) tuples, one per record.
+
+    Raises ValueError if the file is gzipped or if the lines of a record are
+    not all the same length, apart from its last line.'''
+    entries = []
+    with open(path, 'rb') as infile:
+        if infile.read(2) == GZIP_MAGIC:
+            raise ValueError("cannot index a gzipped FASTA file: " + path)
+        infile.seek(0)
+        position = 0
+        entry = None
+        short_line = False
+        for line in infile:
+            if line.startswith(b">"):
+                if entry is not None:
+                    entries.append(tuple(entry))
+                name = record_name(line[1:].decode("ascii"))
+                entry = [name, 0, position + len(line), 0, 0]
+                short_line = False
+            elif entry is not None:
+                bases = len(line.rstrip(b"\r\n"))
+                if bases:
+                    if short_line or (entry[3] and bases > entry[3]):
+                        raise ValueError("uneven line lengths in record " +
+                                         entry[0] + " of " + path)
+                    if not entry[3]:
+                        entry[3], entry[4] = bases, len(line)
+                    elif bases < entry[3] or len(line) != entry[4]:
+                        short_line = True
+                    entry[1] += bases
+            position += len(line)
+        if entry is not None:
+            entries.append(tuple(entry))
+    return entries
+
+def write_fasta_index(entries, path):
+    '''Writes index entries from build_fasta_index to the given .fai file.'''
+    with open(path, 'w') as outfile:
+        for entry in entries:
+            outfile.write("\t".join(str(x) for x in entry) + "\n")
+
+def read_fasta_index(path):
+    '''Reads the entries of the given .fai file.'''
+    entries = []
+    with open(path, 'r') as infile:
+        for line in infile:
+            fields = line.rstrip("\r\n").split("\t")
+            entries.append((fields[0],) + tuple(int(x) for x in fields[1:5]))
+    return entries
+
+class FastaIndex:
+    '''Random access to the records of an indexed FASTA file.
+
+    The file is memory-mapped, and only the bytes holding a requested record
+    or region are read. The .fai index next to the file is used if it is up
+    to date, and is otherwise (re)built and saved if possible.'''
+    def __init__(self, path):
+        '''Opens the given FASTA file and loads or builds its index.'''
+        index_path = path + ".fai"
+        if (os.path.exists(index_path) and
+                os.path.getmtime(index_path) >= os.path.getmtime(path)):
+            entries = read_fasta_index(index_path)
+        else:
+            entries = build_fasta_index(path)
+            try:
+                write_fasta_index(entries, index_path)
+            except IOError:
+                pass
+        self.entries = dict((entry[0], entry) for entry in entries)
+        self.infile = open(path, 'rb')
+        if os.path.getsize(path):
+            self.data = mmap.mmap(self.infile.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        else:
+            self.data = b""
+
+    def __contains__(self, name):
+        '''Returns True iff a record with the given name is indexed.'''
+        return name in self.entries
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        '''Releases the memory map and the underlying file.'''
+        if not isinstance(self.data, bytes):
+            self.data.close()
+        self.infile.close()
+
+    def get_length(self, name):
+        '''Returns the length of the named record.'''
+        return self.entries[name][1]
+
+    def fetch(self, name, start=None, end=None):
+        '''Returns the upper case sequence of the named record, or of the
+        region from start to end (1-based and inclusive, as in samtools) if
+        they are given. Raises KeyError for unknown names.'''
+        name, length, offset, line_bases, line_width = self.entries[name]
+        start = 1 if start is None else max(1, start)
+        end = length if end is None else min(length, end)
+        if end < start:
+            return ""
+        first = (offset + (start - 1) // line_bases * line_width +
+                 (start - 1) % line_bases)
+        last = (offset + (end - 1) // line_bases * line_width +
+                (end - 1) % line_bases)
+        sequence = self.data[first:last + 1].replace(b"\n", b"")
+        sequence = sequence.replace(b"\r", b"").upper()
+        if not isinstance(sequence, str):
+            sequence = sequence.decode("ascii")
+        return sequence
+
+    def fetch_region(self, region):
+        '''Returns the sequence of a samtools-style region string, either a
+        record name or "name:start-end", "name:start" or "name:start-".
+        Returns None if the region does not name an indexed record.'''
+        if region in self.entries:
+            return self.fetch(region)
+        name, separator, interval = region.rpartition(":")
+        if not separator or name not in self.entries:
+            return None
+        start, dash, end = interval.replace(",", "").partition("-")
+        try:
+            start = int(start)
+            end = int(end) if end else None
+        except ValueError:
+            return None
+        return self.fetch(name, start, end)
+
+if __name__ == "__main__":
+    # Unit testing
+    import shutil
+    import tempfile
+    directory = tempfile.mkdtemp()
+    try:
+        # Each record has its own line width, and a short last line.
+        path = os.path.join(directory, "test.fa")
+        with open(path, 'w') as outfile:
+            outfile.write(">chr1 first record\nACGT\nacgt\nAC\n"
+                          ">chr2\nGGGCCCA\nTTTAAAC\nGGG\n"
+                          ">chr3 desc\nNNNNNACGTA\n")
+        with FastaIndex(path) as reference:
+            assert "chr2" in reference and "chr4" not in reference
+        with open(path + ".fai") as infile:
+            assert infile.read() == ("chr1\t10\t19\t4\t5\n"
+                                     "chr2\t17\t38\t7\t8\n"
+                                     "chr3\t10\t69\t10\t11\n")
+        records = dict((record_name(header), sequence)
+                       for header, sequence in read_fasta_records(path))
+        # The index is read back from the .fai file this time.
+        with FastaIndex(path) as reference:
+            for name, sequence in records.items():
+                assert reference.get_length(name) == len(sequence)
+                assert reference.fetch_region(name) == sequence
+                for start in range(1, len(sequence) + 1):
+                    assert reference.fetch_region(
+                        "{0}:{1!s}".format(name, start)) == \
+                        sequence[start - 1:]
+                    for end in range(start, len(sequence) + 2):
+                        assert reference.fetch_region(
+                            "{0}:{1!s}-{2!s}".format(name, start, end)) == \
+                            sequence[start - 1:end]
+            assert reference.fetch_region("chr2:5-3") == ""
+            assert reference.fetch_region("chr2:1,0-1,1") == "TA"
+            assert reference.fetch_region("chr4:1-2") is None
+            assert reference.fetch_region("chr2:x-y") is None
+        # Lines of uneven width within a record can't be indexed.
+        with open(path, 'w') as outfile:
+            outfile.write(">chr1\nACG\nACGT\n")
+        try:
+            build_fasta_index(path)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("uneven lines were indexed")
+    finally:
+        shutil.rmtree(directory)
+    print("All FASTA tests passed.")
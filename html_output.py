@@ -19,12 +19,26 @@
 # Christopher Kyle Horton (000516274), chorton@ltu.edu
 # Last modified: 11/6/2014
 
+from array import array
+import base64
+import json
+import os.path
+import sys
+
 from scoring_matrix import ScoringMatrix
+from scoring_matrix import UP, DIAGONAL, LEFT
 
 # This module is based on code from draw-grib.rb, located at:
 # http://medicalopensource.net/mcs5603/recap.html
 # This is basically a port of Ruby code written by Professor Miller, with some
 # modifications. For example, this implementation only supports HTML5 output.
+#
+# Rather than writing a drawing statement for every cell, the table is
+# embedded as base64 typed arrays of scores and backlink bitmasks which the
+# page draws itself: the scrolling view only draws the cells in sight, and a
+# small heatmap gives an overview of the whole table.
+
+CELL = 40
 
 HEADER = '''<!DOCTYPE html>
 <html lang="en">
@@ -32,29 +46,166 @@ HEADER = '''<!DOCTYPE html>
     <!-- saved from url=(0014)about:internet -->
     <meta charset="utf-8">
     <title>{0}</title>
-    <script>
-        function arrow(dc,x,y,degrees) {{
+'''
+DATA = '''    <script>
+        var matrix = {0};
+    </script>
+'''
+RENDERER = '''    <script>
+        var CELL = %(cell)d;
+        function arrow(dc,x,y,degrees) {
             dc.beginPath();
             dc.save();
             dc.translate(x,y);
             dc.rotate(-Math.PI * 2 * degrees / 360.0);
-            dc.moveTo(0,{1!s});
-            dc.lineTo(0,-{1!s});
-            dc.lineTo(-{2!s},-{1!s} + {2!s});
-            dc.moveTo(0,-{1!s});
-            dc.lineTo({2!s},-{1!s} + {2!s});
+            dc.moveTo(0,%(head)d);
+            dc.lineTo(0,-%(head)d);
+            dc.lineTo(-%(tip)d,-%(head)d + %(tip)d);
+            dc.moveTo(0,-%(head)d);
+            dc.lineTo(%(tip)d,-%(head)d + %(tip)d);
             dc.stroke();
             dc.restore();
-        }}
-        window.onload = function() {{
-        var canvas = document.getElementById("drawingCanvas");
+        }
+        function decodeArray(data, Type) {
+            var text = atob(data);
+            var bytes = new Uint8Array(text.length);
+            for (var i = 0; i < text.length; i++) {
+                bytes[i] = text.charCodeAt(i);
+            }
+            return new Type(bytes.buffer);
+        }
+        window.onload = function() {
+        var m = matrix;
+        var scoreTypes = {"b": Int8Array, "h": Int16Array, "i": Int32Array};
+        var lo = decodeArray(m.lo, Int32Array);
+        var hi = decodeArray(m.hi, Int32Array);
+        var scores = decodeArray(m.scores, scoreTypes[m.score_type]);
+        var links = decodeArray(m.links, Uint8Array);
+        // Offset of the first stored cell of each row.
+        var starts = new Int32Array(m.rows + 1);
+        for (var r = 0; r < m.rows; r++) {
+            starts[r + 1] = starts[r] + Math.max(0, hi[r] - lo[r] + 1);
+        }
+        var view = document.getElementById("tableView");
+        var canvas = document.getElementById("tableCanvas");
         var dc = canvas.getContext("2d");
-        dc.font = '10pt Helvetica';
-        dc.textAlign = 'center';
-'''
-BODYTOP = '''        }};
+        var overview = document.getElementById("overviewCanvas");
+        var oc = overview.getContext("2d");
+        var ow = overview.width, oh = overview.height;
+
+        // Overview heatmap: each pixel is shaded by the best score of the
+        // cells under it, or drawn red if an optimal path passes through.
+        var best = new Float64Array(ow * oh);
+        var onPath = new Uint8Array(ow * oh);
+        var low = Infinity, high = -Infinity;
+        for (var i = 0; i < best.length; i++) {
+            best[i] = -Infinity;
+        }
+        for (var r = 0; r < m.rows; r++) {
+            var y = Math.floor(r * oh / m.rows);
+            for (var c = lo[r]; c <= hi[r]; c++) {
+                var k = starts[r] + c - lo[r];
+                var bin = y * ow + Math.floor(c * ow / m.columns);
+                best[bin] = Math.max(best[bin], scores[k]);
+                low = Math.min(low, scores[k]);
+                high = Math.max(high, scores[k]);
+                if (links[k] & %(moves)d) {
+                    onPath[bin] = 1;
+                }
+            }
+        }
+        var heatmap = oc.createImageData(ow, oh);
+        for (var i = 0; i < best.length; i++) {
+            var level = 255;
+            if (best[i] > -Infinity) {
+                level = 255 - Math.round(200 * (best[i] - low) /
+                                         Math.max(1, high - low));
+            }
+            heatmap.data[4 * i] = onPath[i] ? 255 : level;
+            heatmap.data[4 * i + 1] = onPath[i] ? 0 : level;
+            heatmap.data[4 * i + 2] = onPath[i] ? 0 : 255;
+            heatmap.data[4 * i + 3] = 255;
+        }
+        function drawOverview() {
+            oc.putImageData(heatmap, 0, 0);
+            oc.strokeStyle = "black";
+            oc.strokeRect((view.scrollLeft / CELL - 1) * ow / m.columns,
+                          (view.scrollTop / CELL - 1) * oh / m.rows,
+                          view.clientWidth / CELL * ow / m.columns,
+                          view.clientHeight / CELL * oh / m.rows);
+        }
+
+        // Draws the cells currently scrolled into view.
+        function draw() {
+            var x0 = view.scrollLeft, y0 = view.scrollTop;
+            var c0 = Math.max(0, Math.floor(x0 / CELL) - 1);
+            var c1 = Math.min(m.columns - 1,
+                              Math.floor((x0 + canvas.width) / CELL));
+            var r0 = Math.max(0, Math.floor(y0 / CELL) - 1);
+            var r1 = Math.min(m.rows - 1,
+                              Math.floor((y0 + canvas.height) / CELL));
+            dc.setTransform(1, 0, 0, 1, 0, 0);
+            dc.clearRect(0, 0, canvas.width, canvas.height);
+            dc.font = '10pt Helvetica';
+            dc.textAlign = 'center';
+            dc.translate(-x0, -y0);
+            dc.beginPath();
+            for (var c = c0; c <= c1 + 1; c++) {
+                dc.moveTo((c + 1) * CELL, (r0 + 1) * CELL);
+                dc.lineTo((c + 1) * CELL, (r1 + 2) * CELL);
+            }
+            for (var r = r0; r <= r1 + 1; r++) {
+                dc.moveTo((c0 + 1) * CELL, (r + 1) * CELL);
+                dc.lineTo((c1 + 2) * CELL, (r + 1) * CELL);
+            }
+            dc.stroke();
+            for (var r = r0; r <= r1; r++) {
+                var last = Math.min(c1, hi[r]);
+                for (var c = Math.max(c0, lo[r]); c <= last; c++) {
+                    var k = starts[r] + c - lo[r];
+                    dc.fillText(scores[k], CELL / 2 + (c + 1) * CELL,
+                                CELL * 2 / 3 + (r + 1) * CELL);
+                    if (links[k] & %(left)d) {
+                        arrow(dc, (c + 1) * CELL, CELL / 3 + (r + 1) * CELL, 90);
+                    }
+                    if (links[k] & %(up)d) {
+                        arrow(dc, CELL / 3 + (c + 1) * CELL, (r + 1) * CELL, 0);
+                    }
+                    if (links[k] & %(diagonal)d) {
+                        arrow(dc, (c + 1) * CELL, (r + 1) * CELL, 45);
+                    }
+                }
+            }
+            // The sequences stay along the edges while scrolling.
+            dc.setTransform(1, 0, 0, 1, 0, 0);
+            dc.fillStyle = "white";
+            dc.fillRect(0, 0, canvas.width, CELL);
+            dc.fillRect(0, 0, CELL, canvas.height);
+            dc.fillStyle = "black";
+            for (var c = Math.max(c0, 1); c <= c1; c++) {
+                dc.fillText(m.top.charAt(c - 1),
+                            CELL / 2 + (c + 1) * CELL - x0, CELL * 2 / 3);
+            }
+            for (var r = Math.max(r0, 1); r <= r1; r++) {
+                dc.fillText(m.left.charAt(r - 1), CELL / 2,
+                            CELL * 2 / 3 + (r + 1) * CELL - y0);
+            }
+            drawOverview();
+        }
+        overview.onclick = function(event) {
+            var bounds = overview.getBoundingClientRect();
+            var c = (event.clientX - bounds.left) * m.columns / ow;
+            var r = (event.clientY - bounds.top) * m.rows / oh;
+            view.scrollLeft = (c + 1) * CELL - view.clientWidth / 2;
+            view.scrollTop = (r + 1) * CELL - view.clientHeight / 2;
+        };
+        view.onscroll = draw;
+        draw();
+        };
     </script>
-</head>
+''' % {"cell": CELL, "head": CELL // 6, "tip": CELL // 10, "up": UP,
+       "diagonal": DIAGONAL, "left": LEFT, "moves": UP | DIAGONAL | LEFT}
+BODYTOP = '''</head>
 <body>
     <style type="text/css" media="print">
     .printbutton {{
@@ -69,98 +220,149 @@ BODYTOP = '''        }};
         "class='printbutton' " +
         "value='Print'/>");
     </script>
-    <h2>Dynamic programming table</h2>
 '''
-CANVAS = '  <canvas id="drawingCanvas" width="{0!s}" height="{1!s}"></canvas>'
+TABLE = '    <h2>Dynamic programming table</h2>\n'
+VIEW = '''    <p>{0}</p>
+    <canvas id="overviewCanvas" width="{1!s}" height="{2!s}"
+            style="border: 1px solid black; cursor: crosshair"></canvas>
+    <div style="position: relative; width: {3!s}px; height: {4!s}px">
+        <canvas id="tableCanvas" width="{3!s}" height="{4!s}"
+                style="position: absolute; left: 0; top: 0"></canvas>
+        <div id="tableView" style="position: absolute; left: 0; top: 0;
+             width: {3!s}px; height: {4!s}px; overflow: auto">
+            <div style="width: {5!s}px; height: {6!s}px"></div>
+        </div>
+    </div>
+'''
 BODYBOTTOM = '''</body>
 </html>
 '''
 
-CELL = 40
-
-xmax = ymax = 0
+# Largest sizes, in pixels, of the scrolling table view and the overview.
+VIEW_WIDTH = 960
+VIEW_HEIGHT = 640
+OVERVIEW_SIZE = 200
 
 # Functions
 
-def cell_score(row, col, score):
-    arg = (score, CELL/2 + (col+1) * CELL, CELL*2/3 + CELL * (row + 1))
-    return "dc.fillText('{0!s}',{1!s},{2!s});\n".format(arg[0], arg[1], arg[2])
-
-def cell_left(row, col):
-    arg = ((col+1) * CELL, CELL/3 + CELL * (row + 1))
-    return "arrow(dc,{0!s},{1!s},90);\n".format(arg[0], arg[1])
-
-def cell_top(row, col):
-    arg = (CELL/3 + (col+1) * CELL, CELL * (row + 1))
-    return "arrow(dc,{0!s},{1!s},0);\n".format(arg[0], arg[1])
-
-def cell_diag(row, col):
-    arg = ((col+1) * CELL, CELL * (row + 1))
-    return "arrow(dc,{0!s},{1!s},45);\n".format(arg[0], arg[1])
-
-def draw_cell_grid(f, seq):
-    f.write("dc.beginPath();\n")
-    # Vertical cell lines:
-    for i in range(1, len(seq[0]) + 3):
-        f.write("dc.moveTo({0!s},{1!s});\n".format(i * CELL, CELL))
-        f.write("dc.lineTo({0!s},{1!s});\n".format(i * CELL, CELL * (len(seq[1]) + 2)))
-    # Horizontal cell lines:
-    for i in range(1, len(seq[1]) + 3):
-        f.write("dc.moveTo({0!s},{1!s});\n".format(CELL, i * CELL))
-        f.write("dc.lineTo({0!s},{1!s});\n".format(CELL * (len(seq[0]) + 2), i * CELL))
-    f.write("dc.stroke();\n")
-    # Sequences:
-    for i in range(0, len(seq[0])):
-        arg = (seq[0][i], CELL/2 + (2+i) * CELL, CELL * 2/3)
-        f.write("dc.fillText('{0}',{1!s},{2!s});\n".format(arg[0], arg[1], arg[2]))
-    for i in range(0, len(seq[1])):
-        arg = (seq[1][i], CELL/2, CELL * 2/3 + (i+2) * CELL)
-        f.write("dc.fillText('{0}',{1!s},{2!s});\n".format(arg[0], arg[1], arg[2]))
-
-def cell_fill(f, row, col, sm):
-    links = sm.get_backlinks(row, col)
-    f.write(cell_score(row, col, sm.get_score(row, col)))
-    if links["left"]:
-        f.write(cell_left(row, col))
-    if links["up"]:
-        f.write(cell_top(row, col))
-    if links["diagonal"]:
-        f.write(cell_diag(row, col))
-
-def draw_grid(f, sm):
-    seq = [sm.get_top_sequence(), sm.get_left_sequence()]
-    title = "-".join((seq[0], seq[1]))
-    xmax = CELL * (len(seq[0]) + 2)
-    ymax = CELL * (len(seq[1]) + 2)
-    draw_cell_grid(f, seq)
-    for row in range(0, len(seq[1]) + 1):
-        for col in range(0, len(seq[0]) + 1):
-            cell_fill(f, row, col, sm)
-    return (xmax, ymax)
+def encode_array(typecode, values):
+    '''Returns the values as a base64 string of a little-endian array of the
+    given typecode, which the page decodes into a typed array.'''
+    values = array(typecode, values)
+    if sys.byteorder == "big":
+        values.byteswap()
+    if hasattr(values, "tobytes"):
+        data = values.tobytes()
+    else:
+        data = values.tostring()
+    return base64.b64encode(data).decode("ascii")
+
+def corridor_spans(sm):
+    '''Returns lists (lo, hi) of the first and last columns of each row of a
+    pruned ScoringMatrix which optimal paths may pass through: the cells
+    with backlinks, and the cells they point to. Rows no path passes through
+    have hi < lo.'''
+    rows, columns = sm.get_rows(), sm.get_columns()
+    lo, hi = [columns] * rows, [-1] * rows
+    end_row, end_column = sm.get_end()
+    lo[end_row] = hi[end_row] = end_column
+    for row in range(rows):
+        first = sm.get_band(row)[0]
+        links = sm.get_backlink_row(row)
+        stripped = links.lstrip(b"\0")
+        if not stripped:
+            continue
+        start = first + len(links) - len(stripped)
+        stop = first + len(links.rstrip(b"\0")) - 1
+        # Left moves stay in the row, and up and diagonal moves reach the
+        # row above, at most one column further left.
+        for target in (row, row - 1):
+            if target >= 0:
+                band_first, band_last = sm.get_band(target)
+                lo[target] = min(lo[target], max(band_first, start - 1))
+                hi[target] = max(hi[target], min(band_last, stop))
+    return (lo, hi)
+
+def matrix_data(sm, corridor=False):
+    '''Returns a dictionary holding the scores and backlinks of a
+    ScoringMatrix compactly for the page to draw. If corridor is True, only
+    the cells optimal paths may pass through are included.'''
+    rows = sm.get_rows()
+    if corridor:
+        lo, hi = corridor_spans(sm)
+    else:
+        lo = [sm.get_band(row)[0] for row in range(rows)]
+        hi = [sm.get_band(row)[1] for row in range(rows)]
+    scores = array('i')
+    links = bytearray()
+    for row in range(rows):
+        if hi[row] < lo[row]:
+            continue
+        first = sm.get_band(row)[0]
+        start, stop = lo[row] - first, hi[row] - first + 1
+        scores.extend(sm.get_score_row(row)[start:stop])
+        links.extend(sm.get_backlink_row(row)[start:stop])
+    # Use the smallest integer type which holds every score.
+    score_type = 'i'
+    if scores:
+        for typecode, limit in (('b', 1 << 7), ('h', 1 << 15)):
+            if -limit <= min(scores) and max(scores) < limit:
+                score_type = typecode
+                break
+    return {"rows": rows, "columns": sm.get_columns(),
+            "top": str(sm.get_top_sequence()),
+            "left": str(sm.get_left_sequence()),
+            "lo": encode_array('i', lo), "hi": encode_array('i', hi),
+            "score_type": score_type,
+            "scores": encode_array(score_type, scores),
+            "links": encode_array('B', links)}
+
+def write_table(f, sm, corridor=False):
+    '''Writes the overview and scrolling view of a ScoringMatrix.'''
+    rows, columns = sm.get_rows(), sm.get_columns()
+    width, height = CELL * (columns + 2), CELL * (rows + 2)
+    scale = min(1.0, float(OVERVIEW_SIZE) / max(rows, columns))
+    note = "{0!s} &times; {1!s} cells. Click the overview to jump to a part " \
+           "of the table.".format(rows, columns)
+    if corridor:
+        note += " Only the cells around the optimal alignments are shown."
+    f.write(VIEW.format(note, max(1, int(columns * scale)),
+                        max(1, int(rows * scale)), min(width, VIEW_WIDTH),
+                        min(height, VIEW_HEIGHT), width, height))
 
 def write_alignments(f, alignments):
-    '''Writes the alignmentsfound to the HTML output.'''
-    i = 1
-    while alignments:
-        seq = alignments.pop()
+    '''Writes the alignments found to the HTML output.'''
+    for i, alignment in enumerate(alignments, 1):
         f.write("  <h2>Alignment #{}</h2>\n".format(i))
-        for s in seq:
+        for s in alignment:
             f.write("  <code>{}</code><br />\n".format(s))
-        i += 1
 
 # Main function:
-def write_html(sm, alignments, alignment_is_global=False):
-    '''Puts together the HTML file for the table and alignments.'''
-    seq = [sm.get_top_sequence(), sm.get_left_sequence()]
-    align_type = "Global" if alignment_is_global else "Semi-Global"
-    #title = "-".join((seq[0], seq[1], align_type.lower()))
-    title= "output"
-    filename = title + ".html"
+def write_html(sm, alignments, alignment_is_global=False,
+               alignment_is_local=False, corridor=False,
+               filename="output.html"):
+    '''Puts together the HTML file for the table and alignments, writes it
+    to filename and returns filename.
+
+    If sm is None, as in linear-space mode, only the alignments are written.
+    If corridor is True, only the part of the table around the optimal
+    alignments is included, which keeps the file small for long sequences.'''
+    if alignment_is_local:
+        align_type = "Local"
+    elif alignment_is_global:
+        align_type = "Global"
+    else:
+        align_type = "Semi-Global"
+    title = os.path.splitext(os.path.basename(filename))[0]
     with open(filename, "w") as f:
-        f.write(HEADER.format(title, CELL/6, CELL/10))
-        xmax, ymax = draw_grid(f, sm)
+        f.write(HEADER.format(title))
+        if sm is not None:
+            f.write(DATA.format(json.dumps(matrix_data(sm, corridor))))
+            f.write(RENDERER)
         f.write(BODYTOP.format(align_type))
-        f.write(CANVAS.format(xmax + CELL, ymax + CELL))
+        if sm is not None:
+            f.write(TABLE)
+            write_table(f, sm, corridor)
         write_alignments(f, alignments)
         f.write(BODYBOTTOM)
     return filename
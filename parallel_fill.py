@@ -0,0 +1,167 @@
+# This file is part of sequence-aligner.
+# Copyright (C) 2014 Christopher Kyle Horton <chorton@ltu.edu>
+
+# sequence-aligner is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# sequence-aligner is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with sequence-aligner. If not, see <http://www.gnu.org/licenses/>.
+
+# Filling one large ScoringMatrix on several cores.
+#
+# The matrix is split into square tiles. A tile only depends on the tiles
+# above it, to its left and diagonally above and to its left, so all the
+# tiles along one anti-diagonal can be filled at once, and the anti-diagonals
+# are filled in turn like a wavefront. The scores and backlinks are kept in
+# shared memory while the workers fill it: each tile reads the last row of
+# the tile above and the last column of the tile to its left from there, and
+# writes its own cells back. Each cell is computed exactly as fill_matrix
+# does, so the results are identical.
+
+from __future__ import print_function
+
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+
+from scoring_algorithm import fill_matrix, get_scheme, initialize_edges
+from scoring_matrix import BandedScoringMatrix, MappedArray
+from scoring_matrix import UP, DIAGONAL, LEFT
+
+DEFAULT_TILE_SIZE = 256
+
+# The shared matrix and what every tile needs to fill it, set in each worker
+# process by set_tile_state.
+tile_state = {}
+
+def set_tile_state(state):
+    '''Pool initializer which stores the shared matrix for fill_tile.'''
+    tile_state.update(state)
+
+def fill_tile(tile):
+    '''Fills the cells of the shared matrix from rows r0 to r1 and columns
+    c0 to c1, excluding r1 and c1, given as the tuple (r0, r1, c0, c1). The
+    row above and the column to the left must already be filled.'''
+    r0, r1, c0, c1 = tile
+    columns = tile_state["columns"]
+    scores = tile_state["scores"]
+    backlinks = tile_state["backlinks"]
+    left_codes = tile_state["left_codes"]
+    profiles = tile_state["profiles"]
+    up_gaps = tile_state["up_gaps"]
+    left_gaps = tile_state["left_gaps"]
+    width = c1 - c0
+    start = (r0 - 1) * columns
+    previous = scores[start + c0 - 1:start + c1]
+    for i in range(r0, r1):
+        start = i * columns
+        current = [scores[start + c0 - 1]] + [0] * width
+        links = [0] * width
+        left_gap = left_gaps[i]
+        profile = profiles[left_codes[i - 1]]
+        for k in range(1, width + 1):
+            j = c0 + k - 1
+            score_diagonal = previous[k - 1] + profile[j - 1]
+            score_left = current[k - 1] + left_gap
+            score_up = previous[k] + up_gaps[j]
+            max_score = max(score_diagonal, score_left, score_up)
+            current[k] = max_score
+            bits = 0
+            if max_score == score_diagonal:
+                bits |= DIAGONAL
+            if max_score == score_left:
+                bits |= LEFT
+            if max_score == score_up:
+                bits |= UP
+            links[k - 1] = bits
+        scores[start + c0:start + c1] = current[1:]
+        backlinks[start + c0:start + c1] = links
+        previous = current
+
+def wavefronts(rows, columns, tile_size):
+    '''Returns the list of wavefronts of tiles covering every cell of a
+    matrix of the given size outside its first row and column. Each
+    wavefront is a list of (r0, r1, c0, c1) tiles which only depend on the
+    tiles of earlier wavefronts.'''
+    row_starts = list(range(1, rows, tile_size))
+    column_starts = list(range(1, columns, tile_size))
+    waves = [[] for x in range(len(row_starts) + len(column_starts) - 1)]
+    for a, r0 in enumerate(row_starts):
+        for b, c0 in enumerate(column_starts):
+            waves[a + b].append((r0, min(r0 + tile_size, rows),
+                                 c0, min(c0 + tile_size, columns)))
+    return waves
+
+def fill_matrix_parallel(sm, alignment_is_global=False, scheme=None,
+                         processes=None, tile_size=DEFAULT_TILE_SIZE):
+    '''Fills out a provided ScoringMatrix exactly like fill_matrix, but
+    spreads the work over a pool of processes (one per CPU by default) a
+    wavefront of tile_size by tile_size tiles at a time.
+
+    The whole matrix is held in shared memory while it is filled, so it
+    falls back to fill_matrix for a matrix kept in a scratch directory, as
+    well as for a single process, a banded matrix or a scheme with affine
+    gap scores.'''
+    scheme = get_scheme(scheme)
+    if (processes == 1 or isinstance(sm, BandedScoringMatrix) or
+            isinstance(sm.scores, MappedArray) or scheme.is_affine()):
+        fill_matrix(sm, alignment_is_global, scheme)
+        return
+    initialize_edges(sm, alignment_is_global, scheme)
+    rows, columns = sm.get_rows(), sm.get_columns()
+    scores = RawArray('i', rows * columns)
+    backlinks = RawArray('B', rows * columns)
+    scores[0:columns] = list(sm.get_score_row(0))
+    backlinks[0:columns] = list(sm.get_backlink_row(0))
+    for i in range(1, rows):
+        scores[i * columns] = sm.get_score(i, 0)
+        backlinks[i * columns] = sm.get_backlink_bits(i, 0)
+    left_codes = sm.get_left_sequence().codes()
+    # Gaps in the last row and column are terminal in a semi-global
+    # alignment.
+    up_gaps = [scheme.gap] * columns
+    left_gaps = [scheme.gap] * rows
+    if not alignment_is_global:
+        up_gaps[-1] = left_gaps[-1] = scheme.terminal_gap
+    state = {"columns": columns, "scores": scores, "backlinks": backlinks,
+             "left_codes": left_codes,
+             "profiles": scheme.profiles(left_codes,
+                                         sm.get_top_sequence().codes()),
+             "up_gaps": up_gaps, "left_gaps": left_gaps}
+    pool = multiprocessing.Pool(processes, set_tile_state, (state,))
+    try:
+        for wave in wavefronts(rows, columns, tile_size):
+            pool.map(fill_tile, wave, 1)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    for i in range(1, rows):
+        sm.set_score_row(i, scores[i * columns:(i + 1) * columns])
+        sm.set_backlink_row(i, backlinks[i * columns:(i + 1) * columns])
+    sm.filled = (rows, columns)
+    sm.fill_key = (bool(alignment_is_global), scheme.key())
+
+if __name__ == "__main__":
+    # Unit testing
+    from scoring_matrix import ScoringMatrix
+    assert [len(wave) for wave in wavefronts(10, 7, 4)] == [1, 2, 2, 1]
+    left, top = "GATTACACGTAGGCT" * 3, "GCATGCTACGATTAGCAT" * 3
+    for alignment_is_global in (False, True):
+        serial = ScoringMatrix(left, top)
+        fill_matrix(serial, alignment_is_global)
+        for tile_size in (1, 7, 64):
+            parallel = ScoringMatrix(left, top)
+            fill_matrix_parallel(parallel, alignment_is_global, None, 3,
+                                 tile_size)
+            assert parallel.scores == serial.scores
+            assert parallel.backlinks == serial.backlinks
+    print("All parallel fill tests passed.")
@@ -19,100 +19,1034 @@
 # Christopher Kyle Horton (000516274), chorton@ltu.edu
 # Last modified: 11/6/2014
 
-from scoring_matrix import ScoringMatrix
+from itertools import islice
+
+from alignment import from_moves
+from bit_parallel import bit_parallel_score, supports_scheme
+from encoded_sequence import encode
+from scoring_matrix import ScoringMatrix, BandedScoringMatrix
+from scoring_matrix import UP, DIAGONAL, LEFT
+from scoring_matrix import UP_OPEN, UP_EXTEND, LEFT_OPEN, LEFT_EXTEND
+from scoring_scheme import ScoringScheme, import_numpy
+from stats import timed
 
 match_score = 1
 gap_score = -1
 mismatch_score = 0
 terminal_gap_score = 0
 
-def initialize_edges(sm, alignment_is_global=False):
+# A score low enough that no path through an impossible gap is ever chosen.
+UNREACHABLE = -(1 << 30)
+
+# The ScoringScheme built from the scores above by get_scheme.
+default_scheme = None
+
+def get_scheme(scheme=None):
+    '''Returns the given ScoringScheme, or if it is None, a scheme using the
+    match_score, mismatch_score, gap_score and terminal_gap_score of this
+    module. The default scheme is only rebuilt when those scores change.'''
+    global default_scheme
+    if scheme is not None:
+        return scheme
+    scores = (match_score, mismatch_score, gap_score, terminal_gap_score)
+    if default_scheme is None or default_scheme.key()[:4] != scores:
+        default_scheme = ScoringScheme(*scores)
+    return default_scheme
+
+def initialize_edges(sm, alignment_is_global=False, scheme=None,
+                     first_row=1, first_column=1):
     '''Sets up the top and left edges of the provided ScoringMatrix. This is
     the first step in the dynamic programming algorithm.
 
     Performs a semi-global alignment by default unless alignment_is_global is
-    specified to be True.
+    specified to be True. Only the left edge from first_row down and the top
+    edge from first_column on are set, if given, as for a matrix whose edges
+    were set before it was extended.
     Based on pseudocode provided on page 54 of our textbook.'''
+    scheme = get_scheme(scheme)
     sm.set_score(0, 0, 0)
-    gap = gap_score if alignment_is_global else terminal_gap_score
-    for i in range(1, sm.get_rows()):
-        sm.set_score(i, 0, sm.get_score(i - 1, 0) + gap)
+    if alignment_is_global:
+        gap, edge = scheme.gap, scheme.gap_open
+    else:
+        gap, edge = scheme.terminal_gap, 0
+    for i in range(first_row, sm.get_rows()):
+        sm.set_score(i, 0, edge + i * gap)
         sm.add_up_backlink(i, 0)
-    for i in range(1, sm.get_columns()):
-        sm.set_score(0, i, sm.get_score(0, i - 1) + gap)
+    for i in range(first_column, sm.get_columns()):
+        sm.set_score(0, i, edge + i * gap)
         sm.add_left_backlink(0, i)
 
-def fill_matrix(sm, alignment_is_global=False):
+def fill_matrix(sm, alignment_is_global=False, scheme=None):
     '''Uses dynamic programming to fill out a provided ScoringMatrix after
     the edges have been initialized.
 
     Performs a semi-global alignment by default unless alignment_is_global is
-    specified to be True.
+    specified to be True. Scores come from the given ScoringScheme, or from
+    get_scheme if it is omitted; schemes with affine gaps are handed to
+    fill_affine_matrix.
+
+    If the matrix was last filled by this function with the same options
+    and then grown with extend_top or extend_left, only the new cells are
+    filled, along with the old last row and column in a semi-global
+    alignment, as their gaps are no longer terminal. Any other fill, and
+    prune_backlinks, which loses backlinks the new cells may lead back to,
+    make the next fill start from scratch.
     Based on pseudocode provided on page 54 of our textbook.'''
-    initialize_edges(sm, alignment_is_global)
-    for i in range(1, sm.get_rows()):
-        for j in range(1, sm.get_columns()):
+    scheme = get_scheme(scheme)
+    if scheme.is_affine():
+        sm.fill_key = None
+        fill_affine_matrix(sm, alignment_is_global, scheme)
+        return
+    if isinstance(sm, BandedScoringMatrix):
+        sm.fill_key = None
+        fill_banded_matrix(sm, alignment_is_global, scheme)
+        return
+    fill_key = (bool(alignment_is_global), scheme.key())
+    first_row = first_column = 1
+    if sm.fill_key == fill_key:
+        first_row, first_column = sm.filled
+        if not alignment_is_global:
+            first_row, first_column = first_row - 1, first_column - 1
+        first_row, first_column = max(first_row, 1), max(first_column, 1)
+    initialize_edges(sm, alignment_is_global, scheme, first_row, first_column)
+    left_codes = sm.get_left_sequence().codes()
+    profiles = scheme.profiles(left_codes, sm.get_top_sequence().codes())
+    rows, columns = sm.get_rows(), sm.get_columns()
+    # Gaps in the last column are terminal in a semi-global alignment.
+    up_gaps = [scheme.gap] * columns
+    if not alignment_is_global:
+        up_gaps[-1] = scheme.terminal_gap
+    # Rows filled before are only read and written from the column before
+    # the first new one, at offset first in the row lists below.
+    first = first_column - 1 if first_row > 1 else 0
+    previous = sm.get_score_row(0, first)
+    for i in range(1, rows):
+        if i == first_row and first:
+            first = 0
+            previous = sm.get_score_row(i - 1)
+        current = sm.get_score_row(i, first)
+        links = sm.get_backlink_row(i, first)
+        if i == rows - 1 and not alignment_is_global:
+            left_gap = scheme.terminal_gap
+        else:
+            left_gap = scheme.gap
+        profile = profiles[left_codes[i - 1]]
+        for j in range(first_column if i < first_row else 1, columns):
             # Calculate scores
-            score_diagonal = 0
-            if sm.match(i, j):
-                score_diagonal = sm.get_score(i - 1, j - 1) + match_score
-            else:
-                score_diagonal = sm.get_score(i - 1, j - 1) + mismatch_score
-            if (i == 0 or i == sm.get_rows() - 1) and not alignment_is_global:
-                score_left = sm.get_score(i, j - 1) + terminal_gap_score
-            else:
-                score_left = sm.get_score(i, j - 1) + gap_score
-            if (j == 0 or j == sm.get_columns() - 1) and not alignment_is_global:
-                score_up = sm.get_score(i - 1, j) + terminal_gap_score
-            else:
-                score_up = sm.get_score(i - 1, j) + gap_score
+            k = j - first
+            score_diagonal = previous[k - 1] + profile[j - 1]
+            score_left = current[k - 1] + left_gap
+            score_up = previous[k] + up_gaps[j]
             max_score = max(score_diagonal, score_left, score_up)
-            sm.set_score(i, j, max_score)
+            current[k] = max_score
             # Establish backlink(s)
+            bits = 0
             if max_score == score_diagonal:
-                sm.add_diagonal_backlink(i, j)
+                bits |= DIAGONAL
             if max_score == score_left:
-                sm.add_left_backlink(i, j)
+                bits |= LEFT
             if max_score == score_up:
-                sm.add_up_backlink(i, j)
+                bits |= UP
+            links[k] = bits
+        sm.set_score_row(i, current, first)
+        sm.set_backlink_row(i, links, first)
+        previous = current
+    sm.filled = (rows, columns)
+    sm.fill_key = fill_key
+
+def fill_banded_matrix(sm, alignment_is_global=False, scheme=None):
+    '''Fills out a provided BandedScoringMatrix like fill_matrix, treating
+    the cells outside its band as unreachable. Only supports schemes with
+    linear gap scores.'''
+    scheme = get_scheme(scheme)
+    left_codes = sm.get_left_sequence().codes()
+    profiles = scheme.profiles(left_codes, sm.get_top_sequence().codes())
+    rows, columns = sm.get_rows(), sm.get_columns()
+    row_gaps = edge_gap_scores(rows - 1, alignment_is_global, scheme)
+    column_gaps = edge_gap_scores(columns - 1, alignment_is_global, scheme)
+    first, last = sm.get_band(0)
+    previous = [0] * (last + 1)
+    links = bytearray([LEFT]) * (last + 1)
+    links[0] = 0
+    for j in range(1, last + 1):
+        previous[j] = previous[j - 1] + row_gaps[0]
+    sm.set_score_row(0, previous)
+    sm.set_backlink_row(0, links)
+    previous_first, previous_last = first, last
+    for i in range(1, rows):
+        first, last = sm.get_band(i)
+        left_gap = row_gaps[i]
+        profile = profiles[left_codes[i - 1]]
+        current = []
+        links = bytearray(last - first + 1)
+        for j in range(first, last + 1):
+            scores = []
+            if j > 0 and previous_first < j <= previous_last + 1:
+                score = previous[j - 1 - previous_first] + profile[j - 1]
+                scores.append((score, DIAGONAL))
+            if j > first:
+                scores.append((current[-1] + left_gap, LEFT))
+            if j <= previous_last:
+                scores.append((previous[j - previous_first] + column_gaps[j],
+                               UP))
+            max_score = max(scores)[0]
+            bits = 0
+            for score, link in scores:
+                if score == max_score:
+                    bits |= link
+            current.append(max_score)
+            links[j - first] = bits
+        sm.set_score_row(i, current)
+        sm.set_backlink_row(i, links)
+        previous, previous_first, previous_last = current, first, last
 
-def get_alignments(sm, alignment_is_global=False):
-    '''Returns a list of the alignments generated from the scoring matrix.
+def fill_affine_matrix(sm, alignment_is_global=False, scheme=None):
+    '''Fills out a provided ScoringMatrix or BandedScoringMatrix like
+    fill_matrix, for a scheme with affine gap scores.
+
+    Uses Gotoh's three layers: besides the best score of each cell, the best
+    scores of paths ending there in a horizontal gap and in a vertical gap
+    are kept, for the current row and the row above only. The backlinks of
+    each cell record which layers its score came from, and how the gaps
+    ending there were reached. Terminal gaps of a semi-global alignment are
+    never opened, so they keep their linear scores.'''
+    scheme = get_scheme(scheme)
+    left_codes = sm.get_left_sequence().codes()
+    profiles = scheme.profiles(left_codes, sm.get_top_sequence().codes())
+    rows, columns = sm.get_rows(), sm.get_columns()
+    terminal = not alignment_is_global
+    extend = scheme.gap
+    open_gap = scheme.gap_open + extend
+    terminal_gap = scheme.terminal_gap
+    first, last = sm.get_band(0)
+    previous = [0] * (last + 1)
+    links = bytearray([LEFT]) * (last + 1)
+    links[0] = 0
+    for j in range(1, last + 1):
+        if terminal:
+            previous[j] = j * terminal_gap
+        else:
+            previous[j] = scheme.gap_open + j * extend
+    sm.set_score_row(0, previous)
+    sm.set_backlink_row(0, links)
+    # The best scores of paths ending in a vertical gap in the row above.
+    previous_gaps = [UNREACHABLE] * (last + 1)
+    previous_first, previous_last = first, last
+    for i in range(1, rows):
+        first, last = sm.get_band(i)
+        profile = profiles[left_codes[i - 1]]
+        terminal_row = terminal and i == rows - 1
+        current, gaps = [], []
+        links = bytearray(last - first + 1)
+        horizontal = UNREACHABLE
+        for j in range(first, last + 1):
+            bits = 0
+            # Vertical gap layer
+            if previous_first <= j <= previous_last:
+                above = previous[j - previous_first]
+                if terminal and (j == 0 or j == columns - 1):
+                    vertical = above + terminal_gap
+                else:
+                    opened = above + open_gap
+                    extended = previous_gaps[j - previous_first] + extend
+                    vertical = max(opened, extended)
+                    if vertical == opened:
+                        bits |= UP_OPEN
+                    if vertical == extended:
+                        bits |= UP_EXTEND
+            else:
+                vertical = UNREACHABLE
+            # Horizontal gap layer
+            if j > first:
+                if terminal_row:
+                    horizontal = current[-1] + terminal_gap
+                else:
+                    opened = current[-1] + open_gap
+                    extended = horizontal + extend
+                    horizontal = max(opened, extended)
+                    if horizontal == opened:
+                        bits |= LEFT_OPEN
+                    if horizontal == extended:
+                        bits |= LEFT_EXTEND
+            else:
+                horizontal = UNREACHABLE
+            # Best score
+            if j > 0 and previous_first < j <= previous_last + 1:
+                score_diagonal = (previous[j - 1 - previous_first] +
+                                  profile[j - 1])
+            else:
+                score_diagonal = UNREACHABLE
+            max_score = max(score_diagonal, horizontal, vertical)
+            if max_score == score_diagonal:
+                bits |= DIAGONAL
+            if max_score == horizontal:
+                bits |= LEFT
+            if max_score == vertical:
+                bits |= UP
+            current.append(max_score)
+            gaps.append(vertical)
+            links[j - first] = bits
+        sm.set_score_row(i, current)
+        sm.set_backlink_row(i, links)
+        previous, previous_gaps = current, gaps
+        previous_first, previous_last = first, last
+
+def fill_local_matrix(sm, scheme=None, x_drop=None):
+    '''Fills out a provided ScoringMatrix for a local (Smith-Waterman)
+    alignment, with linear or affine gap scores. No score falls below 0, and
+    cells scoring 0 have no backlinks since an alignment may start there.
+    The end of the matrix is set to the first cell, in row-major order, with
+    the best score.
+
+    If x_drop is given, cells scoring more than x_drop below the best score
+    found so far are dropped: they are left at 0 without backlinks, and no
+    path continues through them. Each row is only computed from the first
+    column a path through the live cells of the row above can reach, up to
+    the last one, and the fill stops once a row has no live cells, so large
+    unrelated parts of the matrix are skipped. Like any X-drop extension
+    this is a heuristic, which misses alignments whose score dips by more
+    than x_drop before recovering.'''
+    if isinstance(sm, BandedScoringMatrix):
+        raise ValueError("local alignment needs a full ScoringMatrix")
+    sm.fill_key = None
+    scheme = get_scheme(scheme)
+    left_codes = sm.get_left_sequence().codes()
+    profiles = scheme.profiles(left_codes, sm.get_top_sequence().codes())
+    rows, columns = sm.get_rows(), sm.get_columns()
+    affine = scheme.is_affine()
+    extend = scheme.gap
+    open_gap = scheme.gap_open + extend
+    sm.set_score_row(0, [0] * columns)
+    sm.set_backlink_row(0, bytearray(columns))
+    best, end = 0, (0, 0)
+    # Scores of the row above, and of paths ending there in a vertical gap,
+    # are UNREACHABLE wherever cells were dropped or not computed.
+    previous = [0] * columns
+    previous_gaps = [UNREACHABLE] * columns
+    first, last = 0, columns - 1
+    for i in range(1, rows):
+        profile = profiles[left_codes[i - 1]]
+        current = [UNREACHABLE] * columns
+        gaps = [UNREACHABLE] * columns
+        scores = [0] * columns
+        links = bytearray(columns)
+        horizontal = UNREACHABLE
+        live_first, live_last = columns, -1
+        for j in range(first, columns):
+            bits = 0
+            # Vertical gap layer
+            if affine:
+                opened = previous[j] + open_gap
+                extended = previous_gaps[j] + extend
+                vertical = max(opened, extended)
+                if vertical == opened:
+                    bits |= UP_OPEN
+                if vertical == extended:
+                    bits |= UP_EXTEND
+            else:
+                vertical = previous[j] + extend
+            # Horizontal gap layer
+            if j > 0:
+                if affine:
+                    opened = current[j - 1] + open_gap
+                    extended = horizontal + extend
+                    horizontal = max(opened, extended)
+                    if horizontal == opened:
+                        bits |= LEFT_OPEN
+                    if horizontal == extended:
+                        bits |= LEFT_EXTEND
+                else:
+                    horizontal = current[j - 1] + extend
+                score_diagonal = previous[j - 1] + profile[j - 1]
+            else:
+                score_diagonal = UNREACHABLE
+            max_score = max(score_diagonal, horizontal, vertical)
+            if max_score > 0:
+                if max_score == score_diagonal:
+                    bits |= DIAGONAL
+                if max_score == horizontal:
+                    bits |= LEFT
+                if max_score == vertical:
+                    bits |= UP
+            else:
+                max_score = 0
+                bits &= ~(UP | DIAGONAL | LEFT)
+            if x_drop is not None and max_score < best - x_drop:
+                # Dropped. Nothing to the right is reachable past the row
+                # above's live cells unless this cell is live.
+                horizontal = UNREACHABLE
+                if j > last:
+                    break
+                continue
+            if max_score > best:
+                best, end = max_score, (i, j)
+            current[j] = scores[j] = max_score
+            gaps[j] = vertical
+            links[j] = bits
+            if live_first == columns:
+                live_first = j
+            live_last = j
+        sm.set_score_row(i, scores)
+        sm.set_backlink_row(i, links)
+        if live_first > live_last:
+            break
+        previous, previous_gaps = current, gaps
+        first, last = live_first, live_last
+    sm.set_end(*end)
+
+def fill_matrix_vectorized(sm, alignment_is_global=False, scheme=None):
+    '''Fills out a provided ScoringMatrix like fill_matrix, but computes a
+    whole row at a time with NumPy array operations.
+
+    The diagonal and up candidates of a row only depend on the previous row.
+    The left dependency is resolved with a prefix-max pass, since with a
+    constant gap score g the recurrence H[j] = max(B[j], H[j-1] + g) unrolls
+    to H[j] = j*g + max(B[k] - k*g for k <= j). The resulting scores and
+    backlinks are identical to those of fill_matrix.
+
+    Falls back to fill_matrix if NumPy is not installed, the matrix is
+    banded or the scheme has affine gap scores.'''
+    scheme = get_scheme(scheme)
+    numpy = import_numpy()
+    if (numpy is None or isinstance(sm, BandedScoringMatrix) or
+            scheme.is_affine()):
+        fill_matrix(sm, alignment_is_global, scheme)
+        return
+    sm.fill_key = None
+    initialize_edges(sm, alignment_is_global, scheme)
+    left_codes = sm.get_left_sequence().codes()
+    rows, columns = sm.get_rows(), sm.get_columns()
+    profile = scheme.profile_arrays(left_codes, sm.get_top_sequence().codes())
+    up_gaps = numpy.full(columns - 1, scheme.gap, dtype=numpy.int64)
+    if not alignment_is_global and columns > 1:
+        up_gaps[-1] = scheme.terminal_gap
+    steps = numpy.arange(columns, dtype=numpy.int64)
+    previous = numpy.array(sm.get_score_row(0), dtype=numpy.int64)
+    for i in range(1, rows):
+        if i == rows - 1 and not alignment_is_global:
+            left_gap = scheme.terminal_gap
+        else:
+            left_gap = scheme.gap
+        score_diagonal = previous[:-1] + profile[left_codes[i - 1]]
+        score_up = previous[1:] + up_gaps
+        best = numpy.empty(columns, dtype=numpy.int64)
+        best[0] = sm.get_score(i, 0)
+        numpy.maximum(score_diagonal, score_up, out=best[1:])
+        offsets = steps * left_gap
+        current = numpy.maximum.accumulate(best - offsets) + offsets
+        max_score = current[1:]
+        bits = numpy.where(max_score == score_diagonal, DIAGONAL, 0)
+        bits |= numpy.where(max_score == current[:-1] + left_gap, LEFT, 0)
+        bits |= numpy.where(max_score == score_up, UP, 0)
+        links = sm.get_backlink_row(i)
+        links[1:] = bits.astype(numpy.uint8).tobytes()
+        sm.set_score_row(i, current.tolist())
+        sm.set_backlink_row(i, links)
+        previous = current
+
+def gap_links(bits, opened, extended):
+    '''Returns the opened and extended bits of a cell's backlinks, treating a
+    cell with neither as one where the gap was opened.'''
+    return bits & (opened | extended) or opened
+
+def prune_backlinks(sm):
+    '''Removes the backlinks of every cell that no optimal path from the end
+    of the matrix (the lower right corner, unless it was set otherwise)
+    passes through.
+
+    Backlinks always point up or left, so a single sweep from the bottom row
+    upwards, keeping two rows of reachability flags, finds every cell that can
+    be reached from the end. Paths ending in a gap are followed separately,
+    so the gap bits of a cell are only kept if its gap is on an optimal path.'''
+    sm.fill_key = None
+    rows, columns = sm.get_rows(), sm.get_columns()
+    end_row, end_column = sm.get_end()
+    reachable = bytearray(columns)
+    vertical = bytearray(columns)
+    for row in range(rows - 1, -1, -1):
+        if row == end_row:
+            reachable[end_column] = 1
+        first, last = sm.get_band(row)
+        links = sm.get_backlink_row(row)
+        above = bytearray(columns)
+        above_vertical = bytearray(columns)
+        horizontal = False
+        for col in range(last, first - 1, -1):
+            bits = links[col - first]
+            kept = 0
+            if reachable[col]:
+                kept |= bits & (UP | DIAGONAL | LEFT)
+                if bits & LEFT:
+                    horizontal = True
+                if bits & UP:
+                    vertical[col] = 1
+                if bits & DIAGONAL:
+                    above[col - 1] = 1
+            if horizontal:
+                kept |= bits & (LEFT_OPEN | LEFT_EXTEND)
+                left_links = gap_links(bits, LEFT_OPEN, LEFT_EXTEND)
+                if left_links & LEFT_OPEN:
+                    reachable[col - 1] = 1
+                horizontal = bool(left_links & LEFT_EXTEND)
+            if vertical[col]:
+                kept |= bits & (UP_OPEN | UP_EXTEND)
+                up_links = gap_links(bits, UP_OPEN, UP_EXTEND)
+                if up_links & UP_OPEN:
+                    above[col] = 1
+                if up_links & UP_EXTEND:
+                    above_vertical[col] = 1
+            links[col - first] = kept
+        sm.set_backlink_row(row, links)
+        reachable, vertical = above, above_vertical
+
+def count_alignments(sm):
+    '''Returns the number of optimal alignments in a filled ScoringMatrix,
+    that is, the number of backlink paths from the end of the matrix to a
+    cell without backlinks. Only two rows of path counts are kept, so nothing
+    is enumerated.
+
+    The paths ending in a horizontal or vertical gap at each cell are counted
+    apart from the rest, as they continue differently with affine gaps.'''
+    end_row, end_column = sm.get_end()
+    previous, previous_gaps, previous_first = None, None, 0
+    for row in range(end_row + 1):
+        first, last = sm.get_band(row)
+        links = sm.get_backlink_row(row)
+        current = [0] * (last - first + 1)
+        gaps = [0] * (last - first + 1)
+        horizontal = 0
+        for col in range(first, last + 1):
+            bits = links[col - first]
+            extended = horizontal
+            horizontal = 0
+            if bits & (LEFT | LEFT_OPEN | LEFT_EXTEND):
+                left_links = gap_links(bits, LEFT_OPEN, LEFT_EXTEND)
+                if left_links & LEFT_OPEN:
+                    horizontal += current[col - 1 - first]
+                if left_links & LEFT_EXTEND:
+                    horizontal += extended
+            if bits & (UP | UP_OPEN | UP_EXTEND):
+                up_links = gap_links(bits, UP_OPEN, UP_EXTEND)
+                if up_links & UP_OPEN:
+                    gaps[col - first] += previous[col - previous_first]
+                if up_links & UP_EXTEND:
+                    gaps[col - first] += previous_gaps[col - previous_first]
+            if not bits & (UP | DIAGONAL | LEFT):
+                current[col - first] = 1
+                continue
+            paths = 0
+            if bits & DIAGONAL:
+                paths += previous[col - 1 - previous_first]
+            if bits & UP:
+                paths += gaps[col - first]
+            if bits & LEFT:
+                paths += horizontal
+            current[col - first] = paths
+        previous, previous_gaps, previous_first = current, gaps, first
+    return previous[end_column - previous_first]
+
+def iter_moves(path):
+    '''Yields the moves of a path built by iter_alignments, in order.'''
+    while path is not None:
+        move, path = path
+        yield move
+
+def iter_alignments(sm, stats=None):
+    '''Yields the alignments of a filled ScoringMatrix one at a time, as
+    Alignment objects in the order get_alignments returns them. The number
+    of traceback branches explored is added to the traceback_branches
+    counter of stats, if given.
+
+    Each pending branch shares the tail of its path with its siblings as a
+    linked list of moves, so nothing is built until an alignment is
+    complete.'''
+    top_codes = sm.get_top_sequence().codes()
+    left_codes = sm.get_left_sequence().codes()
+    # Entry (row,col,gap,path), where gap is LEFT or UP while following the
+    # backlinks of a gap ending at the cell, and 0 otherwise.
+    end_row, end_column = sm.get_end()
+    score = sm.get_score(end_row, end_column)
+    todo_list = [(end_row, end_column, 0, None)]
+    branches = 0
+    while todo_list:
+        row, col, gap, path = todo_list.pop()
+        branches += 1
+        backlinks = sm.get_backlink_bits(row, col)
+        # Branches are pushed last-first, so that diagonal moves are
+        # followed before gaps and the alignments come out in the order
+        # they have always been shown in.
+        if gap == LEFT:
+            left_links = gap_links(backlinks, LEFT_OPEN, LEFT_EXTEND)
+            if left_links & LEFT_EXTEND:
+                todo_list.append((row, col - 1, LEFT, ("L", path)))
+            if left_links & LEFT_OPEN:
+                todo_list.append((row, col - 1, 0, ("L", path)))
+        elif gap == UP:
+            up_links = gap_links(backlinks, UP_OPEN, UP_EXTEND)
+            if up_links & UP_EXTEND:
+                todo_list.append((row - 1, col, UP, ("U", path)))
+            if up_links & UP_OPEN:
+                todo_list.append((row - 1, col, 0, ("U", path)))
+        elif backlinks & (UP | DIAGONAL | LEFT): # If some back-link exists.
+            if backlinks & LEFT:
+                todo_list.append((row, col, LEFT, path))
+            if backlinks & UP:
+                todo_list.append((row, col, UP, path))
+            if backlinks & DIAGONAL:
+                todo_list.append((row - 1, col - 1, 0, ("D", path)))
+        else:
+            if stats is not None:
+                stats.add("traceback_branches", branches)
+                branches = 0
+            yield from_moves(left_codes, top_codes, iter_moves(path), row,
+                             col, score)
+    if stats is not None:
+        stats.add("traceback_branches", branches)
+
+def get_alignments(sm, alignment_is_global=False, vectorized=False,
+                   max_alignments=None, scheme=None, alignment_is_local=False,
+                   x_drop=None, stats=None, jobs=None, tile_size=None):
+    '''Returns a list of the alignments generated from the scoring matrix, as
+    alignment.Alignment objects.
 
     Performs a semi-global alignment by default unless alignment_is_global is
-    specified to be True.
+    specified to be True. If vectorized is True, the matrix is filled with
+    fill_matrix_vectorized instead of fill_matrix. At most max_alignments
+    alignments are returned if it is given; count_alignments gives the total.
+    Scores come from the given ScoringScheme, or from get_scheme if it is
+    omitted.
+
+    If alignment_is_local is True, a local alignment is performed instead
+    with fill_local_matrix, passing it x_drop, and only the aligned parts of
+    the sequences are returned.
+    Backlinks not on any optimal path are removed from the matrix.
+    If jobs is given, a global or semi-global matrix is filled by jobs
+    processes with parallel_fill.fill_matrix_parallel, in tiles of
+    tile_size cells square if it is given.
+    If a Stats object is given, the fill, prune and traceback phases are
+    timed and the cells filled counted in it.
     Port of code from global-grid2.rb.'''
-    fill_matrix(sm, alignment_is_global)
-    # Find the optimal alignment paths starting from the lower right corner.
-    seq = (sm.get_top_sequence(), sm.get_left_sequence())
-    last_col = len(seq[0])
-    last_row = len(seq[1])
-    todo_list = [[last_row,last_col,"",""]] # Entry (row,col,string0,string1)
-    done_list = [] # Entry (str0,str1)
-    backlink_used = [[False for x in range(len(seq[0]) + 1)]
-                      for x in range(len(seq[1]) + 1)]
-    while todo_list:
-        row, col, str0, str1 = todo_list.pop()
-        backlinks = sm.get_backlinks(row, col)
-        if True in backlinks.values(): # If some back-link exists.
-            backlink_used[row][col] = True # Mark linked cells as used as we go.
-            if backlinks["diagonal"]:
-                todo_list.append([row - 1, col - 1, seq[0][col - 1] + str0,
-                                 seq[1][row - 1] + str1])
-            if backlinks["up"]:
-                todo_list.append([row - 1, col, '_' + str0,
-                                 seq[1][row - 1] + str1])
-            if backlinks["left"]:
-                todo_list.append([row, col - 1, seq[0][col - 1] + str0,
-                                 '_' + str1])
+    fill_pruned_matrix(sm, alignment_is_global, vectorized, scheme,
+                       alignment_is_local, x_drop, stats, jobs, tile_size)
+    with timed(stats, "traceback"):
+        return list(islice(iter_alignments(sm, stats), max_alignments))
+
+def fill_pruned_matrix(sm, alignment_is_global=False, vectorized=False,
+                       scheme=None, alignment_is_local=False, x_drop=None,
+                       stats=None, jobs=None, tile_size=None):
+    '''Fills a ScoringMatrix and removes the backlinks not on any optimal
+    path, as get_alignments does before its traceback, with the same
+    options.'''
+    with timed(stats, "fill"):
+        if alignment_is_local:
+            fill_local_matrix(sm, scheme, x_drop)
+        elif vectorized:
+            fill_matrix_vectorized(sm, alignment_is_global, scheme)
+        elif jobs is not None:
+            from parallel_fill import DEFAULT_TILE_SIZE, fill_matrix_parallel
+            fill_matrix_parallel(sm, alignment_is_global, scheme, jobs,
+                                 tile_size or DEFAULT_TILE_SIZE)
         else:
-            done_list.append([str0,str1])
-    # Clean up unused backlinks
-    for row in range(len(seq[1]) + 1):
-        for col in range(len(seq[0]) + 1):
-            if not backlink_used[row][col]:
-                sm.remove_backlinks(row, col)
-    return done_list
+            fill_matrix(sm, alignment_is_global, scheme)
+    if stats is not None:
+        stats.add("cells", sm.get_size())
+    with timed(stats, "prune"):
+        prune_backlinks(sm)
+
+def realign(sm, alignment_is_global=False, max_alignments=None, scheme=None,
+            stats=None):
+    '''Returns the alignments of a ScoringMatrix like get_alignments, but
+    leaves its backlinks unpruned, so that the matrix can be grown with
+    extend_top or extend_left and realigned again. Each call only fills the
+    cells added since the last one, as described for fill_matrix, so a
+    growing sequence costs little more than the traceback each time.
+
+    Performs a semi-global alignment by default unless alignment_is_global
+    is specified to be True. Schemes with affine gap scores fill the whole
+    matrix every time.'''
+    with timed(stats, "fill"):
+        fill_matrix(sm, alignment_is_global, scheme)
+    with timed(stats, "traceback"):
+        return list(islice(iter_alignments(sm, stats), max_alignments))
+
+def touches_band_edge(sm):
+    '''Returns True iff an optimal path through a banded ScoringMatrix, after
+    its unused backlinks have been removed, runs along the edge of its band
+    anywhere other than the edge of the matrix itself.'''
+    last_column = sm.get_columns() - 1
+    for row in range(sm.get_rows()):
+        first, last = sm.get_band(row)
+        links = sm.get_backlink_row(row)
+        if (first > 0 and links[0]) or (last < last_column and links[-1]):
+            return True
+    return False
+
+def get_banded_alignments(sequence1, sequence2, band, alignment_is_global=False,
+                          max_alignments=None, scheme=None, stats=None):
+    '''Returns a tuple (sm, alignments) where sm is a BandedScoringMatrix for
+    sequence1 (the left sequence) and sequence2 (the top sequence) and
+    alignments is as returned by get_alignments.
+
+    Only cells within band columns of a diagonal are computed. In a global
+    alignment this is the diagonal from corner to corner. In a semi-global
+    one it is the diagonal along which seed_extend.best_diagonal finds the
+    most k-mer matches, so that the band can stay narrow around a query lying
+    anywhere inside a longer sequence, falling back to the corner-to-corner
+    diagonal if there are no matches. Whenever an optimal path touches the
+    edge of the band, a better one may lie outside it, so the band width is
+    doubled and the alignment repeated. This is a heuristic: a better path
+    can also lie outside a band which no path in it touches, so the
+    alignments aren't guaranteed to be optimal. Every attempt is recorded in
+    stats, if given, as by get_alignments.
+
+    Narrow bands can hold a vast number of equally good paths, so each
+    attempt is only filled and pruned, and the alignments are traced back
+    from the band which is kept.'''
+    offset = None
+    if not alignment_is_global:
+        from seed_extend import best_diagonal
+        with timed(stats, "seed"):
+            offset = best_diagonal(sequence1, sequence2)
+    while True:
+        with timed(stats, "allocate"):
+            sm = BandedScoringMatrix(sequence1, sequence2, band, offset)
+        fill_pruned_matrix(sm, alignment_is_global, scheme=scheme,
+                           stats=stats)
+        if sm.covers_matrix() or not touches_band_edge(sm):
+            break
+        band = max(1, sm.band * 2)
+    with timed(stats, "traceback"):
+        return (sm, list(islice(iter_alignments(sm, stats), max_alignments)))
+
+def edge_gap_scores(length, alignment_is_global=False, scheme=None):
+    '''Returns the gap score for a move along each of the length + 1 rows (or
+    columns) of a matrix whose edge sequence has the given length, for a
+    scheme with linear gap scores.
+
+    In a semi-global alignment, moves along the first and last row or column
+    are terminal gaps.'''
+    scheme = get_scheme(scheme)
+    gaps = [scheme.gap] * (length + 1)
+    if not alignment_is_global:
+        gaps[0] = gaps[-1] = scheme.terminal_gap
+    return gaps
+
+def forward_scores(left, profiles, r0, r1, c0, c1, row_gaps, column_gaps):
+    '''Returns the best scores of paths from (r0, c0) to every cell of row r1
+    between columns c0 and c1, keeping only one row in memory.
+
+    left holds the codes of the left sequence, and profiles is as returned by
+    ScoringScheme.profiles.'''
+    up_gaps = column_gaps[c0:c1 + 1]
+    previous = [0]
+    for k in range(1, c1 - c0 + 1):
+        previous.append(previous[k - 1] + row_gaps[r0])
+    for i in range(r0 + 1, r1 + 1):
+        left_gap = row_gaps[i]
+        profile = profiles[left[i - 1]]
+        current = [previous[0] + up_gaps[0]]
+        for k in range(1, c1 - c0 + 1):
+            score_diagonal = previous[k - 1] + profile[c0 + k - 1]
+            current.append(max(score_diagonal, current[k - 1] + left_gap,
+                               previous[k] + up_gaps[k]))
+        previous = current
+    return previous
+
+def backward_scores(left, profiles, r0, r1, c0, c1, row_gaps, column_gaps):
+    '''Returns the best scores of paths from every cell of row r0 between
+    columns c0 and c1 to (r1, c1), keeping only one row in memory.'''
+    up_gaps = column_gaps[c0:c1 + 1]
+    width = c1 - c0
+    previous = [0] * (width + 1)
+    for k in range(width - 1, -1, -1):
+        previous[k] = previous[k + 1] + row_gaps[r1]
+    for i in range(r1 - 1, r0 - 1, -1):
+        left_gap = row_gaps[i]
+        profile = profiles[left[i]]
+        current = [0] * (width + 1)
+        current[width] = previous[width] + up_gaps[width]
+        for k in range(width - 1, -1, -1):
+            score_diagonal = previous[k + 1] + profile[c0 + k]
+            current[k] = max(score_diagonal, current[k + 1] + left_gap,
+                             previous[k] + up_gaps[k])
+        previous = current
+    return previous
+
+def align_small_region(left, profiles, r0, r1, c0, c1, row_gaps, column_gaps,
+                       ops):
+    '''Appends the moves of an optimal path from (r0, c0) to (r1, c1) to
+    ops, using a full table. Only used for regions of at most two rows.'''
+    width = c1 - c0 + 1
+    scores = [[0] * width for x in range(r1 - r0 + 1)]
+    moves = [[None] * width for x in range(r1 - r0 + 1)]
+    for k in range(1, width):
+        scores[0][k] = scores[0][k - 1] + row_gaps[r0]
+        moves[0][k] = "L"
+    for i in range(1, r1 - r0 + 1):
+        row = r0 + i
+        scores[i][0] = scores[i - 1][0] + column_gaps[c0]
+        moves[i][0] = "U"
+        for k in range(1, width):
+            col = c0 + k
+            best = scores[i - 1][k - 1] + profiles[left[row - 1]][col - 1]
+            move = "D"
+            if scores[i - 1][k] + column_gaps[col] > best:
+                best, move = scores[i - 1][k] + column_gaps[col], "U"
+            if scores[i][k - 1] + row_gaps[row] > best:
+                best, move = scores[i][k - 1] + row_gaps[row], "L"
+            scores[i][k] = best
+            moves[i][k] = move
+    path = []
+    i, k = r1 - r0, width - 1
+    while moves[i][k] is not None:
+        move = moves[i][k]
+        path.append(move)
+        if move != "L":
+            i -= 1
+        if move != "U":
+            k -= 1
+    path.reverse()
+    ops.extend(path)
+
+def align_region(left, profiles, r0, r1, c0, c1, row_gaps, column_gaps, ops):
+    '''Appends the moves ("D" for diagonal, "U" for up and "L" for left) of
+    an optimal path from (r0, c0) to (r1, c1) to ops, using Hirschberg's
+    divide-and-conquer scheme so that only O(c1 - c0) scores are kept.
+
+    Gap scores are looked up by absolute row and column, so a region is
+    scored exactly as it would be within the full matrix.'''
+    if c0 == c1:
+        ops.extend("U" * (r1 - r0))
+        return
+    if r1 - r0 <= 1:
+        align_small_region(left, profiles, r0, r1, c0, c1, row_gaps,
+                           column_gaps, ops)
+        return
+    middle = (r0 + r1) // 2
+    forward = forward_scores(left, profiles, r0, middle, c0, c1, row_gaps,
+                             column_gaps)
+    backward = backward_scores(left, profiles, middle, r1, c0, c1, row_gaps,
+                               column_gaps)
+    split, best = 0, None
+    for k in range(c1 - c0 + 1):
+        if best is None or forward[k] + backward[k] > best:
+            split, best = k, forward[k] + backward[k]
+    align_region(left, profiles, r0, middle, c0, c0 + split, row_gaps,
+                 column_gaps, ops)
+    align_region(left, profiles, middle, r1, c0 + split, c1, row_gaps,
+                 column_gaps, ops)
+
+def path_score(left, top, ops, row, col, row_gaps, column_gaps, scheme):
+    '''Returns the score of a path through the matrix starting at the given
+    row and column, given the codes of the left and top sequences and the
+    gap scores along each row and column.'''
+    score = 0
+    for move in ops:
+        if move == "D":
+            score += scheme.table[left[row]][top[col]]
+            row += 1
+            col += 1
+        elif move == "U":
+            score += column_gaps[col]
+            row += 1
+        else:
+            score += row_gaps[row]
+            col += 1
+    return score
+
+def get_linear_space_alignment(sequence1, sequence2, alignment_is_global=False,
+                               scheme=None, alignment_is_local=False):
+    '''Returns a single optimal alignment of sequence1 (the left sequence)
+    and sequence2 (the top sequence) as an Alignment, like the entries of
+    get_alignments, without building a ScoringMatrix.
+
+    Uses Hirschberg's algorithm, so memory use grows linearly with the
+    lengths of the sequences. Performs a semi-global alignment by default
+    unless alignment_is_global or alignment_is_local is specified to be True.
+    Raises ValueError if the scheme has affine gap scores.
+
+    A local alignment takes two extra passes keeping one row of scores: one
+    finds where the best local alignment ends, and one running backwards
+    from there finds where it starts. The part in between is then aligned
+    globally.'''
+    scheme = get_scheme(scheme)
+    if scheme.is_affine():
+        raise ValueError("linear-space alignment needs linear gap scores")
+    left, top = encode(sequence1).codes(), encode(sequence2).codes()
+    profiles = scheme.profiles(left, top)
+    rows, columns = len(left), len(top)
+    r0 = c0 = 0
+    if alignment_is_local:
+        score, rows, columns = best_cell(local_score_rows(left, profiles,
+                                                          columns, scheme))
+        # Paths anchored at the end and running back through the reversed
+        # sequences can score no more than the best local alignment, and
+        # that alignment is one of them.
+        reversed_left, reversed_top = left[:rows][::-1], top[:columns][::-1]
+        reversed_profiles = scheme.profiles(reversed_left, reversed_top)
+        score, r0, c0 = best_cell(linear_score_rows(reversed_left,
+                                                    reversed_profiles,
+                                                    columns, True, scheme))
+        r0, c0 = rows - r0, columns - c0
+        alignment_is_global = True
+    row_gaps = edge_gap_scores(rows, alignment_is_global, scheme)
+    column_gaps = edge_gap_scores(columns, alignment_is_global, scheme)
+    ops = []
+    align_region(left, profiles, r0, rows, c0, columns, row_gaps, column_gaps,
+                 ops)
+    score = path_score(left, top, ops, r0, c0, row_gaps, column_gaps, scheme)
+    return from_moves(left, top, ops, r0, c0, score)
+
+def linear_score_rows(left, profiles, columns, alignment_is_global, scheme):
+    '''Yields every row of scores of the matrix for the given left codes
+    and profiles, for a scheme with linear gap scores. Each row is a new
+    list.'''
+    row_gaps = edge_gap_scores(len(left), alignment_is_global, scheme)
+    column_gaps = edge_gap_scores(columns, alignment_is_global, scheme)
+    previous = [0] * (columns + 1)
+    for j in range(1, columns + 1):
+        previous[j] = previous[j - 1] + row_gaps[0]
+    yield previous
+    for i in range(1, len(left) + 1):
+        left_gap = row_gaps[i]
+        profile = profiles[left[i - 1]]
+        current = [previous[0] + column_gaps[0]]
+        append = current.append
+        for j in range(1, columns + 1):
+            score_diagonal = previous[j - 1] + profile[j - 1]
+            score_left = current[j - 1] + left_gap
+            score_up = previous[j] + column_gaps[j]
+            if score_left > score_diagonal:
+                score_diagonal = score_left
+            append(score_up if score_up > score_diagonal else score_diagonal)
+        yield current
+        previous = current
+
+def affine_score_rows(left, profiles, columns, alignment_is_global, scheme):
+    '''Yields every row of scores like linear_score_rows, for a scheme with
+    affine gap scores. The best scores of paths ending in a gap are kept
+    alongside, as in fill_affine_matrix.'''
+    terminal = not alignment_is_global
+    extend = scheme.gap
+    open_gap = scheme.gap_open + extend
+    terminal_gap = scheme.terminal_gap
+    if terminal:
+        previous = [j * terminal_gap for j in range(columns + 1)]
+    else:
+        previous = [0] + [scheme.gap_open + j * extend
+                          for j in range(1, columns + 1)]
+    yield previous
+    verticals = [UNREACHABLE] * (columns + 1)
+    for i in range(1, len(left) + 1):
+        terminal_row = terminal and i == len(left)
+        profile = profiles[left[i - 1]]
+        if terminal:
+            current = [previous[0] + terminal_gap]
+        else:
+            verticals[0] = max(previous[0] + open_gap, verticals[0] + extend)
+            current = [verticals[0]]
+        append = current.append
+        horizontal = UNREACHABLE
+        for j in range(1, columns + 1):
+            if terminal and j == columns:
+                vertical = previous[j] + terminal_gap
+            else:
+                vertical = max(previous[j] + open_gap, verticals[j] + extend)
+                verticals[j] = vertical
+            if terminal_row:
+                horizontal = current[j - 1] + terminal_gap
+            else:
+                horizontal = max(current[j - 1] + open_gap,
+                                 horizontal + extend)
+            append(max(previous[j - 1] + profile[j - 1], horizontal, vertical))
+        yield current
+        previous = current
+
+def local_score_rows(left, profiles, columns, scheme):
+    '''Yields every row of scores like linear_score_rows, for a local
+    alignment with linear or affine gap scores. No score falls below 0.'''
+    extend = scheme.gap
+    open_gap = scheme.gap_open + extend
+    previous = [0] * (columns + 1)
+    yield previous
+    verticals = [UNREACHABLE] * (columns + 1)
+    for i in range(1, len(left) + 1):
+        profile = profiles[left[i - 1]]
+        current = [0]
+        append = current.append
+        horizontal = UNREACHABLE
+        for j in range(1, columns + 1):
+            vertical = max(previous[j] + open_gap, verticals[j] + extend)
+            verticals[j] = vertical
+            horizontal = max(current[j - 1] + open_gap, horizontal + extend)
+            score = max(previous[j - 1] + profile[j - 1], horizontal, vertical)
+            append(score if score > 0 else 0)
+        yield current
+        previous = current
+
+def best_cell(score_rows):
+    '''Returns a tuple (score, row, column) for the first cell, in
+    row-major order, with the best of the scores in the given rows.'''
+    best = None
+    for i, current in enumerate(score_rows):
+        score = max(current)
+        if best is None or score > best[0]:
+            best = (score, i, current.index(score))
+    return best
+
+def get_optimal_score(sequence1, sequence2, alignment_is_global=False,
+                      scheme=None, alignment_is_local=False):
+    '''Returns a tuple (score, row, column) giving the optimal alignment
+    score of sequence1 (the left sequence) and sequence2 (the top sequence),
+    and the cell where the alignment ends, without building a ScoringMatrix
+    or tracing back any alignments. Only two rows of scores are kept.
+
+    In a global alignment the end is always the lower right corner. In a
+    semi-global alignment it is where the trailing terminal gap begins. Each
+    cell of the bottom row and the last column is scored as an end, adding
+    the terminal gap score for every position between it and the corner; the
+    end is the leftmost cell of the bottom row reaching the optimal score,
+    unless that is the corner, in which case the uppermost such cell of the
+    last column.
+    A local alignment (if alignment_is_local is True) ends at the first cell,
+    in row-major order, with the best score.
+
+    Global and semi-global alignments with the default unit scores are
+    computed a whole column at a time by bit_parallel_score.'''
+    scheme = get_scheme(scheme)
+    left, top = encode(sequence1).codes(), encode(sequence2).codes()
+    if supports_scheme(scheme) and not alignment_is_local:
+        return bit_parallel_score(left, top, alignment_is_global)
+    profiles = scheme.profiles(left, top)
+    rows, columns = len(left), len(top)
+    if alignment_is_local:
+        return best_cell(local_score_rows(left, profiles, columns, scheme))
+    if scheme.is_affine():
+        score_rows = affine_score_rows(left, profiles, columns,
+                                       alignment_is_global, scheme)
+    else:
+        score_rows = linear_score_rows(left, profiles, columns,
+                                       alignment_is_global, scheme)
+    # The trailing terminal gap of a semi-global alignment runs along the
+    # last row or the last column, so each cell of those is scored as an end
+    # along with the gaps it would leave to the corner.
+    terminal_gap = scheme.terminal_gap
+    end_row, end_row_score = 0, None
+    for i, current in enumerate(score_rows):
+        candidate = current[columns] + (rows - i) * terminal_gap
+        if end_row_score is None or candidate > end_row_score:
+            end_row, end_row_score = i, candidate
+        previous = current
+    if alignment_is_global:
+        return (previous[columns], rows, columns)
+    end_column, end_column_score = 0, None
+    for j in range(columns + 1):
+        candidate = previous[j] + (columns - j) * terminal_gap
+        if end_column_score is None or candidate > end_column_score:
+            end_column, end_column_score = j, candidate
+    if end_column_score >= end_row_score and end_column < columns:
+        return (end_column_score, rows, end_column)
+    return (end_row_score, end_row, columns)
 
 if __name__ == "__main__":
     # Unit test
@@ -121,3 +1055,117 @@ if __name__ == "__main__":
     fill_matrix(sm)
     terminal_output.print_matrix(sm)
     terminal_output.print_alignments(get_alignments(sm))
+
+    # Extending a matrix and realigning gives the same alignments as
+    # aligning the extended sequences from scratch.
+    for alignment_is_global in (False, True):
+        sm = ScoringMatrix("CG", "CA")
+        realign(sm, alignment_is_global)
+        for top, left in (("CGTAT", ""), ("", "CA"), ("GATTACA" * 3, "T")):
+            sm.extend_top(top)
+            sm.extend_left(left)
+            expected = get_alignments(ScoringMatrix(str(sm.get_left_sequence()),
+                                                    str(sm.get_top_sequence())),
+                                      alignment_is_global)
+            assert realign(sm, alignment_is_global) == expected
+    # Repeated small appends, which move the rows within their arrays
+    # whenever the spare room runs out, leave the same scores and backlinks
+    # as a fresh fill.
+    import random
+    rng = random.Random(24)
+    for alignment_is_global in (False, True):
+        sm = ScoringMatrix("GA", "G")
+        for step in range(30):
+            sm.extend_top("".join(rng.choice("ACGT")
+                                  for x in range(rng.randint(0, 3))))
+            if rng.random() < 0.3:
+                sm.extend_left(rng.choice("ACGT"))
+            fill_matrix(sm, alignment_is_global)
+            expected = ScoringMatrix(str(sm.get_left_sequence()),
+                                     str(sm.get_top_sequence()))
+            fill_matrix(expected, alignment_is_global)
+            for row in range(sm.get_rows()):
+                assert sm.get_score_row(row) == expected.get_score_row(row)
+                assert sm.get_backlink_row(row) == \
+                       expected.get_backlink_row(row)
+
+    # The NumPy fill gives the same scores and backlinks as fill_matrix.
+    if import_numpy() is not None:
+        left, top = "GATTACACGTAGGCTNN", "GCATGCTACGATTAGCATAC"
+        for scheme in (None, ScoringScheme(2, -1, -2, -1)):
+            for alignment_is_global in (False, True):
+                expected = ScoringMatrix(left, top)
+                fill_matrix(expected, alignment_is_global, scheme)
+                sm = ScoringMatrix(left, top)
+                fill_matrix_vectorized(sm, alignment_is_global, scheme)
+                for row in range(sm.get_rows()):
+                    assert list(sm.get_score_row(row)) == \
+                           list(expected.get_score_row(row))
+                    assert sm.get_backlink_row(row) == \
+                           expected.get_backlink_row(row)
+    else:
+        print("NumPy is not installed; skipped fill_matrix_vectorized.")
+
+    # Hirschberg's algorithm finds a path scoring the full table's optimum.
+    rng = random.Random(3)
+    for trial in range(100):
+        left = "".join(rng.choice("ACGT") for x in range(rng.randint(0, 30)))
+        top = "".join(rng.choice("ACGT") for x in range(rng.randint(0, 30)))
+        for scheme in (None, ScoringScheme(2, -1, -2, -1)):
+            for alignment_is_global in (False, True):
+                sm = ScoringMatrix(left, top)
+                fill_matrix(sm, alignment_is_global, scheme)
+                alignment = get_linear_space_alignment(left, top,
+                                                       alignment_is_global,
+                                                       scheme)
+                assert alignment.get_score() == sm.get_score(*sm.get_end())
+                strings = list(alignment)
+                assert strings[0].replace("_", "") == top
+                assert strings[1].replace("_", "") == left
+
+    # get_optimal_score ends semi-global alignments where the trailing
+    # terminal gap begins, even when terminal gaps are not free.
+    scheme = ScoringScheme(2, -1, -1, -1, -2)
+    assert get_optimal_score("CGTA", "ATGCCTTTCC", scheme=scheme) == (-4, 4, 7)
+    for trial in range(300):
+        left = "".join(rng.choice("ACGT") for x in range(rng.randint(0, 12)))
+        top = "".join(rng.choice("ACGT") for x in range(rng.randint(0, 12)))
+        scheme = ScoringScheme(2, -1, rng.choice((-1, -2)),
+                               rng.choice((0, -1, -2)), rng.choice((0, -2)))
+        sm = ScoringMatrix(left, top)
+        fill_matrix(sm, False, scheme)
+        rows, columns = len(left), len(top)
+        score = sm.get_score(rows, columns)
+        ends = [(rows, j) for j in range(columns)
+                if sm.get_score(rows, j) +
+                (columns - j) * scheme.terminal_gap == score]
+        ends += [(i, columns) for i in range(rows + 1)
+                 if sm.get_score(i, columns) +
+                 (rows - i) * scheme.terminal_gap == score]
+        assert get_optimal_score(left, top, scheme=scheme) == \
+               (score,) + ends[0], (left, top)
+
+    # count_alignments counts exactly the alignments iter_alignments yields.
+    for left, top in (("CAG", "TTTCAGCAGTTT"), ("ACAC", "CACACACA"),
+                      ("AAAA", "AAAAAAAA")):
+        for scheme in (None, ScoringScheme(gap_open=-1)):
+            for alignment_is_global, alignment_is_local in \
+                    ((False, False), (True, False), (False, True)):
+                sm = ScoringMatrix(left, top)
+                get_alignments(sm, alignment_is_global, scheme=scheme,
+                               alignment_is_local=alignment_is_local)
+                assert count_alignments(sm) == len(list(iter_alignments(sm)))
+    sm = ScoringMatrix("CAG", "TTTCAGCAGTTT")
+    assert len(get_alignments(sm)) == count_alignments(sm) == 2
+
+    # A query contained in a longer sequence leaves the narrow bands tried
+    # first with astronomically many co-optimal paths; only the band kept is
+    # traced back, so this finishes quickly. The band follows the diagonal
+    # the query lies on, so it doesn't need widening much.
+    top = "".join(rng.choice("ACGT") for x in range(600))
+    left = "".join(c if rng.random() < 0.9 else rng.choice("ACGT")
+                   for c in top[80:520])
+    sm, alignments = get_banded_alignments(left, top, 4)
+    assert len(alignments) == count_alignments(sm)
+    assert alignments[0].get_score() == get_optimal_score(left, top)[0]
+    assert sm.offset == 80 and sm.get_size() < 20 * len(left)
@@ -19,6 +19,109 @@
 # Christopher Kyle Horton (000516274), chorton@ltu.edu
 # Last modified: 11/6/2014
 
+from __future__ import print_function
+
+from array import array
+import mmap
+import struct
+import tempfile
+
+from encoded_sequence import encode
+
+# Backlink bits stored for each cell of a ScoringMatrix.
+UP = 1
+DIAGONAL = 2
+LEFT = 4
+
+# With affine gap scores, a cell also records how the best gap ending there
+# was reached: opened from the cell's neighbour, or extending the gap which
+# ended at that neighbour. A LEFT or UP backlink then means the cell's score
+# came from the gap. Cells with a LEFT or UP backlink but none of these bits
+# behave as if the gap was opened there.
+LEFT_OPEN = 8
+LEFT_EXTEND = 16
+UP_OPEN = 32
+UP_EXTEND = 64
+
+class MappedArray:
+    '''A fixed-length array of integers kept in a memory-mapped temporary
+    file, so that it can be larger than memory.
+
+    It supports the indexing and slicing a ScoringMatrix uses on its
+    in-memory arrays: items are ints, and slices are copied out as an array
+    of the same typecode, or a bytearray for typecode 'B'. The file starts
+    out sparse and filled with zeros, and is deleted when it is closed.'''
+    def __init__(self, typecode, length, directory=None):
+        '''Creates an array of length zeros of the given array typecode in a
+        new file in directory, or the default temporary directory.'''
+        self.typecode = typecode
+        self.format = "=" + typecode
+        self.itemsize = struct.calcsize(self.format)
+        self.length = length
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.file.truncate(max(1, length * self.itemsize))
+        self.map = mmap.mmap(self.file.fileno(), max(1, length * self.itemsize))
+
+    def __len__(self):
+        return self.length
+
+    def close(self):
+        '''Unmaps and deletes the file.'''
+        self.map.close()
+        self.file.close()
+
+    def read(self, start, stop):
+        '''Returns a copy of the items from start up to stop.'''
+        data = self.map[start * self.itemsize:stop * self.itemsize]
+        if self.typecode == 'B':
+            return bytearray(data)
+        values = array(self.typecode)
+        if hasattr(values, "frombytes"):
+            values.frombytes(data)
+        else:
+            values.fromstring(data)
+        return values
+
+    def write(self, start, values):
+        '''Overwrites the items from start on with values.'''
+        if self.typecode == 'B':
+            data = bytes(bytearray(values))
+        else:
+            values = array(self.typecode, values)
+            data = (values.tobytes() if hasattr(values, "tobytes")
+                    else values.tostring())
+        offset = start * self.itemsize
+        self.map[offset:offset + len(data)] = data
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.length)
+            if step == 1:
+                return self.read(start, max(start, stop))
+            values = self.read(0, 0)
+            for i in range(start, stop, step):
+                values.append(self[i])
+            return values
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError
+        return struct.unpack_from(self.format, self.map,
+                                  index * self.itemsize)[0]
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.length)
+            if step != 1 or len(value) != max(0, stop - start):
+                raise ValueError("only whole contiguous slices can be set")
+            self.write(start, value)
+            return
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError
+        struct.pack_into(self.format, self.map, index * self.itemsize, value)
+
 class ScoringMatrixCell:
     '''A class implementing individual cells within the scoring matrix.'''
     def __init__(self, score=0, up=False, diagonal=False, left=False):
@@ -63,95 +166,274 @@ class ScoringMatrixCell:
         self.left = False
 
 class ScoringMatrix:
-    '''A class implementing a scoring matrix.'''
-    def __init__(self, sequence1, sequence2):
+    '''A class implementing a scoring matrix.
+
+    Scores are kept in one contiguous integer array and backlinks in a
+    bytearray holding one bitmask (UP, DIAGONAL, LEFT) per cell, both in
+    row-major order.'''
+    def __init__(self, sequence1, sequence2, scratch_dir=None):
         '''Initializes a new scoring matrix with the supplied sequences.
 
         sequence1 is the sequence displayed along the left side of the scoring
-        matrix, and sequence2 is displayed along the top.'''
-        seql = (len(sequence1) + 1, len(sequence2) + 1)
-        self.matrix = [[ScoringMatrixCell() for x in range(seql[1])]
-                       for x in range(seql[0])]
-        self.left_sequence = sequence1
-        self.top_sequence = sequence2
+        matrix, and sequence2 is displayed along the top. Either may be a
+        string or an EncodedSequence; strings are encoded.
+
+        If scratch_dir is given, the scores and backlinks are kept in
+        MappedArray files in that directory instead of in memory, so the
+        matrix can be larger than memory. The algorithms fill and read it a
+        row at a time, so the operating system only needs to keep the pages
+        around the current row resident.'''
+        self.left_sequence = encode(sequence1)
+        self.top_sequence = encode(sequence2)
+        self.rows = len(sequence1) + 1
+        self.columns = len(sequence2) + 1
+        # Rows are stride cells apart, leaving room for extend_top.
+        self.stride = self.columns
+        size = self.rows * self.columns
+        if scratch_dir is not None:
+            self.scores = MappedArray('i', size, scratch_dir)
+            self.backlinks = MappedArray('B', size, scratch_dir)
+        else:
+            self.scores = array('i', [0]) * size
+            self.backlinks = bytearray(size)
+        self.end = (self.rows - 1, self.columns - 1)
+        # The rows and columns filled by fill_matrix, and the options it
+        # filled them with, as fill_key; see fill_matrix.
+        self.filled = (0, 0)
+        self.fill_key = None
+
+    def close(self):
+        '''Releases the files of a matrix kept in a scratch directory. The
+        matrix can't be used afterwards. Matrices kept in memory need not be
+        closed, but may be.'''
+        for storage in (self.scores, self.backlinks):
+            if isinstance(storage, MappedArray):
+                storage.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        '''Closes the matrix at the end of a with statement.'''
+        self.close()
+        return False
 
     def get_top_sequence(self):
-        '''Returns the sequence along the top edge of the matrix.'''
+        '''Returns the sequence along the top edge of the matrix as an
+        EncodedSequence.'''
         return self.top_sequence
 
     def get_left_sequence(self):
-        '''Returns the sequence along the left edge of the matrix.'''
+        '''Returns the sequence along the left edge of the matrix as an
+        EncodedSequence.'''
         return self.left_sequence
 
     def get_rows(self):
         '''Returns the number of rows in this scoring matrix.
 
         This should be equal to the length of the left sequence, plus one.'''
-        return len(self.left_sequence) + 1
+        return self.rows
 
     def get_columns(self):
         '''Returns the number of columns in this scoring matrix.
 
         This should be equal to the length of the top sequence, plus one.'''
-        return len(self.top_sequence) + 1
+        return self.columns
+
+    def get_size(self):
+        '''Returns the number of cells stored in this matrix.'''
+        return self.rows * self.columns
+
+    def extend_top(self, suffix):
+        '''Appends suffix to the top sequence, adding a column to the right
+        of the matrix for each of its letters.
+
+        Existing cells keep their scores and backlinks, and the new ones
+        start out empty, so fill_matrix only needs to fill the new columns.
+        Rows are laid out with room to spare, which doubles whenever it runs
+        out. The arrays then grow in place and the rows are moved to their
+        new starts, last first, so repeatedly extending the top sequence
+        costs amortized constant time per cell and never holds two copies of
+        the table. The end moves to the new lower right corner.
+        Raises ValueError for a matrix in a scratch directory.'''
+        if isinstance(self.backlinks, MappedArray):
+            raise ValueError("a matrix in a scratch directory can't be "
+                             "extended")
+        self.top_sequence = encode(str(self.top_sequence) + str(suffix))
+        columns = len(self.top_sequence) + 1
+        if columns > self.stride:
+            stride = max(columns, 2 * self.stride)
+            added = self.rows * (stride - self.stride)
+            self.scores.extend(array('i', [0]) * added)
+            self.backlinks.extend(bytearray(added))
+            zeros = array('i', [0]) * (stride - self.columns)
+            for row in range(self.rows - 1, 0, -1):
+                old, new = row * self.stride, row * stride
+                self.scores[new:new + self.columns] = \
+                    self.scores[old:old + self.columns]
+                self.backlinks[new:new + self.columns] = \
+                    self.backlinks[old:old + self.columns]
+                # Clear what is left of the old rows in the new spare room.
+                self.scores[new + self.columns:new + stride] = zeros
+                self.backlinks[new + self.columns:new + stride] = \
+                    bytearray(len(zeros))
+            self.scores[self.columns:stride] = zeros
+            self.backlinks[self.columns:stride] = bytearray(len(zeros))
+            self.stride = stride
+        self.columns = columns
+        self.end = (self.rows - 1, self.columns - 1)
+
+    def extend_left(self, suffix):
+        '''Appends suffix to the left sequence, adding a row to the bottom
+        of the matrix for each of its letters, like extend_top.'''
+        if isinstance(self.backlinks, MappedArray):
+            raise ValueError("a matrix in a scratch directory can't be "
+                             "extended")
+        self.left_sequence = encode(str(self.left_sequence) + str(suffix))
+        added = len(self.left_sequence) + 1 - self.rows
+        self.scores.extend(array('i', [0]) * (added * self.stride))
+        self.backlinks.extend(bytearray(added * self.stride))
+        self.rows += added
+        self.end = (self.rows - 1, self.columns - 1)
+
+    def get_end(self):
+        '''Returns the (row, column) of the cell where alignments end, and so
+        where their traceback starts. This is the lower right corner unless
+        set_end has been called, as for a local alignment.'''
+        return self.end
+
+    def set_end(self, row, column):
+        '''Sets the cell where alignments end.'''
+        self.index(row, column)
+        self.end = (row, column)
+
+    def index(self, row, column):
+        '''Returns the offset of the specified cell within the flat score and
+        backlink arrays, raising IndexError if it lies outside the matrix.'''
+        if not (0 <= row < self.rows and 0 <= column < self.columns):
+            raise IndexError
+        return row * self.stride + column
 
     def get_score(self, row, column):
         '''Gets the current score at the specified row and column.'''
         try:
-            return self.matrix[row][column].get_score()
+            return self.scores[self.index(row, column)]
         except IndexError:
-            print "IndexError in get_score({0!s}, {1!s})".format(row, column)
+            print("IndexError in get_score({0!s}, {1!s})".format(row, column))
             exit(1)
 
     def set_score(self, row, column, score):
         '''Sets the score at the specified row and column.'''
         try:
-            self.matrix[row][column].set_score(score)
+            self.scores[self.index(row, column)] = score
         except IndexError:
-            print "IndexError in set_score({0!s}, {1!s})".format(row, column)
+            print("IndexError in set_score({0!s}, {1!s})".format(row, column))
             exit(1)
 
     def get_backlinks(self, row, column):
         '''Returns the current backlinks at the specified row and column in
         the form of a dictionary of Boolean values for each direction.'''
         try:
-            return self.matrix[row][column].get_backlinks()
+            bits = self.backlinks[self.index(row, column)]
+        except IndexError:
+            print("IndexError in get_backlinks({0!s}, {1!s})".format(row, column))
+            exit(1)
+        return {"up": bool(bits & UP), "diagonal": bool(bits & DIAGONAL),
+                "left": bool(bits & LEFT)}
+
+    def get_backlink_bits(self, row, column):
+        '''Returns the backlinks at the specified row and column as a bitmask
+        of UP, DIAGONAL and LEFT, and of the gap bits LEFT_OPEN, LEFT_EXTEND,
+        UP_OPEN and UP_EXTEND.'''
+        try:
+            return self.backlinks[self.index(row, column)]
         except IndexError:
-            print "IndexError in get_backlinks({0!s}, {1!s})".format(row, column)
+            print("IndexError in get_backlink_bits({0!s}, {1!s})".format(row, column))
             exit(1)
 
     def add_up_backlink(self, row, column):
         '''Adds an up backlink at the specified row and column.'''
         try:
-            self.matrix[row][column].add_up_backlink()
+            self.backlinks[self.index(row, column)] |= UP
         except IndexError:
-            print "IndexError in add_up_backlink({0!s}, {1!s})".format(row, column)
+            print("IndexError in add_up_backlink({0!s}, {1!s})".format(row, column))
             exit(1)
 
     def add_diagonal_backlink(self, row, column):
         '''Adds a diagonal backlink at the specified row and column.'''
         try:
-            self.matrix[row][column].add_diagonal_backlink()
+            self.backlinks[self.index(row, column)] |= DIAGONAL
         except IndexError:
-            print "IndexError in add_diagonal_backlink({0!s}, {1!s})".format(row, column)
+            print("IndexError in add_diagonal_backlink({0!s}, {1!s})".format(row, column))
             exit(1)
 
     def add_left_backlink(self, row, column):
         '''Adds a left backlink at the specified row and column.'''
         try:
-            self.matrix[row][column].add_left_backlink()
+            self.backlinks[self.index(row, column)] |= LEFT
         except IndexError:
-            print "IndexError in add_left_backlink({0!s}, {1!s})".format(row, column)
+            print("IndexError in add_left_backlink({0!s}, {1!s})".format(row, column))
             exit(1)
 
     def remove_backlinks(self, row, column):
         '''Removes all backlinks at the specified row and column.'''
         try:
-            self.matrix[row][column].remove_backlinks()
+            self.backlinks[self.index(row, column)] = 0
         except IndexError:
-            print "IndexError in remove_backlinks({0!s}, {1!s})".format(row, column)
+            print("IndexError in remove_backlinks({0!s}, {1!s})".format(row, column))
             exit(1)
 
+    def get_band(self, row):
+        '''Returns the first and last columns stored for the given row. Every
+        column is stored in a full scoring matrix.'''
+        return (0, self.columns - 1)
+
+    def in_band(self, row, column):
+        '''Returns True iff the specified cell is stored in this matrix.'''
+        if not 0 <= row < self.rows:
+            return False
+        first, last = self.get_band(row)
+        return first <= column <= last
+
+    # Bulk accessors. These do no per-cell checking, so the hot loops in
+    # scoring_algorithm and the output modules can work a row at a time.
+    # Rows cover the columns given by get_band, starting with the first.
+
+    def get_score_row(self, row, first=0):
+        '''Returns a copy of the scores in the given row as an array, from
+        column first on.'''
+        start = row * self.stride
+        return self.scores[start + first:start + self.columns]
+
+    def set_score_row(self, row, scores, first=0):
+        '''Overwrites the scores in the given row with the supplied values,
+        which must cover every column of the row from column first on.'''
+        start = row * self.stride
+        self.scores[start + first:start + self.columns] = array('i', scores)
+
+    def get_backlink_row(self, row, first=0):
+        '''Returns a copy of the backlink bitmasks in the given row as a
+        bytearray, from column first on.'''
+        start = row * self.stride
+        return self.backlinks[start + first:start + self.columns]
+
+    def set_backlink_row(self, row, backlinks, first=0):
+        '''Overwrites the backlink bitmasks in the given row with the
+        supplied values, which must cover every column of the row from
+        column first on.'''
+        start = row * self.stride
+        self.backlinks[start + first:start + self.columns] = \
+            bytearray(backlinks)
+
+    def get_score_column(self, column):
+        '''Returns a copy of the scores in the given column as an array.'''
+        return self.scores[column::self.stride]
+
+    def get_backlink_column(self, column):
+        '''Returns a copy of the backlink bitmasks in the given column as a
+        bytearray.'''
+        return self.backlinks[column::self.stride]
+
     def match(self, row, col):
         '''Returns True iff the corresponding characters in the sequences are
         equal.
@@ -159,20 +441,154 @@ class ScoringMatrix:
         Note that the row and column of the matrix must be supplied, not the
         character's indexes within their sequences directly.'''
         try:
-            return self.left_sequence[row - 1] == self.top_sequence[col - 1]
+            return (self.left_sequence.code(row - 1) ==
+                    self.top_sequence.code(col - 1))
         except IndexError:
-            print "IndexError in match({0!s}, {1!s})".format(row, col)
+            print("IndexError in match({0!s}, {1!s})".format(row, col))
             exit(1)
 
+class BandedScoringMatrix(ScoringMatrix):
+    '''A scoring matrix which only stores the cells within band columns of
+    a diagonal: by default the one running from its upper left to its lower
+    right corner, or else the one offset columns to the right of the upper
+    left corner (to the left if offset is negative).
+
+    Cells outside the band are not stored, and reading or writing them is an
+    error just like reading or writing outside the matrix. Column accessors
+    read them as 0.'''
+    def __init__(self, sequence1, sequence2, band, offset=None):
+        '''Initializes a new banded scoring matrix with the supplied sequences,
+        band width and diagonal offset.
+
+        Along the corner-to-corner diagonal, the band is widened if needed so
+        that consecutive rows overlap, which is required for a path to exist
+        when one sequence is much longer. Along an offset diagonal, the first
+        row is stored from its first column and the last row up to its last
+        column, and rows where the diagonal lies outside the matrix keep the
+        cell of the nearest edge column, so that both corners are always
+        connected through the band.'''
+        self.left_sequence = encode(sequence1)
+        self.top_sequence = encode(sequence2)
+        self.rows = len(sequence1) + 1
+        self.columns = len(sequence2) + 1
+        last_row, last_column = self.rows - 1, self.columns - 1
+        if last_row and offset is None:
+            slope = (last_column + last_row - 1) // last_row
+            band = max(band, slope // 2)
+        self.band = band
+        self.offset = offset
+        self.bands = []
+        self.row_starts = []
+        size = 0
+        for row in range(self.rows):
+            if offset is not None:
+                center = row + offset
+                first = min(max(0, center - band), last_column)
+                last = max(min(last_column, center + band), 0)
+                if row == 0:
+                    first = 0
+                if row == last_row:
+                    last = last_column
+            else:
+                if last_row:
+                    center = ((2 * row * last_column + last_row) //
+                              (2 * last_row))
+                else:
+                    center = 0
+                first = max(0, center - band)
+                last = (last_column if not last_row
+                        else min(last_column, center + band))
+            self.bands.append((first, last))
+            self.row_starts.append(size)
+            size += last - first + 1
+        self.scores = array('i', [0]) * size
+        self.backlinks = bytearray(size)
+        self.end = (self.rows - 1, self.columns - 1)
+        self.filled = (0, 0)
+        self.fill_key = None
+
+    def get_size(self):
+        '''Returns the number of cells stored in this matrix.'''
+        return len(self.backlinks)
+
+    def extend_top(self, suffix):
+        '''Banded matrices can't be extended, as the band depends on the
+        lengths of both sequences; raises ValueError.'''
+        raise ValueError("a banded matrix can't be extended")
+
+    def extend_left(self, suffix):
+        '''Raises ValueError, like extend_top.'''
+        raise ValueError("a banded matrix can't be extended")
+
+    def covers_matrix(self):
+        '''Returns True iff every cell of the matrix lies within the band.'''
+        return all(band == (0, self.columns - 1) for band in self.bands)
+
+    def get_band(self, row):
+        '''Returns the first and last columns stored for the given row.'''
+        return self.bands[row]
+
+    def index(self, row, column):
+        '''Returns the offset of the specified cell within the flat score and
+        backlink arrays, raising IndexError if it lies outside the band.'''
+        if not 0 <= row < self.rows:
+            raise IndexError
+        first, last = self.bands[row]
+        if not first <= column <= last:
+            raise IndexError
+        return self.row_starts[row] + column - first
+
+    def get_score_row(self, row):
+        '''Returns a copy of the scores stored for the given row.'''
+        first, last = self.bands[row]
+        start = self.row_starts[row]
+        return self.scores[start:start + last - first + 1]
+
+    def set_score_row(self, row, scores):
+        '''Overwrites the scores stored for the given row.'''
+        first, last = self.bands[row]
+        start = self.row_starts[row]
+        self.scores[start:start + last - first + 1] = array('i', scores)
+
+    def get_backlink_row(self, row):
+        '''Returns a copy of the backlink bitmasks stored for the given row.'''
+        first, last = self.bands[row]
+        start = self.row_starts[row]
+        return self.backlinks[start:start + last - first + 1]
+
+    def set_backlink_row(self, row, backlinks):
+        '''Overwrites the backlink bitmasks stored for the given row.'''
+        first, last = self.bands[row]
+        start = self.row_starts[row]
+        self.backlinks[start:start + last - first + 1] = bytearray(backlinks)
+
+    def get_score_column(self, column):
+        '''Returns the scores in the given column as an array, with 0 for
+        cells outside the band.'''
+        scores = array('i', [0]) * self.rows
+        for row in range(self.rows):
+            if self.in_band(row, column):
+                scores[row] = self.scores[self.index(row, column)]
+        return scores
+
+    def get_backlink_column(self, column):
+        '''Returns the backlink bitmasks in the given column as a bytearray,
+        with 0 for cells outside the band.'''
+        backlinks = bytearray(self.rows)
+        for row in range(self.rows):
+            if self.in_band(row, column):
+                backlinks[row] = self.backlinks[self.index(row, column)]
+        return backlinks
+
 if __name__ == '__main__':
     '''Unit test for this module.'''
 
     def test_failed(test_number, fail_string):
-        print "Test {0!s} failed: {1}".format(test_number, fail_string)
+        print("Test {0!s} failed: {1}".format(test_number, fail_string))
         exit(1)
 
     def test_passed(test_number):
-        print "Test {0!s} passed.".format(test_number)
+        print("Test {0!s} passed.".format(test_number))
 
     # Test 1: ScoringMatrixCell initialization.
     test_num = 1
@@ -265,4 +681,107 @@ if __name__ == '__main__':
                 fail_message = "Deep copy test failed."
                 test_failed(test_num, fail_message)
     test_passed(test_num)
-    print "All {0!s} test cases for scoring_matrix.py passed.".format(test_num)
+
+    # Test 5: Backlink bitmasks and bulk row/column accessors.
+    test_num += 1
+    test3.add_up_backlink(1, 2)
+    test3.add_left_backlink(1, 2)
+    backlinks5 = test3.get_backlinks(1, 2)
+    if not backlinks5["up"] or not backlinks5["left"] or backlinks5["diagonal"]:
+        fail_message = "Backlinks at row 1, column 2 are {0!s}".format(backlinks5)
+        test_failed(test_num, fail_message)
+    if test3.get_backlink_bits(1, 2) != UP | LEFT:
+        fail_message = "Backlink bitmask at row 1, column 2 is incorrect"
+        test_failed(test_num, fail_message)
+    if list(test3.get_score_row(2)) != [2 * column for column in range(num_cols)]:
+        fail_message = "Score row 2 is {0!s}".format(list(test3.get_score_row(2)))
+        test_failed(test_num, fail_message)
+    if list(test3.get_score_column(3)) != [3 * row for row in range(num_rows)]:
+        fail_message = "Score column 3 is {0!s}".format(list(test3.get_score_column(3)))
+        test_failed(test_num, fail_message)
+    test3.set_score_row(0, range(num_cols))
+    test3.set_backlink_row(0, [LEFT] * num_cols)
+    if test3.get_score(0, num_cols - 1) != num_cols - 1:
+        fail_message = "set_score_row did not update row 0"
+        test_failed(test_num, fail_message)
+    if test3.get_backlink_column(0)[0] != LEFT or test3.get_backlink_column(0)[1] != 0:
+        fail_message = "set_backlink_row did not update row 0"
+        test_failed(test_num, fail_message)
+    test3.remove_backlinks(1, 2)
+    if test3.get_backlink_row(1)[2] != 0:
+        fail_message = "remove_backlinks did not clear row 1, column 2"
+        test_failed(test_num, fail_message)
+    test_passed(test_num)
+
+    # Test 6: BandedScoringMatrix only stores cells near the diagonal.
+    test_num += 1
+    test6 = BandedScoringMatrix("ACGTACGT", "ACGTACGT", 2)
+    if test6.get_band(0) != (0, 2) or test6.get_band(4) != (2, 6):
+        fail_message = "Incorrect bands {0!s}".format(test6.bands)
+        test_failed(test_num, fail_message)
+    if test6.in_band(0, 3) or not test6.in_band(8, 8) or test6.covers_matrix():
+        fail_message = "Incorrect in_band results"
+        test_failed(test_num, fail_message)
+    test6.set_score(4, 2, 7)
+    test6.add_diagonal_backlink(4, 6)
+    if test6.get_score_row(4)[0] != 7 or test6.get_backlink_row(4)[4] != DIAGONAL:
+        fail_message = "Row accessors do not start at the band"
+        test_failed(test_num, fail_message)
+    if list(test6.get_score_column(2))[3:6] != [0, 7, 0]:
+        fail_message = "Incorrect score column {0!s}".format(list(test6.get_score_column(2)))
+        test_failed(test_num, fail_message)
+    if BandedScoringMatrix("AC", "ACGTACGT", 0).get_band(1) != (2, 6):
+        fail_message = "Band was not widened to keep rows overlapping"
+        test_failed(test_num, fail_message)
+    offset6 = BandedScoringMatrix("ACG", "TTTTACGTT", 1, 4)
+    bands6 = [offset6.get_band(row) for row in range(4)]
+    if bands6 != [(0, 5), (4, 6), (5, 7), (6, 9)]:
+        fail_message = "Incorrect offset bands {0!s}".format(bands6)
+        test_failed(test_num, fail_message)
+    bands6 = [BandedScoringMatrix("ACGTACGT", "AC", 1, -4).get_band(row)
+              for row in range(9)]
+    if bands6 != [(0, 0)] * 4 + [(0, 1), (0, 2), (1, 2), (2, 2), (2, 2)]:
+        fail_message = "Incorrect clipped bands {0!s}".format(bands6)
+        test_failed(test_num, fail_message)
+    test_passed(test_num)
+
+    # Test 7: Alignments end in the lower right corner unless set otherwise.
+    test_num += 1
+    test7 = ScoringMatrix("ACG", "ACGTA")
+    if test7.get_end() != (3, 5):
+        fail_message = "Incorrect default end {0!s}".format(test7.get_end())
+        test_failed(test_num, fail_message)
+    test7.set_end(2, 4)
+    if test7.get_end() != (2, 4):
+        fail_message = "set_end did not move the end"
+        test_failed(test_num, fail_message)
+    test_passed(test_num)
+
+    # Test 8: A matrix kept in a scratch directory behaves like one in memory.
+    test_num += 1
+    test8 = ScoringMatrix("ACG", "ACGTA", tempfile.gettempdir())
+    test8.set_score(2, 3, -7)
+    test8.add_up_backlink(2, 3)
+    test8.add_diagonal_backlink(2, 3)
+    test8.set_score_row(1, range(6))
+    test8.set_backlink_row(3, [LEFT] * 6)
+    if (test8.get_score(2, 3) != -7 or
+            test8.get_backlink_bits(2, 3) != UP | DIAGONAL):
+        fail_message = "Cell accessors do not read back what was written"
+        test_failed(test_num, fail_message)
+    if (list(test8.get_score_row(1)) != list(range(6)) or
+            test8.get_backlink_row(3) != bytearray([LEFT] * 6)):
+        fail_message = "Row accessors do not read back what was written"
+        test_failed(test_num, fail_message)
+    if (list(test8.get_score_column(3)) != [0, 3, -7, 0] or
+            test8.get_size() != 24):
+        fail_message = "Incorrect score column {0!s}".format(list(test8.get_score_column(3)))
+        test_failed(test_num, fail_message)
+    test8.close()
+    with ScoringMatrix("ACG", "ACGTA", tempfile.gettempdir()) as test8:
+        test8.set_score(1, 1, 1)
+    if not (test8.scores.file.closed and test8.backlinks.file.closed):
+        fail_message = "Files were not closed at the end of a with statement"
+        test_failed(test_num, fail_message)
+    test_passed(test_num)
+    print("All {0!s} test cases for scoring_matrix.py passed.".format(test_num))
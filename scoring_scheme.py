@@ -0,0 +1,318 @@
+# This file is part of sequence-aligner.
+# Copyright (C) 2014 Christopher Kyle Horton <chorton@ltu.edu>
+
+# sequence-aligner is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# sequence-aligner is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with sequence-aligner. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+
+from array import array
+
+from encoded_sequence import encode_text
+
+# The BLOSUM62 protein substitution matrix, in the NCBI text format read by
+# read_substitution_matrix.
+BLOSUM62 = """
+   A  R  N  D  C  Q  E  G  H  I  L  K  M  F  P  S  T  W  Y  V  B  Z  X  *
+A  4 -1 -2 -2  0 -1 -1  0 -2 -1 -1 -1 -1 -2 -1  1  0 -3 -2  0 -2 -1  0 -4
+R -1  5  0 -2 -3  1  0 -2  0 -3 -2  2 -1 -3 -2 -1 -1 -3 -2 -3 -1  0 -1 -4
+N -2  0  6  1 -3  0  0  0  1 -3 -3  0 -2 -3 -2  1  0 -4 -2 -3  3  0 -1 -4
+D -2 -2  1  6 -3  0  2 -1 -1 -3 -4 -1 -3 -3 -1  0 -1 -4 -3 -3  4  1 -1 -4
+C  0 -3 -3 -3  9 -3 -4 -3 -3 -1 -1 -3 -1 -2 -3 -1 -1 -2 -2 -1 -3 -3 -2 -4
+Q -1  1  0  0 -3  5  2 -2  0 -3 -2  1  0 -3 -1  0 -1 -2 -1 -2  0  3 -1 -4
+E -1  0  0  2 -4  2  5 -2  0 -3 -3  1 -2 -3 -1  0 -1 -3 -2 -2  1  4 -1 -4
+G  0 -2  0 -1 -3 -2 -2  6 -2 -4 -4 -2 -3 -3 -2  0 -2 -2 -3 -3 -1 -2 -1 -4
+H -2  0  1 -1 -3  0  0 -2  8 -3 -3 -1 -2 -1 -2 -1 -2 -2  2 -3  0  0 -1 -4
+I -1 -3 -3 -3 -1 -3 -3 -4 -3  4  2 -3  1  0 -3 -2 -1 -3 -1  3 -3 -3 -1 -4
+L -1 -2 -3 -4 -1 -2 -3 -4 -3  2  4 -2  2  0 -3 -2 -1 -2 -1  1 -4 -3 -1 -4
+K -1  2  0 -1 -3  1  1 -2 -1 -3 -2  5 -1 -3 -1  0 -1 -3 -2 -2  0  1 -1 -4
+M -1 -1 -2 -3 -1  0 -2 -3 -2  1  2 -1  5  0 -2 -1 -1 -1 -1  1 -3 -1 -1 -4
+F -2 -3 -3 -3 -2 -3 -3 -3 -1  0  0 -3  0  6 -4 -2 -2  1  3 -1 -3 -3 -1 -4
+P -1 -2 -2 -1 -3 -1 -1 -2 -2 -3 -3 -1 -2 -4  7 -1 -1 -4 -3 -2 -2 -1 -2 -4
+S  1 -1  1  0 -1  0  0  0 -1 -2 -2  0 -1 -2 -1  4  1 -3 -2 -2  0  0  0 -4
+T  0 -1  0 -1 -1 -1 -1 -2 -2 -1 -1 -1 -1 -2 -1  1  5 -2 -2  0 -1 -1  0 -4
+W -3 -3 -4 -4 -2 -2 -3 -2 -2 -3 -2 -3 -1  1 -4 -3 -2 11  2 -3 -4 -3 -2 -4
+Y -2 -2 -2 -3 -2 -1 -2 -3  2 -1 -1 -2 -1  3 -3 -2 -2  2  7 -1 -3 -2 -1 -4
+V  0 -3 -3 -3 -1 -2 -2 -3 -3  3  1 -2  1 -1 -2 -2  0 -3 -1  4 -3 -2 -1 -4
+B -2 -1  3  4 -3  0  1 -1  0 -3 -4  0 -3 -3 -2  0 -1 -4 -3 -3  4  1 -1 -4
+Z -1  0  0  1 -3  3  4 -2  0 -3 -3  1 -1 -3 -1  0 -1 -3 -2 -2  1  4 -1 -4
+X  0 -1 -1 -1 -2 -1 -1 -1 -1 -1 -1 -1 -1 -1 -2  0  0 -2 -1 -1 -1 -1 -1 -4
+* -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4  1
+"""
+
+# Substitution matrices which may be given by name instead of by file.
+NAMED_MATRICES = {"BLOSUM62": BLOSUM62}
+
+# Purines and pyrimidines, for transition/transversion weighting.
+PURINES = "AG"
+PYRIMIDINES = "CTU"
+
+def parse_substitution_matrix(text):
+    '''Returns a dictionary mapping each (character, character) pair to its
+    score, from a substitution matrix in the NCBI text format: a header line
+    of column characters, then one line per row character followed by its
+    scores. Lines starting with # are comments.'''
+    columns = None
+    substitutions = {}
+    for line in text.splitlines():
+        fields = line.split()
+        if not fields or fields[0].startswith("#"):
+            continue
+        if columns is None:
+            columns = fields
+            continue
+        if len(fields) != len(columns) + 1:
+            raise ValueError("malformed substitution matrix row: " + line)
+        for column, score in zip(columns, fields[1:]):
+            substitutions[(fields[0], column)] = int(score)
+    if not substitutions:
+        raise ValueError("empty substitution matrix")
+    return substitutions
+
+def read_substitution_matrix(name):
+    '''Returns the substitution dictionary of a named matrix such as
+    BLOSUM62, or of the NCBI format matrix file at the given path.'''
+    if name.upper() in NAMED_MATRICES:
+        return parse_substitution_matrix(NAMED_MATRICES[name.upper()])
+    with open(name) as f:
+        return parse_substitution_matrix(f.read())
+
+def transition_transversion(match=1, transition=0, transversion=-1):
+    '''Returns a substitution dictionary for nucleotides which scores
+    transitions (purine to purine, pyrimidine to pyrimidine) apart from
+    transversions.'''
+    substitutions = {}
+    for a in PURINES + PYRIMIDINES:
+        for b in PURINES + PYRIMIDINES:
+            if a == b:
+                substitutions[(a, b)] = match
+            elif (a in PURINES) == (b in PURINES):
+                substitutions[(a, b)] = transition
+            else:
+                substitutions[(a, b)] = transversion
+    return substitutions
+
+class ScoringScheme:
+    '''The scores used to align two sequences.
+
+    Pairs of characters are scored by a substitution dictionary, falling back
+    to match and mismatch for pairs it does not list. A gap of length k
+    inside the alignment scores gap_open + k * gap, so a gap_open of 0 gives
+    linear gap scores and anything else affine (Gotoh) gap scores. Terminal
+    gaps of a semi-global alignment score terminal_gap per position.
+
+    The substitution scores are tabulated by code when the scheme is built,
+    and the profile of the last query is kept, so one scheme can be reused
+    for any number of alignments without rebuilding its tables.'''
+    def __init__(self, match=1, mismatch=0, gap=-1, terminal_gap=0,
+                 gap_open=0, substitutions=None):
+        '''Initializes this ScoringScheme instance.
+
+        The defaults are the scores sequence-aligner has always used.'''
+        self.match = match
+        self.mismatch = mismatch
+        self.gap = gap
+        self.terminal_gap = terminal_gap
+        self.gap_open = gap_open
+        self.substitutions = dict(substitutions or {})
+        # table[a][b] is the score of codes a and b.
+        self.table = [[mismatch] * 256 for x in range(256)]
+        for code in range(256):
+            self.table[code][code] = match
+        for (a, b), score in self.substitutions.items():
+            for a_code in set(encode_text(a + a.upper() + a.lower())):
+                for b_code in set(encode_text(b + b.upper() + b.lower())):
+                    self.table[a_code][b_code] = score
+        # Profiles take one byte per position when every score fits in one.
+        scores = [score for row in self.table for score in row]
+        if -128 <= min(scores) and max(scores) <= 127:
+            self.profile_typecode = 'b'
+        else:
+            self.profile_typecode = 'i'
+        self.query = None
+        self.query_profiles = {}
+        self.query_arrays = {}
+
+    def __repr__(self):
+        return ("ScoringScheme(match={0!r}, mismatch={1!r}, gap={2!r}, "
+                "terminal_gap={3!r}, gap_open={4!r}, substitutions=<{5!s} "
+                "pairs>)".format(self.match, self.mismatch, self.gap,
+                                 self.terminal_gap, self.gap_open,
+                                 len(self.substitutions)))
+
+    def is_affine(self):
+        '''Returns True iff opening a gap costs more than extending one.'''
+        return self.gap_open != 0
+
+    def key(self):
+        '''Returns a tuple which is equal for schemes scoring alike.'''
+        return (self.match, self.mismatch, self.gap, self.terminal_gap,
+                self.gap_open, tuple(sorted(self.substitutions.items())))
+
+    def score(self, a, b):
+        '''Returns the score of aligning code a against code b.'''
+        return self.table[a][b]
+
+    def use_query(self, top_codes):
+        '''Makes top_codes the query whose profiles are cached, dropping the
+        cached profiles of any other query.'''
+        query = bytes(top_codes)
+        if query != self.query:
+            self.query = query
+            self.query_profiles = {}
+            self.query_arrays = {}
+
+    def profiles(self, left_codes, top_codes):
+        '''Returns a dictionary mapping each code in the left sequence to an
+        array of the diagonal scores it earns against every position of the
+        top sequence, so the inner loops need a lookup instead of a
+        comparison. When every score fits in a byte, as the usual ones do,
+        each profile takes one byte per position of the top sequence.'''
+        self.use_query(top_codes)
+        profiles = self.query_profiles
+        for c in set(left_codes):
+            if c not in profiles:
+                row = self.table[c]
+                if self.profile_typecode == 'b':
+                    # Translate the whole top sequence through the row.
+                    scores = bytearray(score & 255 for score in row)
+                    profiles[c] = signed_bytes(
+                        bytearray(top_codes).translate(scores))
+                else:
+                    profiles[c] = array('i', [row[t] for t in top_codes])
+        return profiles
+
+    def profile_arrays(self, left_codes, top_codes):
+        '''Returns the same profiles as profiles, as NumPy arrays.'''
+        self.use_query(top_codes)
+        arrays = self.query_arrays
+        missing = set(left_codes).difference(arrays)
+        if missing:
+            numpy = import_numpy()
+            top = numpy.frombuffer(bytes(top_codes), dtype=numpy.uint8)
+            for c in missing:
+                arrays[c] = numpy.array(self.table[c],
+                                        dtype=numpy.int64)[top]
+        return arrays
+
+def signed_bytes(data):
+    '''Returns an array('b') of the bytes of data read as signed integers.'''
+    result = array('b')
+    if hasattr(result, "frombytes"):
+        result.frombytes(bytes(data))
+    else:
+        result.fromstring(bytes(data))
+    return result
+
+def import_numpy():
+    '''Returns the numpy module, or None if it is not installed. NumPy is
+    slow to import, so it is only imported by the code which uses it.'''
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+def add_scheme_arguments(parser):
+    '''Adds the options chosen by scheme_from_arguments to the given
+    argparse parser.'''
+    parser.add_argument("--match", type=int, default=1, metavar="SCORE",
+                        help="Score of a match (default 1).")
+    parser.add_argument("--mismatch", type=int, default=0, metavar="SCORE",
+                        help="Score of a mismatch (default 0).")
+    parser.add_argument("--transition", type=int, metavar="SCORE",
+                        help="Score of a nucleotide transition, leaving "
+                             "--mismatch for transversions.")
+    parser.add_argument("--matrix", metavar="NAME",
+                        help="Substitution matrix to score pairs with: "
+                             "BLOSUM62, or the path of a matrix file in "
+                             "NCBI format.")
+    parser.add_argument("--gap", type=int, default=-1, metavar="SCORE",
+                        help="Score of each position of a gap (default -1).")
+    parser.add_argument("--gap-open", type=int, default=0, metavar="SCORE",
+                        help="Extra score for opening a gap, for affine gap "
+                             "scores (default 0).")
+    parser.add_argument("--terminal-gap", type=int, default=0,
+                        metavar="SCORE",
+                        help="Score of each position of a terminal gap in a "
+                             "semi-global alignment (default 0).")
+
+def scheme_from_arguments(args):
+    '''Returns the ScoringScheme for options added by add_scheme_arguments.
+    Raises IOError or ValueError if the substitution matrix can't be read.'''
+    substitutions = None
+    if args.matrix is not None:
+        substitutions = read_substitution_matrix(args.matrix)
+    elif args.transition is not None:
+        substitutions = transition_transversion(args.match, args.transition,
+                                                args.mismatch)
+    return ScoringScheme(args.match, args.mismatch, args.gap,
+                         args.terminal_gap, args.gap_open, substitutions)
+
+if __name__ == "__main__":
+    # Unit test
+    def test_failed(test_number, fail_string):
+        print("Test {0!s} failed: {1!s}".format(test_number, fail_string))
+        exit(1)
+
+    def test_passed(test_number):
+        print("Test {0!s} passed.".format(test_number))
+
+    # Test 1 - Default scores
+    scheme = ScoringScheme()
+    a, c = encode_text("AC")
+    if scheme.score(a, a) != 1 or scheme.score(a, c) != 0:
+        test_failed(1, "Unexpected default substitution scores.")
+    if scheme.is_affine():
+        test_failed(1, "Default scheme should have linear gaps.")
+    test_passed(1)
+
+    # Test 2 - BLOSUM62 is symmetric and matches a few known entries
+    blosum = read_substitution_matrix("blosum62")
+    for (x, y), score in blosum.items():
+        if blosum[(y, x)] != score:
+            test_failed(2, "BLOSUM62 is not symmetric at " + x + y)
+    if blosum[("W", "W")] != 11 or blosum[("A", "R")] != -1:
+        test_failed(2, "Unexpected BLOSUM62 entries.")
+    test_passed(2)
+
+    # Test 3 - Transitions and transversions
+    scheme = ScoringScheme(substitutions=transition_transversion(2, 1, -1))
+    a, c, g = encode_text("ACG")
+    if [scheme.score(a, a), scheme.score(a, g), scheme.score(a, c)] != [2, 1, -1]:
+        test_failed(3, "Unexpected transition/transversion scores.")
+    test_passed(3)
+
+    # Test 4 - Profiles are cached for the last query
+    left, top = encode_text("GA"), encode_text("GAGA")
+    profiles = scheme.profiles(left, top)
+    if list(profiles[g]) != [2, 1, 2, 1]:
+        test_failed(4, "Unexpected profile " + str(profiles[g]))
+    if scheme.profiles(left, top) is not profiles:
+        test_failed(4, "Profiles of the same query were rebuilt.")
+    test_passed(4)
+
+    # Test 5 - Profiles are one byte per position unless a score needs more
+    top = encode_text("ACGTN" * 20)
+    for scheme in (ScoringScheme(mismatch=-3), ScoringScheme(match=500),
+                   ScoringScheme(substitutions=read_substitution_matrix(
+                       "BLOSUM62"))):
+        profiles = scheme.profiles(top, top)
+        for c in set(top):
+            if list(profiles[c]) != [scheme.score(c, t) for t in top]:
+                test_failed(5, "Unexpected profile " + str(profiles[c]))
+        if (profiles[c].itemsize == 1) != (scheme.match < 128):
+            test_failed(5, "Unexpected profile item size.")
+    test_passed(5)
+
+    print("All 5 test cases for scoring_scheme.py passed.")
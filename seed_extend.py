@@ -0,0 +1,178 @@
+# This file is part of sequence-aligner.
+# Copyright (C) 2014 Christopher Kyle Horton <chorton@ltu.edu>
+
+# sequence-aligner is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# sequence-aligner is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with sequence-aligner. If not, see <http://www.gnu.org/licenses/>.
+
+# Seed-and-extend alignment of long, similar sequences.
+#
+# Every k-mer of the top sequence is indexed, and each k-mer of the left
+# sequence found in the index is an exact match. Matches on the same
+# diagonal which overlap are merged into anchors, and the best collinear
+# chain of anchors is taken to be part of the alignment. Only the regions
+# between consecutive anchors, and before the first and after the last, are
+# then aligned by dynamic programming, so for similar sequences most of the
+# table is never filled. Like any seeding heuristic, the alignment found can
+# be worse than the optimal one if the chain includes a misleading anchor.
+
+from __future__ import print_function
+
+from alignment import from_moves
+from encoded_sequence import encode
+from scoring_algorithm import align_region, edge_gap_scores, get_scheme
+from scoring_algorithm import path_score
+from stats import timed
+
+DEFAULT_SEED_LENGTH = 11
+
+# k-mers occurring more often than this in the top sequence are too
+# repetitive to anchor an alignment, and are left out of the index.
+MAX_OCCURRENCES = 8
+
+# Chaining takes time quadratic in the number of anchors, so beyond this
+# many only the longest are chained.
+MAX_ANCHORS = 2000
+
+def kmer_index(codes, k):
+    '''Returns a dictionary from each k-mer of the given codes, as bytes, to
+    the list of positions it starts at, leaving out k-mers which occur more
+    than MAX_OCCURRENCES times.'''
+    data = bytes(codes)
+    index = {}
+    for position in range(len(data) - k + 1):
+        index.setdefault(data[position:position + k], []).append(position)
+    for kmer in [kmer for kmer, positions in index.items()
+                 if len(positions) > MAX_OCCURRENCES]:
+        del index[kmer]
+    return index
+
+def find_anchors(left, index, k):
+    '''Returns a list of (row, column, length) anchors, the maximal runs of
+    k-mers of the left codes found at consecutive positions of the top
+    sequence through its kmer_index.'''
+    data = bytes(left)
+    anchors = []
+    # The anchor most recently started on each diagonal.
+    runs = {}
+    for row in range(len(data) - k + 1):
+        for column in index.get(data[row:row + k], ()):
+            diagonal = column - row
+            run = runs.get(diagonal)
+            if run is not None and run[0] + run[2] - k == row - 1:
+                run[2] += 1
+            else:
+                run = runs[diagonal] = [row, column, k]
+                anchors.append(run)
+    return [tuple(anchor) for anchor in anchors]
+
+def chain_anchors(anchors):
+    '''Returns the highest-scoring list of anchors which follow one another
+    in both sequences without overlapping, in order. A chain scores the
+    total length of its anchors, less the shift in diagonal between each
+    anchor and the next.'''
+    if len(anchors) > MAX_ANCHORS:
+        anchors = sorted(anchors, key=lambda anchor: -anchor[2])[:MAX_ANCHORS]
+    anchors = sorted(anchors)
+    scores = []
+    links = []
+    for a, (row, column, length) in enumerate(anchors):
+        score, link = length, None
+        for b in range(a):
+            r, c, l = anchors[b]
+            if r + l <= row and c + l <= column:
+                chained = scores[b] + length - abs((column - row) - (c - r))
+                if chained > score:
+                    score, link = chained, b
+        scores.append(score)
+        links.append(link)
+    if not anchors:
+        return []
+    chain = []
+    a = max(range(len(anchors)), key=lambda a: scores[a])
+    while a is not None:
+        chain.append(anchors[a])
+        a = links[a]
+    chain.reverse()
+    return chain
+
+def best_diagonal(sequence1, sequence2, k=DEFAULT_SEED_LENGTH):
+    '''Returns the diagonal (column less row) of the table for sequence1
+    (the left sequence) and sequence2 (the top sequence) along which its
+    k-mer anchors cover the most of sequence1, or None if no anchors were
+    found. Ties go to the diagonal nearest the upper left corner.'''
+    left, top = encode(sequence1).codes(), encode(sequence2).codes()
+    totals = {}
+    for row, column, length in find_anchors(left, kmer_index(top, k), k):
+        totals[column - row] = totals.get(column - row, 0) + length
+    if not totals:
+        return None
+    return min(totals, key=lambda diagonal: (-totals[diagonal], abs(diagonal)))
+
+def get_seeded_alignment(sequence1, sequence2, k=DEFAULT_SEED_LENGTH,
+                         alignment_is_global=False, scheme=None, stats=None):
+    '''Returns a tuple (alignment, cells) of an Alignment of sequence1 (the
+    left sequence) and sequence2 (the top sequence) found by seed and extend
+    with k-mer anchors, and the number of table cells it filled, or None if
+    no anchors were found.
+
+    Performs a semi-global alignment by default unless alignment_is_global
+    is specified to be True. Raises ValueError if the scheme has affine gap
+    scores. The phases are recorded in stats, if given.'''
+    scheme = get_scheme(scheme)
+    if scheme.is_affine():
+        raise ValueError("seed-and-extend alignment needs linear gap scores")
+    left, top = encode(sequence1).codes(), encode(sequence2).codes()
+    with timed(stats, "seed"):
+        chain = chain_anchors(find_anchors(left, kmer_index(top, k), k))
+    if not chain:
+        return None
+    with timed(stats, "extend"):
+        profiles = scheme.profiles(left, top)
+        rows, columns = len(left), len(top)
+        row_gaps = edge_gap_scores(rows, alignment_is_global, scheme)
+        column_gaps = edge_gap_scores(columns, alignment_is_global, scheme)
+        ops = []
+        cells = 0
+        r0 = c0 = 0
+        for row, column, length in chain + [(rows, columns, 0)]:
+            align_region(left, profiles, r0, row, c0, column, row_gaps,
+                         column_gaps, ops)
+            cells += (row - r0 + 1) * (column - c0 + 1)
+            ops.extend("D" * length)
+            r0, c0 = row + length, column + length
+        score = path_score(left, top, ops, 0, 0, row_gaps, column_gaps,
+                           scheme)
+    if stats is not None:
+        stats.add("cells", cells)
+        stats.add("anchors", len(chain))
+    return (from_moves(left, top, ops, 0, 0, score), cells)
+
+if __name__ == "__main__":
+    # Unit testing
+    from scoring_algorithm import get_linear_space_alignment
+    index = kmer_index(bytearray(b"ACGTACGA"), 3)
+    assert index[b"ACG"] == [0, 4] and index[b"CGA"] == [5]
+    anchors = find_anchors(bytearray(b"TACGTA"), index, 3)
+    assert (1, 0, 5) in anchors
+    assert chain_anchors([(0, 0, 5), (2, 10, 4), (6, 6, 4)]) == \
+           [(0, 0, 5), (6, 6, 4)]
+    top = "ATGAGTCTTCTAACCGAGGTCGAAACGTACGTTCTCTCTATCGTCCCGTCAGGCCCCCTCAAAG"
+    left = top[5:30] + "G" + top[31:60]
+    for alignment_is_global in (False, True):
+        alignment, cells = get_seeded_alignment(left, top, 8,
+                                                alignment_is_global)
+        expected = get_linear_space_alignment(left, top, alignment_is_global)
+        assert alignment.get_score() == expected.get_score()
+        assert cells < (len(left) + 1) * (len(top) + 1)
+    assert get_seeded_alignment("ACGTACGT", "TTTTTTTT", 4) is None
+    print("All seed-and-extend tests passed.")
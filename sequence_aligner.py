@@ -19,84 +19,322 @@
 # Christopher Kyle Horton (000516274), chorton@ltu.edu
 # Last modified: 11/6/2014
 
+from __future__ import print_function
+
 import argparse
-from copy import deepcopy
 import os.path
-import webbrowser
+import sys
+
+from aligner import Aligner
+from scoring_scheme import add_scheme_arguments, scheme_from_arguments
+from stats import Stats, timed, report_stats, start_profiler
 
-from scoring_matrix import ScoringMatrix
-from scoring_algorithm import get_alignments
-from terminal_output import print_matrix, print_alignments
-from html_output import write_html
+try:
+    input = raw_input
+except NameError:
+    pass
 
 version = "v1.0.0"
 desc = "sequence-aligner " + version
-desc += "\nFinds semi-global alignments between FASTA sequences."
+desc += "\nFinds semi-global, global or local alignments between FASTA sequences."
 infile_help="""
 Reads in the sequence from the given file path if the file exists.
 Otherwise, treats this as a sequence string to align.
 """
 
-#============================================================================
-# Main program code
-#============================================================================
-
-# Set up commandline argument parser
-parser = argparse.ArgumentParser(
-            formatter_class=argparse.RawDescriptionHelpFormatter,
-            description=desc
-            )
-parser.add_argument("sequence1", help=infile_help)
-parser.add_argument("sequence2", help=infile_help)
-parser.add_argument("-g", "--global-align", action="store_true",
-                    help="Perform a global alignment instead.")
-parser.add_argument("-v", "--view-html", action="store_true",
-                    help="Automatically view HTML5 output in browser.")
-args = parser.parse_args()
-if args.global_align:
-    alignment_is_global = True
-else:
-    alignment_is_global = False
-
-# Read in sequences from FASTA files, if they exist
-# Ignore first line since that's just header info, not part of the sequence
-path1, path2 = args.sequence1, args.sequence2
-sequence1 = sequence2 = ""
-if os.path.exists(path1):
+# Tables with more cells than this are only printed if asked for.
+TABLE_LIMIT = 2500
+
+def make_parser():
+    '''Returns the commandline argument parser.'''
+    parser = argparse.ArgumentParser(
+                formatter_class=argparse.RawDescriptionHelpFormatter,
+                description=desc
+                )
+    parser.add_argument("sequence1", help=infile_help)
+    parser.add_argument("sequence2", help=infile_help)
+    parser.add_argument("-g", "--global-align", action="store_true",
+                        help="Perform a global alignment instead.")
+    parser.add_argument("-L", "--local-align", action="store_true",
+                        help="Perform a local (Smith-Waterman) alignment "
+                             "instead.")
+    parser.add_argument("-x", "--x-drop", type=int, metavar="X",
+                        help="In a local alignment, stop extending paths whose "
+                             "score falls more than X below the best so far.")
+    parser.add_argument("-v", "--view-html", action="store_true",
+                        help="Automatically view HTML5 output in browser.")
+    parser.add_argument("-t", "--show-table", nargs="?", const="full",
+                        choices=["full", "path"],
+                        help="Print the table in the terminal even if it is "
+                             "large, either in full or only around the "
+                             "optimal alignments.")
+    parser.add_argument("-o", "--output", metavar="HTML",
+                        default="output.html",
+                        help="File to write the HTML5 output to (default: "
+                             "%(default)s).")
+    parser.add_argument("--corridor", action="store_true",
+                        help="Only include the cells around the optimal "
+                             "alignments in the HTML table.")
+    parser.add_argument("--vectorized", action="store_true",
+                        help="Fill the table a row at a time with NumPy.")
+    parser.add_argument("-j", "--jobs", type=int, metavar="N",
+                        help="Fill the table with N processes, a wavefront "
+                             "of tiles at a time.")
+    parser.add_argument("--tile-size", type=int, metavar="N",
+                        help="With --jobs, fill tiles of N x N cells "
+                             "(default: 256).")
+    parser.add_argument("-l", "--linear-space", action="store_true",
+                        help="Find one optimal alignment in linear memory, "
+                             "without a dynamic programming table.")
+    parser.add_argument("-s", "--score-only", action="store_true",
+                        help="Only print the optimal score and where the "
+                             "alignment ends.")
+    parser.add_argument("-b", "--band", type=int, metavar="K",
+                        help="Only fill cells within K columns of the "
+                             "diagonal, widening the band while the alignment "
+                             "touches it (a heuristic).")
+    parser.add_argument("-k", "--seed", type=int, metavar="K",
+                        help="Only fill the table between chained exact "
+                             "matches of K letters (seed and extend), for "
+                             "long, similar sequences.")
+    parser.add_argument("--scratch-dir", metavar="DIR",
+                        help="Keep the table in files in DIR rather than in "
+                             "memory, for tables larger than memory. The "
+                             "HTML5 table then only covers the optimal "
+                             "alignments, as with --corridor.")
+    parser.add_argument("-r", "--reference", metavar="FASTA",
+                        help="Indexed FASTA file from which a sequence given "
+                             "as a record name or name:start-end region is "
+                             "fetched.")
+    parser.add_argument("-m", "--max-alignments", type=int, metavar="N",
+                        help="Show at most N of the optimal alignments.")
+    parser.add_argument("--cache-dir", metavar="DIR",
+                        help="Directory in which alignments of large tables "
+                             "are cached (default: "
+                             "~/.cache/sequence-aligner).")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Neither look up nor store alignments in the "
+                             "cache.")
+    parser.add_argument("--stats", action="store_true",
+                        help="Print the time spent in each phase, counters "
+                             "and peak memory to standard error.")
+    parser.add_argument("--stats-json", metavar="FILE",
+                        help="Write the same statistics as --stats to FILE as "
+                             "JSON.")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="Profile the run with cProfile and save the "
+                             "profile to FILE.")
+    add_scheme_arguments(parser)
+    return parser
+
+def read_sequence(path, reference):
+    '''Returns a tuple (header, sequence) of the first record of the FASTA
+    file at path if it exists, else of the region of that name in the
+    FastaIndex reference if one is given and has it, else of path itself as
+    a sequence with no header. Raises IOError if the file can't be read.'''
+    if os.path.exists(path):
+        from fasta import read_first_record
+        return read_first_record(path)
+    if reference is not None:
+        region = reference.fetch_region(path)
+        if region is not None:
+            return (path, region)
+    return (None, path.upper())
+
+def main(argv=None):
+    '''Runs the command line tool with the given arguments, or those of the
+    process, and returns its exit status.'''
+    args = make_parser().parse_args(argv)
     try:
-        with open(path1, 'r') as infile1_reading:
-            lines1 = infile1_reading.readlines()[1:]
-        for line in lines1:
-            sequence1 += line.upper().strip()
-    except IOError:
-        print "Error: could not open first file:", path1
-        exit(1)
-else:
-    sequence1 = path1.upper()
-if os.path.exists(path2):
+        scheme = scheme_from_arguments(args)
+    except (IOError, ValueError) as e:
+        print("Error: could not read substitution matrix:", args.matrix)
+        print(e)
+        return 1
+    if args.linear_space and scheme.is_affine():
+        print("Error: --linear-space does not support --gap-open.")
+        return 1
+    if args.local_align and (args.global_align or args.band is not None):
+        print("Error: --local-align can't be combined with -g or --band.")
+        return 1
+    if args.x_drop is not None and (not args.local_align or args.score_only or
+                                    args.linear_space):
+        print("Error: --x-drop only applies to --local-align with a full "
+              "table.")
+        return 1
+    if args.seed is not None and (args.local_align or args.band is not None or
+                                  args.linear_space or args.score_only):
+        print("Error: --seed can't be combined with --local-align, --band, "
+              "--linear-space or --score-only.")
+        return 1
+    if args.seed is not None and scheme.is_affine():
+        print("Error: --seed does not support --gap-open.")
+        return 1
+    if args.jobs is not None and (args.local_align or args.band is not None or
+                                  args.linear_space or args.vectorized or
+                                  args.score_only or
+                                  args.scratch_dir is not None):
+        print("Error: --jobs can't be combined with --local-align, --band, "
+              "--linear-space, --vectorized, --score-only or --scratch-dir.")
+        return 1
+    if (args.jobs is not None and args.jobs < 1 or
+            args.tile_size is not None and args.tile_size < 1):
+        print("Error: --jobs and --tile-size must be at least 1.")
+        return 1
+    if args.scratch_dir is not None and not os.path.isdir(args.scratch_dir):
+        print("Error: scratch directory does not exist:", args.scratch_dir)
+        return 1
+    if args.global_align:
+        mode = "global"
+    elif args.local_align:
+        mode = "local"
+    else:
+        mode = "semi-global"
+    aligner = Aligner(mode, scheme, args.max_alignments, args.band,
+                      args.x_drop, args.linear_space, args.vectorized,
+                      args.seed, args.scratch_dir, args.jobs,
+                      args.tile_size)
+
+    stats = profiler = None
+    # Seed and extend reports how many cells it filled through stats.
+    if args.stats or args.stats_json or args.seed is not None:
+        stats = Stats()
+    if args.profile:
+        profiler = start_profiler()
+
+    def finish_run():
+        '''Reports the statistics and saves the profile, if asked for.'''
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        if args.stats or args.stats_json:
+            report_stats(stats, args.stats, args.stats_json)
+
+    # Read in sequences from FASTA files, if they exist
+    # Only the first record of each file is used.
+    with timed(stats, "read"):
+        reference = None
+        if args.reference:
+            from fasta import FastaIndex
+            try:
+                reference = FastaIndex(args.reference)
+            except (IOError, OSError, ValueError) as e:
+                print("Error: could not index reference file:",
+                      args.reference)
+                print(e)
+                return 1
+        try:
+            header1, sequence1 = read_sequence(args.sequence1, reference)
+        except IOError:
+            print("Error: could not open first file:", args.sequence1)
+            return 1
+        try:
+            header2, sequence2 = read_sequence(args.sequence2, reference)
+        except IOError:
+            print("Error: could not open second file:", args.sequence2)
+            return 1
+        if reference is not None:
+            reference.close()
+
+    # Ensure sequence1 is always the longer one.
+    if len(sequence1) > len(sequence2):
+        sequence1, sequence2 = sequence2, sequence1
+        header1, header2 = header2, header1
+    # Name the sequences which came from FASTA records or regions.
+    if header2 is not None:
+        print("Top sequence:", header2)
+    if header1 is not None:
+        print("Left sequence:", header1)
+
+    if args.score_only:
+        with timed(stats, "score"):
+            score, row, column = aligner.score(sequence1, sequence2)
+        if stats is not None:
+            stats.add("cells", (len(sequence1) + 1) * (len(sequence2) + 1))
+        print("Score:", score)
+        print("Ends at row {0!s}, column {1!s}".format(row, column))
+        finish_run()
+        return 0
+
+    # Small tables are quicker to fill than to look up, and are printed.
+    cache = cached = None
+    if (not args.no_cache and not args.show_table and
+            (len(sequence1) + 1) * (len(sequence2) + 1) > TABLE_LIMIT):
+        from cache import default_cache_dir, open_cache
+        cache = open_cache(args.cache_dir or default_cache_dir())
+        parameters = aligner.parameters()
+    if cache is not None:
+        with timed(stats, "cache"):
+            cached = cache.get(sequence1, sequence2, parameters)
+
+    from terminal_output import print_matrix, print_alignments, path_window
+    total = None
+    # A table kept in a scratch directory holds its files until closed.
+    sm = None
     try:
-        with open(path2, 'r') as infile2_reading:
-            lines2 = infile2_reading.readlines()[1:]
-        for line in lines2:
-            sequence2 += line.upper().strip()
-    except IOError:
-        print "Error: could not open second file:", path2
-        exit(1)
-else:
-    sequence2 = path2.upper()
-
-# Ensure sequence1 is always the longer one.
-if len(sequence1) > len(sequence2):
-    sequence1, sequence2 = sequence2, sequence1
-
-sm = ScoringMatrix(sequence1, sequence2)
-alignments = get_alignments(sm, alignment_is_global)
-print_matrix(sm)
-print_alignments(deepcopy(alignments))
-html_file = write_html(sm, alignments, alignment_is_global)
-print "Output written to", html_file
-if args.view_html:
-    webbrowser.get().open(html_file)
-elif raw_input("Open HTML output in your web browser (y/n)? ").lower() == 'y':
-    webbrowser.get().open(html_file)
-exit(0)
+        if cached is not None:
+            alignments, total = cached
+            print("Using cached alignments; no table is available.")
+        else:
+            sm, alignments = aligner.align_matrix(sequence1, sequence2, stats)
+            if args.seed is not None and sm is None:
+                full = (len(sequence1) + 1) * (len(sequence2) + 1)
+                cells = stats.get_count("cells")
+                print("Seed and extend: {0!s} anchors, filled {1!s} of {2!s} "
+                      "cells ({3:.1f}%)".format(stats.get_count("anchors"),
+                                                cells, full,
+                                                100.0 * cells / full))
+            elif args.seed is not None:
+                print("Seed and extend found no anchors; filled the full "
+                      "table.")
+        if sm is not None:
+            if args.band is not None:
+                print("Band width:", sm.band)
+                if sm.offset is not None:
+                    print("Band diagonal: column - row =", sm.offset)
+            with timed(stats, "print_matrix"):
+                if args.show_table == "path":
+                    print_matrix(sm, *path_window(sm))
+                elif (args.show_table or
+                        sm.get_rows() * sm.get_columns() <= TABLE_LIMIT):
+                    print_matrix(sm)
+                else:
+                    print("Table of {0!s} x {1!s} cells not printed; use -t "
+                          "to print it.".format(sm.get_rows(),
+                                                sm.get_columns()))
+            from scoring_algorithm import count_alignments
+            with timed(stats, "count"):
+                total = count_alignments(sm)
+        if cache is not None:
+            with timed(stats, "cache"):
+                if cached is None:
+                    cache.put(sequence1, sequence2, parameters, alignments,
+                              total)
+                cache.close()
+        if total is not None and total > len(alignments):
+            print("{0!s} optimal alignments, showing {1!s}".format(
+                total, len(alignments)))
+        with timed(stats, "print_alignments"):
+            print_alignments(alignments)
+        from html_output import write_html
+        with timed(stats, "write_html"):
+            html_file = write_html(sm, alignments,
+                                   aligner.alignment_is_global,
+                                   aligner.alignment_is_local,
+                                   (args.corridor or
+                                    args.scratch_dir is not None),
+                                   args.output)
+    finally:
+        if sm is not None:
+            sm.close()
+    print("Output written to", html_file)
+    finish_run()
+    if (args.view_html or
+            input("Open HTML output in your web browser (y/n)? ").lower()
+            == 'y'):
+        import webbrowser
+        webbrowser.get().open(html_file)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
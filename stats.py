@@ -0,0 +1,153 @@
+# This file is part of sequence-aligner.
+# Copyright (C) 2014 Christopher Kyle Horton <chorton@ltu.edu>
+
+# sequence-aligner is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# sequence-aligner is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with sequence-aligner. If not, see <http://www.gnu.org/licenses/>.
+
+# Timers and counters for the phases of an alignment run.
+#
+# Functions which can report on their work take an optional Stats object,
+# and wrap each phase in timed(stats, name), which costs nothing when stats
+# is None.
+
+from contextlib import contextmanager
+import json
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def peak_memory_kb():
+    '''Returns the peak resident memory of this process in kilobytes, or
+    None if it is not known.'''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak //= 1024
+    return peak
+
+class Stats:
+    '''The time spent in each named phase of a run, in the order the phases
+    first started, and a set of named counters.'''
+    def __init__(self):
+        self.phases = []
+        self.seconds = {}
+        self.counters = {}
+        self.started = time.time()
+
+    @contextmanager
+    def phase(self, name):
+        '''Adds the time spent in the with block to the named phase.'''
+        if name not in self.seconds:
+            self.phases.append(name)
+            self.seconds[name] = 0.0
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.time() - start
+
+    def add(self, name, count=1):
+        '''Adds count to the named counter.'''
+        self.counters[name] = self.counters.get(name, 0) + count
+
+    def get_seconds(self, name):
+        '''Returns the time spent in the named phase so far.'''
+        return self.seconds.get(name, 0.0)
+
+    def get_count(self, name):
+        '''Returns the value of the named counter.'''
+        return self.counters.get(name, 0)
+
+    def gcups(self):
+        '''Returns the number of table cells filled per second, in billions,
+        or None if no cells were filled. Cells are filled in the fill phase,
+        or the score phase when only scores are computed.'''
+        seconds = self.get_seconds("fill") + self.get_seconds("score")
+        if not self.get_count("cells") or not seconds:
+            return None
+        return self.get_count("cells") / seconds / 1e9
+
+    def summary(self):
+        '''Returns a dictionary of everything recorded, as dumped to JSON.'''
+        return {"phases": [{"name": name, "seconds": self.seconds[name]}
+                           for name in self.phases],
+                "counters": dict(self.counters),
+                "gcups": self.gcups(),
+                "total_seconds": time.time() - self.started,
+                "peak_memory_kb": peak_memory_kb()}
+
+    def format(self):
+        '''Returns everything recorded as a human-readable table.'''
+        summary = self.summary()
+        lines = ["Statistics:"]
+        for phase in summary["phases"]:
+            lines.append("  {0:<20}{1:>12.6f} s".format(phase["name"],
+                                                        phase["seconds"]))
+        lines.append("  {0:<20}{1:>12.6f} s".format("total",
+                                                    summary["total_seconds"]))
+        for name in sorted(summary["counters"]):
+            lines.append("  {0:<20}{1:>12}".format(name,
+                                                   summary["counters"][name]))
+        if summary["gcups"] is not None:
+            lines.append("  {0:<20}{1:>12.6f}".format("GCUPS",
+                                                      summary["gcups"]))
+        if summary["peak_memory_kb"] is not None:
+            lines.append("  {0:<20}{1:>12} KB".format(
+                "peak memory", summary["peak_memory_kb"]))
+        return "\n".join(lines) + "\n"
+
+def report_stats(stats, show=True, json_path=None):
+    '''Prints stats to standard error if show is True, and writes them to
+    the file json_path as JSON if it is given.'''
+    if show:
+        sys.stderr.write(stats.format())
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(stats.summary(), f, indent=2, sort_keys=True)
+
+def start_profiler():
+    '''Returns a new cProfile profiler, already running. Disable it and save
+    its profile with dump_stats, for viewing with the pstats module.'''
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+@contextmanager
+def timed(stats, name):
+    '''Times the with block as the named phase of stats, unless stats is
+    None.'''
+    if stats is None:
+        yield
+    else:
+        with stats.phase(name):
+            yield
+
+if __name__ == "__main__":
+    # Unit testing
+    stats = Stats()
+    with timed(stats, "fill"):
+        time.sleep(0.01)
+    with timed(None, "unused"):
+        pass
+    stats.add("cells", 10 ** 6)
+    stats.add("cells", 10 ** 6)
+    assert stats.phases == ["fill"] and stats.get_seconds("fill") >= 0.01
+    assert stats.get_count("cells") == 2 * 10 ** 6
+    assert stats.gcups() is not None
+    sys.stdout.write(stats.format())
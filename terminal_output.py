@@ -19,56 +19,107 @@
 # Christopher Kyle Horton (000516274), chorton@ltu.edu
 # Last modified: 11/6/2014
 
+from __future__ import print_function
+
+import sys
+
 from scoring_matrix import ScoringMatrix
+from scoring_matrix import UP, DIAGONAL, LEFT
+
+# The text of each half of a cell, indexed by its backlink bitmask.
+TOP_HALVES = [("\\ " if bits & DIAGONAL else "  ") +
+              ("^ " if bits & UP else "  ") + "|" for bits in range(256)]
+LEFT_ARROWS = ["<" if bits & LEFT else " " for bits in range(256)]
+BLANK_CELL = "    |"
 
-def print_bottom_border(columns):
-    '''Prints the bottom border of a table row.'''
-    output_row = "-+"
-    for column in range(0, columns):
-        output_row += "----+"
-    print output_row
+def bottom_border(columns):
+    '''Returns the bottom border of a table row of the given width.'''
+    return "-+" + "----+" * columns + "\n"
 
-def print_matrix(sm):
-    '''Prints the given ScoringMatrix to the terminal.'''
+def path_window(sm, margin=2):
+    '''Returns a tuple (rows, columns) of the first and last row and column
+    around the optimal paths of a pruned ScoringMatrix, widened by margin
+    cells on each side, for print_matrix to show.'''
+    end_row, end_column = sm.get_end()
+    first_row = last_row = end_row
+    first_column = last_column = end_column
+    for row in range(sm.get_rows()):
+        links = sm.get_backlink_row(row)
+        stripped = links.lstrip(b"\0")
+        if not stripped:
+            continue
+        band_first = sm.get_band(row)[0]
+        first_row, last_row = min(first_row, row - 1), max(last_row, row)
+        first_column = min(first_column,
+                           band_first + len(links) - len(stripped) - 1)
+        last_column = max(last_column,
+                          band_first + len(links.rstrip(b"\0")) - 1)
+    return ((max(0, first_row - margin),
+             min(sm.get_rows() - 1, last_row + margin)),
+            (max(0, first_column - margin),
+             min(sm.get_columns() - 1, last_column + margin)))
+
+def format_matrix(sm, rows=None, columns=None):
+    '''Returns the given ScoringMatrix as text, as print_matrix prints it.'''
+    first_row, last_row = rows or (0, sm.get_rows() - 1)
+    first_column, last_column = columns or (0, sm.get_columns() - 1)
+    width = last_column - first_column + 1
+    top_sequence = str(sm.get_top_sequence())
+    left_sequence = str(sm.get_left_sequence())
+    border = bottom_border(width)
+    if rows is None and columns is None:
+        lines = ["Dynamic programming table:\n"]
+    else:
+        lines = ["Dynamic programming table, rows {0!s}-{1!s} and columns "
+                 "{2!s}-{3!s} of {4!s} x {5!s}:\n".format(
+                     first_row, last_row, first_column, last_column,
+                     sm.get_rows(), sm.get_columns())]
     # Sequence on top
-    print "Dynamic programming table:"
-    output_row = " |    |"
-    top_sequence = sm.get_top_sequence()
-    left_sequence = sm.get_left_sequence()
-    for c in top_sequence:
-        output_row += "   " + c + "|"
-    print output_row
-    print_bottom_border(sm.get_columns())
+    lines.append(" |" + "".join("   " + (top_sequence[c - 1] if c else " ") +
+                                "|" for c in range(first_column,
+                                                   last_column + 1)) + "\n")
+    lines.append(border)
     # All other rows
-    for row in range(0, sm.get_rows()):
+    for row in range(first_row, last_row + 1):
+        band_first, band_last = sm.get_band(row)
+        start = max(first_column, band_first)
+        stop = min(last_column, band_last)
+        before = BLANK_CELL * max(0, min(start, last_column + 1) - first_column)
+        after = BLANK_CELL * max(0, last_column - max(stop, first_column - 1))
+        if start <= stop:
+            links = sm.get_backlink_row(row)[start - band_first:
+                                             stop - band_first + 1]
+            scores = sm.get_score_row(row)[start - band_first:
+                                           stop - band_first + 1]
+        else:
+            links, scores = bytearray(), []
         # Top half of row
-        output_row = " |"
-        for column in range(0, sm.get_columns()):
-            bl = sm.get_backlinks(row, column)
-            output_row += "\\ " if bl["diagonal"] else "  "
-            output_row += "^ " if bl["up"] else "  "
-            output_row += "|"
-        print output_row
+        lines.append(" |" + before + "".join([TOP_HALVES[bits]
+                                              for bits in links]) +
+                     after + "\n")
         # Bottom half of row
-        output_row = left_sequence[row - 1] if row >= 1 else " "
-        output_row += "|"
-        for column in range(0, sm.get_columns()):
-            bl = sm.get_backlinks(row, column)
-            output_row += "<" if bl["left"] else " "
-            output_row += "{0: >3}".format(sm.get_score(row, column))
-            output_row += "|"
-        print output_row
+        label = left_sequence[row - 1] if row >= 1 else " "
+        lines.append(label + "|" + before +
+                     "".join([LEFT_ARROWS[bits] + "%3d|" % score
+                              for bits, score in zip(links, scores)]) +
+                     after + "\n")
         # Bottom border of row
-        print_bottom_border(sm.get_columns())
+        lines.append(border)
+    return "".join(lines)
+
+def print_matrix(sm, rows=None, columns=None):
+    '''Prints the given ScoringMatrix to the terminal.
+
+    rows and columns are optional tuples of the first and last row or column
+    to print, as returned by path_window; by default the whole table is
+    printed. Cells outside the band of a banded matrix are left blank.'''
+    sys.stdout.write(format_matrix(sm, rows, columns))
 
 def print_alignments(alignment_list):
     '''Prints all the alignments in the list.
 
-    The output of scoriing_algorithm.get_alignments should be fed into this.'''
-    i = 1
-    while alignment_list:
-        seq = alignment_list.pop()
-        print "Alignment #", str(i)
-        for s in seq:
-            print s
-        i += 1
+    The output of scoring_algorithm.get_alignments should be fed into this.'''
+    for i, alignment in enumerate(alignment_list, 1):
+        print("Alignment #", str(i))
+        for s in alignment:
+            print(s)